@@ -0,0 +1,53 @@
+"""Per-item cost of /payment_requests/batch compared with /payment_requests.
+
+    python benchmarks/bench_batch.py --items 20000 --batch-sizes 100 1000 10000
+"""
+import argparse
+import asyncio
+import time
+
+from common import asgi_client
+
+import main
+
+
+def make_item(i):
+    return {"name": f"bench {i}", "account_number": "BE19 2543 7531 1863", "amount": 50, "currency": "USD"}
+
+
+async def single(client, total):
+    start = time.perf_counter()
+    for i in range(total):
+        await client.post("/payment_requests", json=make_item(i))
+    return time.perf_counter() - start
+
+
+async def batched(client, total, batch_size):
+    start = time.perf_counter()
+    for offset in range(0, total, batch_size):
+        items = [make_item(i) for i in range(offset, min(offset + batch_size, total))]
+        response = await client.post("/payment_requests/batch", json=items)
+        assert response.json()["accepted"] == len(items)
+    return time.perf_counter() - start
+
+
+async def run(args):
+    async with asgi_client(main.app) as client:
+        # het single endpoint is veel trager, dus beperken we het aantal items
+        single_items = min(args.items, 2000)
+        elapsed = await single(client, single_items)
+        print(f"single:           {elapsed / single_items * 1e6:9.1f} us/item")
+        for batch_size in args.batch_sizes:
+            elapsed = await batched(client, args.items, batch_size)
+            print(f"batch size {batch_size:>6}: {elapsed / args.items * 1e6:9.1f} us/item")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,47 @@
+"""Micro-benchmark of currency conversion: the old per-payment Decimal path against money.py.
+
+    python benchmarks/bench_conversion.py --number 200000
+"""
+import argparse
+import random
+import timeit
+from decimal import Decimal, ROUND_HALF_UP
+
+import common  # noqa: F401  (puts the repository on sys.path)
+from money import CrossRates
+
+# REAL columns as sqlite3 returns them
+FLOAT_RATES = {"USD": 1.0, "EUR": 0.85, "JPY": 110.0, "GBP": 0.79}
+
+
+def legacy_convert(request_amount, request_currency, payment_currency):
+    # what main.py did per attempt: wrap floats in Decimal, divide through USD, quantize
+    amount_in_usd = Decimal(request_amount) / Decimal(str(FLOAT_RATES[request_currency]))
+    amount = amount_in_usd * Decimal(str(FLOAT_RATES[payment_currency]))
+    return amount.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=200000)
+    args = parser.parse_args()
+
+    rates = CrossRates({currency: Decimal(str(rate)) for currency, rate in FLOAT_RATES.items()})
+    rng = random.Random(42)
+    currencies = list(FLOAT_RATES)
+    rows = [(rng.randint(1, 10 ** 7), rng.choice(currencies), rng.choice(currencies)) for _ in range(args.number)]
+
+    cases = {
+        "legacy Decimal per payment": lambda: [legacy_convert(units / 100, source, target) for units, source, target in rows],
+        "CrossRates.convert": lambda: [rates.convert(units, source, target) for units, source, target in rows],
+        "CrossRates.convert_batch": lambda: rates.convert_batch(rows),
+    }
+    for name, func in cases.items():
+        elapsed = timeit.timeit(func, number=1)
+        print(f"{name:<30} {elapsed / args.number * 1e9:8.1f} ns/conversion")
+    build = timeit.timeit(lambda: CrossRates({currency: Decimal(str(rate)) for currency, rate in FLOAT_RATES.items()}), number=1000)
+    print(f"{'rebuild cross-rate table':<30} {build / 1000 * 1e6:8.1f} us")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,50 @@
+"""Group commit benchmark: payment requests + attempts per second by batch window.
+
+Runs the same concurrent load as bench_load.py, first with a commit per
+write and then through GroupCommitWriter with different batch windows.
+
+    python benchmarks/bench_group_commit.py --requests 2000 --concurrency 64 --windows 0 1 2 5 10
+"""
+import argparse
+import asyncio
+import os
+
+from common import asgi_client
+from bench_load import drive
+
+import main
+from group_commit import GroupCommitWriter
+from storage.sqlite import SQLiteStorage
+
+
+async def run(window_ms, total, concurrency, max_items):
+    storage = SQLiteStorage(os.environ["PAYMENTS_DB_PATH"])
+    main.storage = storage
+    main.group_commit = None if window_ms is None else GroupCommitWriter(storage, window_ms / 1000, max_items)
+    async with asgi_client(main.app) as client:
+        elapsed = await drive(client, total, concurrency)
+    stats = main.group_commit.stats() if main.group_commit else None
+    if main.group_commit:
+        await main.group_commit.stop()
+    storage.close()
+    return 2 * total / elapsed, stats
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--windows", type=float, nargs="+", default=[0, 1, 2, 5, 10], help="batch windows in ms")
+    parser.add_argument("--max-items", type=int, default=64)
+    args = parser.parse_args()
+
+    baseline, _ = asyncio.run(run(None, args.requests, args.concurrency, args.max_items))
+    print(f"commit per write:    {baseline:8.1f} req/s")
+    for window in args.windows:
+        throughput, stats = asyncio.run(run(window, args.requests, args.concurrency, args.max_items))
+        print(f"window {window:5.1f} ms:     {throughput:8.1f} req/s  ({throughput / baseline:.2f}x, "
+              f"{stats['average_group_size']:.1f} writes/commit)")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,34 @@
+"""Micro-benchmark of IBAN validation: the old lookahead regex against iban.py.
+
+    python benchmarks/bench_iban.py --number 200000
+"""
+import argparse
+import re
+import timeit
+
+import common  # noqa: F401  (puts the repository on sys.path)
+from iban import _normalize, normalize_iban
+
+# the pattern main.py used to pass to re.match as a string
+LEGACY_IBAN_REGEX = r"^([A-Z]{2}[ \-]?[0-9]{2})(?=(?:[ \-]?[A-Z0-9]){9,30}$)((?:[ \-]?[A-Z0-9]{3,5}){2,7})([ \-]?[A-Z0-9]{1,3})?$"
+
+SAMPLES = ["BE71 0961 2345 6769", "GB82 WEST 1234 5698 7654 32", "NL91ABNA0417164300", "vdiydytk575"]
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=200000)
+    args = parser.parse_args()
+
+    cases = {
+        "legacy regex (shape only)": lambda: [re.match(LEGACY_IBAN_REGEX, s) for s in SAMPLES],
+        "iban.py uncached (checksum)": lambda: [_normalize(s) for s in SAMPLES],
+        "iban.py memoized (checksum)": lambda: [normalize_iban(s) for s in SAMPLES],
+    }
+    for name, func in cases.items():
+        elapsed = timeit.timeit(func, number=args.number)
+        print(f"{name:<30} {elapsed / (args.number * len(SAMPLES)) * 1e9:8.1f} ns/check")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,79 @@
+"""Cost of creating a payment request as the tables grow.
+
+Compares the old write path (INSERT followed by an unindexed
+`SELECT request_id ... WHERE requester_account_number = ? AND request_time = ?`)
+with the current one, which takes the id from `cursor.lastrowid`.
+
+    python benchmarks/bench_insert_scaling.py --sizes 10000 1000000 10000000
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from common import ROOT
+
+import main
+from database import connect
+from storage.sqlite import SQLiteTransaction, migrate
+
+
+def seed(conn, rows):
+    migrate(conn)
+    conn.execute('''
+    WITH RECURSIVE seq(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM seq WHERE x < ?)
+    INSERT INTO payment_requests (requester_account_number, request_amount, currency, request_time, status)
+    SELECT 'BE84 2543 7531 ' || (x % 10000), 50, 'USD', 1756456400 + x, 'executed' FROM seq
+    ''', (rows,))
+    conn.commit()
+
+
+def legacy_store(conn, form):
+    cursor = conn.cursor()
+    request_time = datetime.now(timezone.utc).timestamp()
+    cursor.execute('''
+    INSERT INTO payment_requests (requester_account_number, request_amount, currency, request_time, status)
+    VALUES (?, ?, ?, ?, ?)
+    ''', (form.account_number, float(form.amount), form.currency, request_time, 'pending'))
+    try:
+        cursor.execute('INSERT INTO persons (name, account_number) VALUES (?, ?)', (form.name, form.account_number))
+    except Exception:
+        cursor.execute('UPDATE persons SET name = ? WHERE account_number = ?', (form.name, form.account_number))
+    cursor.execute('SELECT request_id FROM payment_requests WHERE requester_account_number = ? AND request_time = ?', (form.account_number, request_time))
+    cursor.fetchone()
+    conn.commit()
+
+
+def current_store(conn, form):
+    main.store_payment_request(SQLiteTransaction(conn), form)
+    conn.commit()
+
+
+def measure(conn, store, inserts):
+    form = main.PaymentForm(name="bench", account_number="BE19 2543 7531 1863", amount=Decimal(50), currency="USD")
+    start = time.perf_counter()
+    for _ in range(inserts):
+        store(conn, form)
+    return (time.perf_counter() - start) / inserts * 1e6
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000])
+    parser.add_argument("--inserts", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'existing rows':>14} {'lookup us/insert':>17} {'lastrowid us/insert':>20}")
+    for size in args.sizes:
+        conn = connect(os.path.join(tempfile.mkdtemp(), "scaling.db"))
+        seed(conn, size)
+        legacy = measure(conn, legacy_store, args.inserts)
+        current = measure(conn, current_store, args.inserts)
+        conn.close()
+        print(f"{size:>14} {legacy:>17.1f} {current:>20.1f}")
+
+
+if __name__ == "__main__":
+    main_cli()
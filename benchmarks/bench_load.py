@@ -0,0 +1,81 @@
+"""Load benchmark: requests/sec for /payment_requests and /payment_attempts.
+
+Compares the pooled, threadpool-backed database layer with the previous
+behaviour (a fresh sqlite3.connect per request, run on the event loop).
+
+    python benchmarks/bench_load.py --requests 2000 --concurrency 32
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import time
+
+from common import asgi_client
+
+import main
+from storage.sqlite import SQLiteStorage, SQLiteTransaction
+
+
+class PerRequestStorage(SQLiteStorage):
+    """The old access pattern: connect inside the handler, block the event loop."""
+
+    async def run(self, func, *args):
+        conn = sqlite3.connect(self.path)
+        try:
+            result = func(SQLiteTransaction(conn), *args)
+            conn.commit()
+            return result
+        finally:
+            conn.close()
+
+
+async def drive(client, total, concurrency):
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            response = await client.post("/payment_requests", json={
+                "name": f"bench {i}",
+                "account_number": "BE19 2543 7531 1863",
+                "amount": 50,
+                "currency": "USD",
+            })
+            request_id = response.json()["received"]["request_id"]
+            await client.post("/payment_attempts", json={
+                "payment_request_id": request_id,
+                "payed_amount": 50,
+                "payer_account_number": "BE69 2345 6789 0011",
+                "payment_currency": "USD",
+            })
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start
+
+
+async def run(storage, total, concurrency):
+    main.storage = storage
+    async with asgi_client(main.app) as client:
+        elapsed = await drive(client, total, concurrency)
+    storage.close()
+    # elke iteratie doet twee HTTP-requests
+    return 2 * total / elapsed
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--pool-size", type=int, default=8)
+    args = parser.parse_args()
+
+    path = os.environ["PAYMENTS_DB_PATH"]
+    before = asyncio.run(run(PerRequestStorage(path), args.requests, args.concurrency))
+    after = asyncio.run(run(SQLiteStorage(path, args.pool_size), args.requests, args.concurrency))
+    print(f"per-request connect: {before:8.1f} req/s")
+    print(f"pooled:              {after:8.1f} req/s  ({after / before:.2f}x)")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,54 @@
+"""Parse + serialize overhead per request, old path against parsing.py.
+
+Old: json.loads -> Model(**dict) -> JSONResponse. New: model_validate_json on the
+raw body -> FastJSONResponse (orjson when installed).
+
+    python benchmarks/bench_parsing.py --number 50000
+"""
+import argparse
+import json
+import timeit
+
+import common  # noqa: F401  (puts the repository on sys.path)
+from fastapi.responses import JSONResponse
+
+from main import PaymentAttemptForm
+from parsing import FastJSONResponse, orjson
+
+BODY = json.dumps({
+    "payment_request_id": 12345,
+    "name": "Marcel",
+    "payed_amount": 50,
+    "payer_account_number": "BE69 2345 6789 0011",
+    "payment_currency": "USD",
+}).encode()
+
+RESPONSE = {"status": "Payment attempt succeeded", "received": {
+    "payment_id": 991, "payer_name": "Marcel", "payed_amount": 50.0, "payer_account_number": "BE69 2345 6789 0011",
+    "payment_currency": "USD", "payment_time": 1760000000.123456, "payment_request_id": 12345,
+    "requester_name": "Thorsten", "requester_account_number": "BE19 2543 7531 1863", "request_amount": 50.0,
+    "request_currency": "USD", "request_time": 1759999990.654321, "status": "executed"}}
+
+
+def old_path():
+    data = PaymentAttemptForm(**json.loads(BODY))
+    return JSONResponse(content=RESPONSE, status_code=200).body, data
+
+
+def new_path():
+    data = PaymentAttemptForm.model_validate_json(BODY)
+    return FastJSONResponse(content=RESPONSE, status_code=200).body, data
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=50000)
+    args = parser.parse_args()
+    print(f"orjson installed: {orjson is not None}")
+    for name, func in (("json.loads + JSONResponse", old_path), ("model_validate_json + FastJSONResponse", new_path)):
+        elapsed = timeit.timeit(func, number=args.number)
+        print(f"{name:<40} {elapsed / args.number * 1e6:7.2f} us/request")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,79 @@
+"""Concurrency stress test for settlement: many parallel attempts on a few hot requests.
+
+Fires `--attempts` payment attempts, spread over `--hot` payment requests,
+with `--concurrency` in flight at once. Reports attempts/sec and checks that
+every hot request was settled exactly once and that every loser got a clean
+409 "Payment request already settled".
+
+    python benchmarks/bench_settlement.py --attempts 5000 --hot 10 --concurrency 64
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+
+from common import asgi_client
+
+import main
+
+
+async def stress(client, request_ids, attempts, concurrency, seed):
+    rng = random.Random(seed)
+    targets = iter([rng.choice(request_ids) for _ in range(attempts)])
+    statuses = Counter()
+    settled = Counter()
+
+    async def worker():
+        for request_id in targets:
+            response = await client.post("/payment_attempts", json={
+                "payment_request_id": request_id,
+                "payed_amount": 50,
+                "payer_account_number": "BE69 2345 6789 0011",
+                "payment_currency": "USD",
+            })
+            statuses[response.status_code, response.json()["status"]] += 1
+            if response.status_code == 200:
+                settled[request_id] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start, statuses, settled
+
+
+async def run(args):
+    async with asgi_client(main.app) as client:
+        request_ids = []
+        for _ in range(args.hot):
+            response = await client.post("/payment_requests", json={
+                "account_number": "BE19 2543 7531 1863", "amount": 50, "currency": "USD"})
+            request_ids.append(response.json()["received"]["request_id"])
+        elapsed, statuses, settled = await stress(client, request_ids, args.attempts, args.concurrency, args.seed)
+        stored = Counter()
+        async for line in (await client.get("/payments/export", params={"account_number": "BE69 2345 6789 0011"})).aiter_lines():
+            if line:
+                stored[main.loads(line)["payment_request_id"]] += 1
+    return elapsed, statuses, settled, {request_id: stored[request_id] for request_id in request_ids}
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--attempts", type=int, default=5000)
+    parser.add_argument("--hot", type=int, default=10, help="number of payment requests all attempts target")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    elapsed, statuses, settled, stored = asyncio.run(run(args))
+    print(f"{args.attempts / elapsed:8.1f} attempts/s ({args.attempts} attempts on {args.hot} requests)")
+    for (code, status), count in sorted(statuses.items()):
+        print(f"  {code} {status:<35} {count}")
+    correct = all(settled[request_id] == 1 for request_id in stored) and all(count == 1 for count in stored.values())
+    correct = correct and {code for code, _ in statuses} <= {200, 409}
+    print("correct: every request settled exactly once, every loser got 409" if correct else f"INCORRECT: responses {dict(settled)}, stored {stored}")
+    if not correct:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,84 @@
+"""Throughput of serve.py with 1..N shared-nothing workers over sharded SQLite.
+
+For every worker count, starts `serve.py --workers N` on a fresh set of
+shard files and drives the mixed request/attempt traffic of loadtest.py from
+`--clients` load generator processes at once (one Python client process
+cannot saturate several workers). Reports total req/s and the speed-up over
+one worker; on a box with at least N free cores it should grow roughly
+linearly.
+
+    python benchmarks/bench_sharding.py --workers 1 2 4 8 --operations 4000 --clients 4
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from common import ROOT
+from loadtest import Traffic, drive, free_port
+
+
+def client_process(port, seed, operations, concurrency, attempt_ratio, accounts):
+    async def run():
+        limits = httpx.Limits(max_connections=concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30) as client:
+            return await drive(client, Traffic(seed, operations, attempt_ratio, accounts), concurrency)
+    return asyncio.run(run())["total"]
+
+
+def wait_until_up(port):
+    for _ in range(200):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/admin/expiry")
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError("serve.py did not start")
+
+
+def measure(workers, args):
+    port = free_port()
+    env = dict(os.environ, PAYMENTS_DB_PATH=os.path.join(tempfile.mkdtemp(), "sharded.db"))
+    server = subprocess.Popen([sys.executable, "serve.py", "--workers", str(workers), "--port", str(port)], cwd=ROOT, env=env)
+    try:
+        wait_until_up(port)
+        accounts = ["BE19 2543 7531 1863", "BE69 2345 6789 0011"]
+        jobs = [(port, args.seed + client, args.operations // args.clients, args.concurrency, args.attempt_ratio, accounts)
+                for client in range(args.clients)]
+        start = time.perf_counter()
+        with multiprocessing.get_context("spawn").Pool(args.clients) as pool:
+            results = pool.starmap(client_process, jobs)
+        elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+    errors = sum(result["errors"] for result in results)
+    return sum(result["count"] for result in results) / elapsed, max(result["p95_ms"] for result in results), errors
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--operations", type=int, default=4000, help="operations per worker count, over all clients")
+    parser.add_argument("--clients", type=int, default=4, help="load generator processes")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight per client")
+    parser.add_argument("--attempt-ratio", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} cores")
+    baseline = None
+    for workers in args.workers:
+        throughput, p95, errors = measure(workers, args)
+        baseline = baseline or throughput
+        print(f"{workers:>3} workers {throughput:9.1f} req/s  ({throughput / baseline:.2f}x)  worst p95 {p95:7.2f} ms  errors {errors}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,85 @@
+"""Startup time of N workers starting at once: re-running the schema script vs versioned migrations.
+
+Each worker is a separate Python process that imports main and then prepares
+the schema, like a uvicorn worker starting; the timings leave out the import.
+"script" is the old behaviour (execute the whole schema + seed script on every
+start, taking the write lock for the seed inserts), "migrations" is
+storage.setup() as the lifespan calls it: one SELECT once the schema is up to
+date. Both run against a database that was migrated before the timing, so
+they compare the same every-day restart. "first start" is reported on its
+own: storage.setup() on an empty database, where one worker applies all
+migrations and the others wait for it.
+
+    python benchmarks/bench_startup.py --workers 1 4 16
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import ROOT
+from storage.sqlite import SQLiteStorage
+
+SETUP = """
+import time
+import main
+start = time.perf_counter()
+main.storage.setup()
+print(time.perf_counter() - start)
+"""
+
+WORKER = {
+    "script": """
+import time
+import main
+from storage.sqlite import MIGRATIONS
+start = time.perf_counter()
+main.storage.db.run_sync(lambda conn: conn.executescript(MIGRATIONS[0].script))
+print(time.perf_counter() - start)
+""",
+    "migrations": SETUP,
+}
+
+
+def database(migrated):
+    """A scratch database file, with all migrations applied up front when `migrated`."""
+    path = os.path.join(tempfile.mkdtemp(), "startup.db")
+    if migrated:
+        storage = SQLiteStorage(path)
+        storage.setup()
+        storage.close()
+    return path
+
+
+def start_workers(code, count, path):
+    env = dict(os.environ, PAYMENTS_DB_PATH=path)
+    start = time.perf_counter()
+    processes = [subprocess.Popen([sys.executable, "-c", code], cwd=ROOT, env=env, stdout=subprocess.PIPE, text=True)
+                 for _ in range(count)]
+    timings = []
+    for process in processes:
+        output, _ = process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError("worker failed")
+        timings.append(float(output.strip().splitlines()[-1]))
+    return time.perf_counter() - start, timings
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    args = parser.parse_args()
+
+    for count in args.workers:
+        cases = [(mode, code, database(migrated=True)) for mode, code in WORKER.items()]
+        cases.append(("first start", SETUP, database(migrated=False)))
+        for mode, code, path in cases:
+            wall, timings = start_workers(code, count, path)
+            print(f"{count:>3} workers {mode:<11} startup slowest {max(timings) * 1000:8.2f} ms, "
+                  f"mean {sum(timings) / len(timings) * 1000:8.2f} ms (wall clock incl. imports {wall:.1f} s)")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,44 @@
+"""Shared setup for the benchmark scripts: point the app at a scratch database."""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ.setdefault("PAYMENTS_DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+import httpx
+
+from storage import create_storage
+
+# the app only migrates in its lifespan, which the in-process ASGI client does not run
+_storage = create_storage()
+_storage.setup()
+_storage.close()
+
+
+def asgi_client(app):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list, `q` in 0..100."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * q // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(latencies, elapsed):
+    """Throughput and latency percentiles (in ms) for a list of latencies in seconds."""
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "throughput": len(values) / elapsed if elapsed else 0.0,
+        "mean_ms": sum(values) / len(values) * 1000 if values else 0.0,
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "max_ms": (values[-1] if values else 0.0) * 1000,
+    }
@@ -0,0 +1,85 @@
+"""Seeded dataset generator: fill persons, payment_requests and payments.
+
+The same seed always produces the same rows, so two runs (or two commits)
+benchmark against identical data. Rows go in through the storage layer in
+chunks of `--chunk-size`, one transaction per chunk, into the database
+PAYMENTS_DB_PATH / PAYMENTS_DATABASE_URL point at (a scratch file by default).
+
+    PAYMENTS_DB_PATH=big.db python benchmarks/datagen.py --requests 1000000 --paid 0.6 --persons 50000 --seed 1
+"""
+import argparse
+import random
+import time
+
+import common  # noqa: F401  (puts the repository on sys.path)
+from iban import build_iban, normalize_iban
+from storage import create_storage
+
+CURRENCIES = ("USD", "EUR", "JPY")
+FIRST_NAMES = ("Thorsten", "Lotte", "Marcel", "Mattias", "Maarten", "Dirk", "Jan", "Sofie", "Emma", "Noah")
+
+
+def make_accounts(rng, count):
+    # Belgian IBANs: 12 digit BBAN, check digits computed so they pass validation
+    return [normalize_iban(build_iban("BE", f"{rng.randrange(10 ** 12):012d}")) for _ in range(count)]
+
+
+def insert_persons(tx, rows):
+    tx.upsert_persons(rows)
+
+
+def insert_chunk(tx, rows, request_time, paid, payers):
+    request_ids = tx.create_requests(rows, request_time)
+    for request_id, (_, amount, currency), payer in zip(request_ids, rows[:paid], payers):
+        tx.claim_request(request_id, "executed")
+        tx.insert_payment(amount, request_time + 1.0, request_id, payer, currency)
+
+
+def generate(storage, requests, paid=0.6, persons=10000, seed=1, chunk_size=10000, start_time=None):
+    """Insert `persons` persons and `requests` payment requests, of which a `paid` fraction has a payment.
+
+    Request times run up to `start_time` (default: an hour ago); unpaid
+    requests stay pending so the expiry sweeper has work. Returns the
+    account numbers, so a load driver can reuse them.
+    """
+    rng = random.Random(seed)
+    accounts = make_accounts(rng, persons)
+    for offset in range(0, persons, chunk_size):
+        storage.run_sync(insert_persons, [(f"{rng.choice(FIRST_NAMES)} {i}", accounts[i])
+                                          for i in range(offset, min(offset + chunk_size, persons))])
+    start_time = time.time() - 3600 if start_time is None else start_time
+    chunks = (requests + chunk_size - 1) // chunk_size
+    for chunk in range(chunks):
+        count = min(chunk_size, requests - chunk * chunk_size)
+        rows = []
+        for _ in range(count):
+            currency = rng.choice(CURRENCIES)
+            amount = rng.randint(1, 5000) if currency == "JPY" else rng.randint(100, 500000)
+            rows.append((rng.choice(accounts), amount, currency))
+        payers = [rng.choice(accounts) for _ in range(count)]
+        # every chunk is one second apart, the last one ends at start_time
+        storage.run_sync(insert_chunk, rows, start_time - (chunks - chunk), round(count * paid), payers)
+    return accounts
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--paid", type=float, default=0.6, help="fraction of requests that get a payment")
+    parser.add_argument("--persons", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    storage = create_storage()
+    storage.setup()
+    start = time.perf_counter()
+    generate(storage, args.requests, args.paid, args.persons, args.seed, args.chunk_size)
+    elapsed = time.perf_counter() - start
+    storage.close()
+    print(f"{args.requests} requests, {round(args.requests * args.paid)} payments, {args.persons} persons "
+          f"in {elapsed:.1f}s ({args.requests / elapsed:.0f} requests/s)")
+
+
+if __name__ == "__main__":
+    main_cli()
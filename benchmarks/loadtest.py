@@ -0,0 +1,204 @@
+"""Reproducible mixed-traffic load test for /payment_requests and /payment_attempts.
+
+Every operation either creates a payment request or pays one created earlier
+in the run, chosen by a seeded RNG (`--attempt-ratio`), so the same seed
+replays the same traffic. Optionally seeds the database first with
+datagen.py. Two drivers:
+
+- inprocess: httpx against the ASGI app, no network, no lifespan
+- uvicorn:   starts `uvicorn main:app` in a subprocess and talks HTTP to it
+
+Prints throughput and p50/p95/p99 per endpoint. `--json` writes the results
+for comparing commits; `--compare` checks them against an earlier file and
+exits with status 1 when throughput dropped or p95 rose by more than
+`--tolerance`.
+
+    python benchmarks/loadtest.py --operations 5000 --concurrency 32 --json results.json
+    python benchmarks/loadtest.py --driver uvicorn --seed-requests 1000000 --compare results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+from common import ROOT, asgi_client, summarize
+
+import datagen
+from storage import create_storage
+
+ENDPOINTS = ("payment_requests", "payment_attempts")
+
+
+class Traffic:
+    """Seeded stream of operations; attempts pay requests that this run created."""
+
+    def __init__(self, seed, operations, attempt_ratio, accounts):
+        self.rng = random.Random(seed)
+        self.remaining = operations
+        self.attempt_ratio = attempt_ratio
+        self.accounts = accounts
+        self.unpaid = []
+
+    def next(self):
+        if self.remaining <= 0:
+            return None
+        self.remaining -= 1
+        if self.unpaid and self.rng.random() < self.attempt_ratio:
+            request_id, amount = self.unpaid.pop(self.rng.randrange(len(self.unpaid)))
+            return "payment_attempts", {
+                "payment_request_id": request_id,
+                "payed_amount": amount,
+                "payer_account_number": self.rng.choice(self.accounts),
+                "payment_currency": "USD",
+            }
+        return "payment_requests", {
+            "name": "load test",
+            "account_number": self.rng.choice(self.accounts),
+            "amount": self.rng.randint(1, 5000),
+            "currency": "USD",
+        }
+
+
+async def drive(client, traffic, concurrency):
+    latencies = {endpoint: [] for endpoint in ENDPOINTS}
+    errors = {endpoint: 0 for endpoint in ENDPOINTS}
+
+    async def worker():
+        while True:
+            operation = traffic.next()
+            if operation is None:
+                return
+            endpoint, body = operation
+            start = time.perf_counter()
+            response = await client.post(f"/{endpoint}", json=body)
+            latencies[endpoint].append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors[endpoint] += 1
+            elif endpoint == "payment_requests":
+                received = response.json()["received"]
+                traffic.unpaid.append((received["request_id"], received["amount"]))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    results = {endpoint: dict(summarize(latencies[endpoint], elapsed), errors=errors[endpoint]) for endpoint in ENDPOINTS}
+    results["total"] = dict(summarize(latencies["payment_requests"] + latencies["payment_attempts"], elapsed),
+                            errors=sum(errors.values()))
+    return results
+
+
+async def run_inprocess(traffic, concurrency):
+    import main
+    async with asgi_client(main.app) as client:
+        return await drive(client, traffic, concurrency)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_uvicorn(traffic, concurrency, workers):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT, env=os.environ.copy())
+    try:
+        limits = httpx.Limits(max_connections=concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30) as client:
+            for _ in range(100):
+                try:
+                    await client.get("/admin/expiry")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError("uvicorn did not start")
+            return await drive(client, traffic, concurrency)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Regressions of `results` against `baseline`, as printable lines."""
+    regressions = []
+    for endpoint, before in baseline["results"].items():
+        after = results.get(endpoint)
+        if after is None or not before["count"]:
+            continue
+        if after["throughput"] < before["throughput"] * (1 - tolerance):
+            regressions.append(f"{endpoint}: throughput {before['throughput']:.1f} -> {after['throughput']:.1f} req/s")
+        if after["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{endpoint}: p95 {before['p95_ms']:.2f} -> {after['p95_ms']:.2f} ms")
+    return regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--driver", choices=("inprocess", "uvicorn"), default="inprocess")
+    parser.add_argument("--operations", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--attempt-ratio", type=float, default=0.5, help="chance that an operation pays an open request")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--seed-requests", type=int, default=0, help="rows to generate with datagen.py first")
+    parser.add_argument("--persons", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="earlier --json output to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    storage = create_storage()
+    storage.setup()
+    accounts = datagen.generate(storage, args.seed_requests, persons=args.persons, seed=args.seed)
+    storage.close()
+
+    traffic = Traffic(args.seed, args.operations, args.attempt_ratio, accounts)
+    if args.driver == "uvicorn":
+        results = asyncio.run(run_uvicorn(traffic, args.concurrency, args.workers))
+    else:
+        results = asyncio.run(run_inprocess(traffic, args.concurrency))
+
+    for name, result in results.items():
+        print(f"{name:<18} {result['count']:>7} ops {result['throughput']:9.1f} req/s  "
+              f"p50 {result['p50_ms']:7.2f}  p95 {result['p95_ms']:7.2f}  p99 {result['p99_ms']:7.2f} ms  "
+              f"errors {result['errors']}")
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,50 @@
+import asyncio
+import os
+import time
+
+from money import EMPTY, CrossRates
+from storage import StorageError
+
+CURRENCY_CACHE_TTL_SECONDS = float(os.environ.get("PAYMENTS_CURRENCY_TTL", "300"))
+
+
+class CurrencyCache:
+    """Process-local copy of the `currency` table.
+
+    Rates are kept as Decimal (1 USD expressed in the currency). A reload swaps
+    in a new dict in one assignment, so readers never need a lock; `version`
+    is bumped every time the loaded rates differ from the previous ones.
+    `cross_rates` is the CrossRates table for the current rates, rebuilt only
+    when they change.
+    """
+
+    def __init__(self, ttl=CURRENCY_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self.rates = {}
+        self.cross_rates = EMPTY
+        self.version = 0
+        self.loaded_at = None
+
+    @property
+    def loaded(self):
+        return self.loaded_at is not None
+
+    def load(self, tx):
+        rates = tx.get_rates()
+        if rates != self.rates:
+            self.cross_rates = CrossRates(rates)
+            self.rates = rates
+            self.version += 1
+        self.loaded_at = time.monotonic()
+        return self.rates
+
+    def __contains__(self, currency):
+        return currency in self.rates
+
+    async def refresh_periodically(self, storage):
+        while True:
+            await asyncio.sleep(self.ttl)
+            try:
+                await storage.run(self.load)
+            except StorageError:
+                pass  # keep serving the last known rates, retry on the next tick
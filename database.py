@@ -0,0 +1,130 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from starlette.concurrency import run_in_threadpool
+
+# next to the code by default, not in whatever directory the server was started from
+DATABASE_PATH = os.environ.get("PAYMENTS_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "payments.db"))
+POOL_SIZE = int(os.environ.get("PAYMENTS_DB_POOL_SIZE", "8"))
+POOL_TIMEOUT_SECONDS = 10.0
+BUSY_TIMEOUT_MS = 5000
+
+# WAL lets readers run next to the single writer; synchronous stays FULL so a
+# committed payment survives a power loss.
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = FULL",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 134217728",
+)
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """Raised when no connection became available within the pool timeout."""
+
+
+def connect(path=DATABASE_PATH):
+    # IMMEDIATE: a write transaction takes the write lock at BEGIN, so it waits
+    # (busy_timeout) up front instead of failing halfway with SQLITE_BUSY
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level="IMMEDIATE", check_same_thread=False)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections shared between worker threads.
+
+    Connections are opened lazily up to `size`; when all of them are in use
+    `acquire` blocks until one is released or `timeout` expires. `on_connect`
+    is called with every newly opened connection.
+    """
+
+    def __init__(self, path=DATABASE_PATH, size=POOL_SIZE, timeout=POOL_TIMEOUT_SECONDS, on_connect=None):
+        if size < 1:
+            raise ValueError("pool size must be at least 1")
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.on_connect = on_connect
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _get(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    conn = connect(self.path)
+                    if self.on_connect is not None:
+                        self.on_connect(conn)
+                    return conn
+                except Exception:
+                    self._opened -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeout(f"no database connection available after {self.timeout}s")
+
+    def _put(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        self._idle.put_nowait(conn)
+
+    def _discard(self, conn):
+        with self._lock:
+            self._opened -= 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    @contextmanager
+    def acquire(self):
+        conn = self._get()
+        try:
+            yield conn
+        finally:
+            self._put(conn)
+
+    def close(self):
+        """Close all idle connections; the pool reopens connections on demand afterwards."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(conn)
+
+
+class Database:
+    """Runs blocking sqlite3 work on the threadpool with a pooled connection."""
+
+    def __init__(self, path=DATABASE_PATH, pool_size=POOL_SIZE, on_connect=None):
+        self.path = path
+        self.pool = ConnectionPool(path, pool_size, on_connect=on_connect)
+
+    def run_sync(self, func, *args):
+        with self.pool.acquire() as conn:
+            return func(conn, *args)
+
+    async def run(self, func, *args):
+        return await run_in_threadpool(self.run_sync, func, *args)
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,131 @@
+import asyncio
+import os
+import time
+
+import metrics
+from export import row_to_dict
+from parsing import dumps
+from storage import EVENT_COLUMNS, StorageError
+
+EVENT_BATCH_SIZE = int(os.environ.get("PAYMENTS_EVENT_BATCH_SIZE", "500"))
+EVENT_POLL_INTERVAL = float(os.environ.get("PAYMENTS_EVENT_POLL_INTERVAL", "0.5"))
+EVENT_RETENTION_SECONDS = float(os.environ.get("PAYMENTS_EVENT_RETENTION", str(7 * 24 * 3600)))
+EVENT_COMPACT_INTERVAL = float(os.environ.get("PAYMENTS_EVENT_COMPACT_INTERVAL", "3600"))
+SSE_HEARTBEAT_SECONDS = 15.0
+
+
+def event_to_dict(row):
+    return row_to_dict(EVENT_COLUMNS, row)
+
+
+def sse_message(row):
+    """One Server-Sent Event; the `id` is what the client sends back as Last-Event-ID."""
+    return b"id: %d\nevent: %s\ndata: %s\n\n" % (row[0], row[1].encode(), dumps(event_to_dict(row)))
+
+
+class EventFeed:
+    """Change feed over the payment_events outbox (migration 0002).
+
+    Consumers read batches of events after a sequence number (the event_id)
+    from the small events table only, never from the payment tables. With
+    sharded storage every partition has its own sequence, so a consumer keeps
+    one cursor per partition. `wait` and `stream` poll every `poll_interval`
+    seconds; writes of this process call `notify` to wake them right away.
+    Compaction deletes events older than `retention` seconds in batches of
+    `batch_size`, each in its own short transaction like the expiry sweep.
+    """
+
+    def __init__(self, storage, batch_size=EVENT_BATCH_SIZE, poll_interval=EVENT_POLL_INTERVAL, retention=EVENT_RETENTION_SECONDS):
+        self.storage = storage
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.compactions = 0
+        self.events_compacted = 0
+        self._changed = None
+
+    def partition(self, index):
+        partitions = self.storage.partitions()
+        if not 0 <= index < len(partitions):
+            raise ValueError(f"partition must be between 0 and {len(partitions) - 1}")
+        return partitions[index]
+
+    def notify(self):
+        changed, self._changed = self._changed, None
+        if changed is not None:
+            changed.set()
+
+    async def _wait_for_change(self, timeout):
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def read_batch(self, tx, after, limit):
+        return tx.list_events(after, limit)
+
+    async def read(self, partition, after, limit):
+        return await self.partition(partition).run(self.read_batch, after, limit)
+
+    async def wait(self, partition, after, limit, timeout):
+        """Long poll: the next batch after `after`, waiting up to `timeout` seconds for one."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            rows = await self.read(partition, after, limit)
+            remaining = deadline - loop.time()
+            if rows or remaining <= 0:
+                return rows
+            await self._wait_for_change(min(self.poll_interval, remaining))
+
+    async def stream(self, partition, after):
+        """Endless Server-Sent Events stream from `after`, one chunk per batch of events."""
+        loop = asyncio.get_running_loop()
+        last_sent = loop.time()
+        while True:
+            rows = await self.read(partition, after, self.batch_size)
+            if rows:
+                after = rows[-1][0]
+                last_sent = loop.time()
+                yield b"".join(sse_message(row) for row in rows)
+                if len(rows) == self.batch_size:
+                    continue
+            elif loop.time() - last_sent >= SSE_HEARTBEAT_SECONDS:
+                # a comment line keeps proxies from closing an idle connection
+                last_sent = loop.time()
+                yield b": keepalive\n\n"
+            await self._wait_for_change(self.poll_interval)
+
+    def compact_batch(self, tx, cutoff):
+        return tx.compact_events(cutoff, self.batch_size)
+
+    async def compact(self):
+        cutoff = time.time() - self.retention
+        compacted = 0
+        for partition in self.storage.partitions():
+            while True:
+                count = await partition.run(self.compact_batch, cutoff)
+                compacted += count
+                if count < self.batch_size:
+                    break
+        self.compactions += 1
+        self.events_compacted += compacted
+        metrics.EVENTS_COMPACTED.inc(amount=compacted)
+        return compacted
+
+    async def compact_periodically(self, interval=EVENT_COMPACT_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.compact()
+            except StorageError:
+                pass  # the database is busy or locked, try again on the next tick
+
+    def stats(self):
+        return {
+            "partitions": len(self.storage.partitions()),
+            "compactions": self.compactions,
+            "events_compacted": self.events_compacted,
+        }
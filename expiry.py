@@ -0,0 +1,69 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timezone, timedelta
+
+import metrics
+from storage import StorageError
+
+SWEEP_INTERVAL_SECONDS = float(os.environ.get("PAYMENTS_SWEEP_INTERVAL", "5"))
+SWEEP_BATCH_SIZE = int(os.environ.get("PAYMENTS_SWEEP_BATCH_SIZE", "500"))
+
+
+class ExpirySweeper:
+    """Marks overdue pending payment requests as expired in the background.
+
+    Every sweep expires rows in batches of at most `batch_size`, each in its own
+    short transaction, so the writer lock is never held for long. Uses the
+    (status, request_time) index from the initial migration. With sharded
+    storage every worker sweeps every shard, so requests on the shard of a
+    worker that is not running still expire; the conditional UPDATE makes
+    overlapping sweeps harmless.
+    """
+
+    def __init__(self, storage, expiry_minutes, interval=SWEEP_INTERVAL_SECONDS, batch_size=SWEEP_BATCH_SIZE):
+        self.storage = storage
+        self.expiry = timedelta(minutes=expiry_minutes)
+        self.interval = interval
+        self.batch_size = batch_size
+        self.sweeps = 0
+        self.rows_expired = 0
+        self.last_sweep_seconds = 0.0
+        self.total_sweep_seconds = 0.0
+
+    def expire_batch(self, tx, cutoff):
+        return tx.expire_pending(cutoff, self.batch_size)
+
+    async def sweep(self):
+        start = time.perf_counter()
+        cutoff = (datetime.now(timezone.utc) - self.expiry).timestamp()
+        expired = 0
+        for partition in self.storage.partitions():
+            while True:
+                count = await partition.run(self.expire_batch, cutoff)
+                expired += count
+                if count < self.batch_size:
+                    break
+        self.last_sweep_seconds = time.perf_counter() - start
+        self.total_sweep_seconds += self.last_sweep_seconds
+        self.sweeps += 1
+        self.rows_expired += expired
+        metrics.EXPIRY_SWEEP_SECONDS.observe(self.last_sweep_seconds)
+        metrics.EXPIRED_REQUESTS.inc(amount=expired)
+        return expired
+
+    async def run(self):
+        while True:
+            try:
+                await self.sweep()
+            except StorageError:
+                pass  # the database is busy or locked, try again on the next tick
+            await asyncio.sleep(self.interval)
+
+    def stats(self):
+        return {
+            "sweeps": self.sweeps,
+            "rows_expired": self.rows_expired,
+            "last_sweep_seconds": self.last_sweep_seconds,
+            "total_sweep_seconds": self.total_sweep_seconds,
+        }
@@ -0,0 +1,68 @@
+import asyncio
+import csv
+import heapq
+import io
+import os
+from itertools import islice
+from money import to_major
+from parsing import dumps
+
+EXPORT_PAGE_SIZE = int(os.environ.get("PAYMENTS_EXPORT_PAGE_SIZE", "1000"))
+
+
+def row_to_dict(columns, row):
+    """Row as a dict, with the stored minor units turned back into an amount in its currency."""
+    item = dict(zip(columns, row))
+    item["amount"] = to_major(item["amount"], item["currency"])
+    return item
+
+
+def _page(tx, method, after, limit, filters):
+    return getattr(tx, method)(after, limit, **filters)
+
+
+async def fetch_page(storage, method, after, limit, filters):
+    partitions = storage.partitions()
+    if len(partitions) == 1:
+        return await storage.run(_page, method, after, limit, filters)
+    # sharded: the next `limit` ids overall are among the next `limit` of every shard
+    pages = await asyncio.gather(*(partition.run(_page, method, after, limit, filters) for partition in partitions))
+    return list(islice(heapq.merge(*pages, key=lambda row: row[0]), limit))
+
+
+async def iter_pages(storage, method, filters, page_size=EXPORT_PAGE_SIZE, after=0, limit=None):
+    """Walk a listing with keyset pagination, one page per short transaction.
+
+    Starts after id `after` and stops after `limit` rows (None: all of them).
+    Only one page is held in memory at a time and no connection stays checked
+    out between pages, so an export of any size uses the same memory.
+    """
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        rows = await fetch_page(storage, method, after, size, filters)
+        if not rows:
+            return
+        yield rows
+        if len(rows) < size:
+            return
+        after = rows[-1][0]
+        if remaining is not None:
+            remaining -= len(rows)
+
+
+async def ndjson_stream(pages, columns):
+    async for rows in pages:
+        yield b"".join(dumps(row_to_dict(columns, row)) + b"\n" for row in rows)
+
+
+async def csv_stream(pages, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    async for rows in pages:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(row_to_dict(columns, row).values() for row in rows)
+        yield buffer.getvalue()
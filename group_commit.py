@@ -0,0 +1,125 @@
+import asyncio
+import contextvars
+import os
+
+import metrics
+
+GROUP_COMMIT = os.environ.get("PAYMENTS_GROUP_COMMIT", "0") == "1"
+GROUP_COMMIT_WINDOW_MS = float(os.environ.get("PAYMENTS_GROUP_COMMIT_WINDOW_MS", "2"))
+GROUP_COMMIT_MAX_ITEMS = int(os.environ.get("PAYMENTS_GROUP_COMMIT_MAX_ITEMS", "64"))
+
+
+def run_in_context(tx, context, func, *args):
+    return context.run(func, tx, *args)
+
+
+class GroupCommitWriter:
+    """Single writer task that shares one commit (one fsync) between concurrent writes.
+
+    `submit(func, *args)` queues `func(tx, *args)` and waits until the
+    transaction it ran in has been committed, so a caller never sees a result
+    that is not durable yet. The writer collects writes for at most `window`
+    seconds or `max_items` writes, runs each in its own savepoint (see
+    Storage.run_group_sync) and commits once. While a group is being written,
+    new writes pile up in the queue for the next one.
+    """
+
+    def __init__(self, storage, window=GROUP_COMMIT_WINDOW_MS / 1000, max_items=GROUP_COMMIT_MAX_ITEMS):
+        if max_items < 1:
+            raise ValueError("max_items must be at least 1")
+        self.storage = storage
+        self.window = window
+        self.max_items = max_items
+        self.groups = 0
+        self.writes = 0
+        self._queue = None
+        self._task = None
+        self._collecting = []
+        self._flushing = None
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            # a fresh context: the task would otherwise inherit the contextvars of the request
+            # that happened to start it (e.g. its query counter in metrics.py) for its whole life
+            self._task = contextvars.Context().run(loop.create_task, self.run())
+
+    async def submit(self, func, *args):
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        # the write runs in the writer's thread, but under the caller's context (its query counter)
+        self._queue.put_nowait((func, args, future, contextvars.copy_context()))
+        return await future
+
+    async def collect(self):
+        # kept on the instance so stop() can still write a group that was being collected
+        self._collecting = batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_items:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def flush(self, batch):
+        try:
+            outcomes = await self.storage.run_group([(run_in_context, (context, func) + args) for func, args, _, context in batch])
+        except Exception as e:
+            # the commit failed: none of the writes in this group are durable
+            outcomes = [(None, e)] * len(batch)
+        self.groups += 1
+        self.writes += len(batch)
+        metrics.GROUP_COMMIT_SIZE.observe(len(batch))
+        for (_, _, future, _), (result, error) in zip(batch, outcomes):
+            if future.done():
+                continue  # the caller went away, the write itself is committed anyway
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    async def run(self):
+        while True:
+            batch = await self.collect()
+            self._collecting = []
+            # shielded: cancelling the writer must not drop a group that is being committed;
+            # stop() waits for it through _flushing
+            self._flushing = asyncio.ensure_future(self.flush(batch))
+            await asyncio.shield(self._flushing)
+            self._flushing = None
+
+    async def stop(self):
+        """Stop the writer task and write out whatever is still queued."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        if self._flushing is not None:
+            await self._flushing
+            self._flushing = None
+        batch, self._collecting = self._collecting, []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        if batch:
+            await self.flush(batch)
+        self._task = None
+
+    def queue_depth(self):
+        """Writes waiting for a group, not counting the group being collected."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self):
+        return {
+            "groups": self.groups,
+            "writes": self.writes,
+            "average_group_size": self.writes / self.groups if self.groups else 0.0,
+        }
@@ -0,0 +1,60 @@
+import os
+import string
+from functools import lru_cache
+
+IBAN_CACHE_SIZE = int(os.environ.get("PAYMENTS_IBAN_CACHE_SIZE", "4096"))
+
+# IBAN length per country, from the SWIFT IBAN registry.
+IBAN_LENGTHS = {
+    "AD": 24, "AE": 23, "AL": 28, "AT": 20, "AZ": 28, "BA": 20, "BE": 16, "BG": 22,
+    "BH": 22, "BI": 27, "BR": 29, "BY": 28, "CH": 21, "CR": 22, "CY": 28, "CZ": 24,
+    "DE": 22, "DJ": 27, "DK": 18, "DO": 28, "EE": 20, "EG": 29, "ES": 24, "FI": 18,
+    "FK": 18, "FO": 18, "FR": 27, "GB": 22, "GE": 22, "GI": 23, "GL": 18, "GR": 27,
+    "GT": 28, "HR": 21, "HU": 28, "IE": 22, "IL": 23, "IQ": 23, "IS": 26, "IT": 27,
+    "JO": 30, "KW": 30, "KZ": 20, "LB": 28, "LC": 32, "LI": 21, "LT": 20, "LU": 20,
+    "LV": 21, "LY": 25, "MC": 27, "MD": 24, "ME": 22, "MK": 19, "MN": 20, "MR": 27,
+    "MT": 31, "MU": 30, "NI": 28, "NL": 18, "NO": 15, "OM": 23, "PK": 24, "PL": 28,
+    "PS": 29, "PT": 25, "QA": 29, "RO": 24, "RS": 22, "RU": 33, "SA": 24, "SC": 31,
+    "SD": 18, "SE": 24, "SI": 19, "SK": 24, "SM": 27, "SO": 23, "ST": 25, "SV": 28,
+    "TL": 23, "TN": 24, "TR": 26, "UA": 29, "VA": 22, "VG": 24, "XK": 20, "YE": 30,
+}
+
+_LETTERS_TO_DIGITS = str.maketrans({letter: str(index) for index, letter in enumerate(string.ascii_uppercase, 10)})
+_DIGITS = frozenset(string.digits)
+_ALPHANUMERIC = frozenset(string.ascii_uppercase + string.digits)
+_GROUPS = {length: [slice(i, i + 4) for i in range(0, length, 4)] for length in set(IBAN_LENGTHS.values())}
+
+
+def compact(value):
+    """Strip spaces and hyphens and upper-case, e.g. 'be71-0961 2345 6769' -> 'BE71096123456769'."""
+    return value.replace(" ", "").replace("-", "").upper()
+
+
+def checksum_valid(iban):
+    """ISO 13616 mod-97 check on a compact IBAN."""
+    rearranged = iban[4:] + iban[:4]
+    return int(rearranged.translate(_LETTERS_TO_DIGITS)) % 97 == 1
+
+
+def _normalize(value):
+    iban = compact(value)
+    if IBAN_LENGTHS.get(iban[:2]) != len(iban):
+        return None
+    if not _DIGITS.issuperset(iban[2:4]) or not _ALPHANUMERIC.issuperset(iban[4:]):
+        return None
+    if not checksum_valid(iban):
+        return None
+    # canonical print format: groups of four separated by a space
+    return " ".join([iban[group] for group in _GROUPS[len(iban)]])
+
+
+def build_iban(country_code, bban):
+    """Compact IBAN with valid check digits for a country code and BBAN, e.g. ('BE', '096123456769') -> 'BE71096123456769'."""
+    check = 98 - int((bban + country_code + "00").translate(_LETTERS_TO_DIGITS)) % 97
+    return f"{country_code}{check:02d}{bban}"
+
+
+@lru_cache(maxsize=IBAN_CACHE_SIZE)
+def normalize_iban(value):
+    """Return the canonical print form of a valid IBAN, or None if it is invalid."""
+    return _normalize(value)
@@ -0,0 +1,91 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict, namedtuple
+
+from storage import StorageError
+
+IDEMPOTENCY_TTL_SECONDS = float(os.environ.get("PAYMENTS_IDEMPOTENCY_TTL", str(24 * 3600)))
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get("PAYMENTS_IDEMPOTENCY_CACHE_SIZE", "10000"))
+
+StoredResponse = namedtuple("StoredResponse", ["fingerprint", "status_code", "body"])
+
+
+def fingerprint(model):
+    return hashlib.sha256(model.model_dump_json().encode()).hexdigest()
+
+
+class LRUCache:
+    """Bounded mapping that drops the least recently used entry and entries older than `ttl`."""
+
+    def __init__(self, max_size=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if time.monotonic() > expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class IdempotencyStore:
+    """Responses keyed by the client's Idempotency-Key header.
+
+    Lookups hit the in-memory LRU first and fall back to the durable
+    `idempotency_keys` table, so a retry is answered without touching the
+    payment tables. `save` must run inside the transaction that performed the
+    writes, so the stored response and the payment commit together.
+    """
+
+    def __init__(self, ttl=IDEMPOTENCY_TTL_SECONDS, cache_size=IDEMPOTENCY_CACHE_SIZE):
+        self.ttl = ttl
+        self.cache = LRUCache(cache_size, ttl)
+
+    def load(self, tx, key):
+        row = tx.load_idempotent_response(key, time.time() - self.ttl)
+        return StoredResponse(*row) if row else None
+
+    async def lookup(self, storage, key):
+        stored = self.cache.get(key)
+        if stored is None:
+            stored = await storage.run(self.load, key)
+            if stored is not None:
+                self.cache.put(key, stored)
+        return stored
+
+    def save(self, tx, key, stored):
+        now = time.time()
+        tx.save_idempotent_response(key, stored.fingerprint, stored.status_code, stored.body, now, now - self.ttl)
+
+    def remember(self, key, stored):
+        self.cache.put(key, stored)
+
+    def purge(self, tx):
+        return tx.purge_idempotent_responses(time.time() - self.ttl)
+
+    async def purge_periodically(self, storage, interval=3600):
+        while True:
+            await asyncio.sleep(interval)
+            # keys live on the shard of their payment request, so purge every shard
+            for partition in storage.partitions():
+                try:
+                    await partition.run(self.purge)
+                except StorageError:
+                    pass
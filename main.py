@@ -1,18 +1,67 @@
 from fastapi import FastAPI, Request, Form
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from pydantic import BaseModel
-from typing import Optional, Annotated
-import sqlite3
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field, ValidationError
+from typing import Optional, Annotated, Literal
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone, timedelta
-import re
 from http import HTTPStatus
-from decimal import Decimal, ROUND_HALF_UP
+from decimal import Decimal
+import asyncio
+import functools
+import math
+import metrics
+from storage import PAYMENT_COLUMNS, REQUEST_COLUMNS, IntegrityError, StorageError, create_storage
+from export import csv_stream, fetch_page, iter_pages, ndjson_stream, row_to_dict
+from currency import CurrencyCache
+from events import EventFeed, event_to_dict
+from expiry import ExpirySweeper
+from group_commit import GROUP_COMMIT, GroupCommitWriter
+from idempotency import IdempotencyStore, StoredResponse, fingerprint
+from iban import normalize_iban
+from money import to_major, to_minor
+from parsing import BodyTooLarge, FastJSONResponse, UnsupportedMediaType, loads, media_type, parse_body, read_body
+from ratelimit import ACCOUNT_BURST, ACCOUNT_RATE, CLIENT_BURST, CLIENT_RATE, Backpressure, TokenBucketLimiter
 
-app = FastAPI()
-templates = Jinja2Templates(directory="templates")
 EXPIRY_TIME_MINUTES = 1
-iban_regex = r"^([A-Z]{2}[ \-]?[0-9]{2})(?=(?:[ \-]?[A-Z0-9]){9,30}$)((?:[ \-]?[A-Z0-9]{3,5}){2,7})([ \-]?[A-Z0-9]{1,3})?$"
+storage = create_storage(on_connect=metrics.track_queries)
+currencies = CurrencyCache()
+sweeper = ExpirySweeper(storage, EXPIRY_TIME_MINUTES)
+idempotency = IdempotencyStore()
+events = EventFeed(storage)
+group_commit = GroupCommitWriter(storage) if GROUP_COMMIT else None
+client_limiter = TokenBucketLimiter(CLIENT_RATE, CLIENT_BURST)
+account_limiter = TokenBucketLimiter(ACCOUNT_RATE, ACCOUNT_BURST)
+backpressure = Backpressure(queue_depth=group_commit.queue_depth if group_commit is not None else None)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # schema migrations run once per worker start; up to date this is one SELECT
+    await run_in_threadpool(storage.setup)
+    await storage.run(currencies.load)
+    tasks = [
+        asyncio.create_task(currencies.refresh_periodically(storage)),
+        asyncio.create_task(sweeper.run()),
+        asyncio.create_task(idempotency.purge_periodically(storage)),
+        asyncio.create_task(events.compact_periodically()),
+    ]
+    yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    if group_commit is not None:
+        await group_commit.stop()
+    storage.close()
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+templates = Jinja2Templates(directory="templates")
+MAX_BATCH_SIZE = 50000
+MAX_BATCH_BYTES = 16 * 1024 * 1024 # checked while reading, before a byte of the batch is parsed
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+MAX_EVENT_WAIT_SECONDS = 30
+MAX_ID = 2**63 - 1 # ids are signed 64-bit in both backends; larger ints would overflow the driver
 
 class PaymentForm(BaseModel):
     name: Optional[str] = None
@@ -21,144 +70,398 @@ class PaymentForm(BaseModel):
     currency: str
 
 class PaymentAttemptForm(BaseModel):
-    payment_request_id: int
+    payment_request_id: int = Field(ge=0, le=MAX_ID)
     name: Optional[str] = None
     payed_amount: Decimal
     payer_account_number: str
     payment_currency: str 
 
-def read_sql_file(file_path):
-    with open(file_path, 'r') as file:
-        sql = file.read()
-        sql_commands = sql.split(';')
-    return sql_commands
+class PaymentQuery(BaseModel):
+    after: int = Field(0, ge=0, le=MAX_ID) # cursor: the last id of the previous page
+    limit: int = Field(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+    account_number: Optional[str] = None
+    since: Optional[float] = None
+    until: Optional[float] = None
+    format: Literal["ndjson", "csv"] = "ndjson" # only used by the export endpoints
 
-def setup_database():
-    with sqlite3.connect('payments.db') as conn:
-        cursor = conn.cursor()
-        commands = read_sql_file('payments.sql')
-        for command in commands:
-            if command.strip():
-                cursor.execute(command)
+    def filters(self):
+        return self.model_dump(include={"status", "account_number", "since", "until"})
+
+class PaymentRequestQuery(PaymentQuery):
+    status: Optional[Literal["pending", "expired", "executed"]] = None
+
+class EventQuery(BaseModel):
+    after: int = Field(0, ge=0, le=MAX_ID) # cursor: the last event_id the consumer has processed
+    limit: int = Field(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+    wait: float = Field(0, ge=0, le=MAX_EVENT_WAIT_SECONDS) # long poll: seconds to wait for a first event
+    partition: int = Field(0, ge=0) # only sharded storage has more than one
 
 @app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
+async def write(func, *args, request_id=None):
+    """Run a write transaction on the storage holding `request_id` (default: this worker's own).
+
+    Shares its commit with concurrent writes when group commit is on.
+    """
+    target = storage if request_id is None else storage.route(request_id)
+    try:
+        if group_commit is not None and target is storage:
+            return await group_commit.submit(func, *args)
+        return await target.run(func, *args)
+    finally:
+        events.notify()
+
+def too_many_requests(limiter, key):
+    retry_after = limiter.retry_after(key)
+    return FastJSONResponse(content={"status": "Too many requests", "retry_after": retry_after}, status_code=HTTPStatus.TOO_MANY_REQUESTS, headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+def limited(func):
+    """Endpoint decorator: global backpressure and the per-client limit, checked before the body is even read."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        # FastAPI calls the endpoint with keyword arguments, named as in its own signature
+        request = args[0] if args else next(iter(kwargs.values()))
+        if backpressure.overloaded():
+            backpressure.rejected += 1
+            return FastJSONResponse(content={"status": "Server busy"}, status_code=HTTPStatus.SERVICE_UNAVAILABLE, headers={"Retry-After": "1"})
+        client = request.client.host if request.client else ""
+        if not client_limiter.allow(client):
+            return too_many_requests(client_limiter, client)
+        with backpressure:
+            return await func(*args, **kwargs)
+    return wrapper
+
+async def load_currencies():
+    if not currencies.loaded:
+        await storage.run(currencies.load)
+    return currencies
+
+def store_payment_request(tx, data):
+    request_time = datetime.now(timezone.utc).timestamp()
+    amount = to_minor(data.amount, data.currency)
+    tx.upsert_person(data.name, data.account_number)
+    request_id = tx.create_request(data.account_number, amount, data.currency, request_time)
+    received = {"request_id": request_id, "name": data.name, "account_number": data.account_number , "amount": to_major(amount, data.currency), "currency": data.currency,  "request_time" : request_time, "status": "pending"}
+    return FastJSONResponse(content={"status": "Payment request received", "received": received
+    }, status_code=HTTPStatus.OK)
+
+def store_payment_requests(tx, forms):
+    request_time = datetime.now(timezone.utc).timestamp()
+    tx.upsert_persons([(form.name, form.account_number) for form in forms])
+    request_ids = tx.create_requests([(form.account_number, to_minor(form.amount, form.currency), form.currency) for form in forms], request_time)
+    return request_ids, request_time
+
+def rate_limited_item(index, limiter, key):
+    return {"index": index, "status": "Too many requests", "retry_after": limiter.retry_after(key)}
+
+def validate_payment_forms(items, parse, cross_rates, client=""):
+    """Validate batch items; every item costs the client and its IBAN a token, like a single request."""
+    forms, results = [], []
+    for index, item in enumerate(items):
+        # the first item is paid for by the token `limited` took for the request itself
+        if index and not client_limiter.allow(client):
+            results.append(rate_limited_item(index, client_limiter, client))
+            continue
+        try:
+            form = parse(item)
+        except ValidationError as e:
+            results.append({"index": index, "status": "Invalid input", "error": str(e)})
+            continue
+        try:
+            to_minor(form.amount, form.currency)
+        except ValueError as e:
+            results.append({"index": index, "status": "Invalid input", "error": str(e)})
+            continue
+        account_number = normalize_iban(form.account_number)
+        if account_number is None:
+            results.append({"index": index, "status": "Invalid IBAN format"})
+        elif form.currency not in cross_rates:
+            results.append({"index": index, "status": "Unsupported currency"})
+        elif not account_limiter.allow(account_number):
+            results.append(rate_limited_item(index, account_limiter, account_number))
+        else:
+            form.account_number = account_number
+            forms.append((index, form))
+            results.append(None)
+    return forms, results
+
+def settlement_conflict(status):
+    if status == 'executed':
+        return FastJSONResponse(content={"status": "Payment request already settled"}, status_code=HTTPStatus.CONFLICT)
+    return FastJSONResponse(content={"status": "Payment request expired"}, status_code=HTTPStatus.BAD_REQUEST)
+
+def store_payment_attempt(tx, data, cross_rates):
+    # plain read, no lock: settling is decided by the conditional update in claim_request
+    with metrics.stage("payment_attempts", "request_fetch"):
+        payment_request = tx.fetch_request(data.payment_request_id)
+    if payment_request is None:
+        return FastJSONResponse(content={"status": "Payment request not found"}, status_code=HTTPStatus.BAD_REQUEST)
+    _, requester_account_number, request_amount, request_currency, request_time, status, requester_name = payment_request
+    expiry_time = datetime.fromtimestamp(request_time, timezone.utc) + timedelta(minutes=EXPIRY_TIME_MINUTES)
+    if status != 'pending':
+        return settlement_conflict(status)
+    
+    elif (datetime.now(timezone.utc) > expiry_time): 
+        tx.claim_request(data.payment_request_id, 'expired')
+        return FastJSONResponse(content={"status": "Payment request expired"}, status_code=HTTPStatus.BAD_REQUEST)
+    else:
+        payment_time = datetime.now(timezone.utc).timestamp()
+        with metrics.stage("payment_attempts", "conversion"):
+            if request_currency not in cross_rates:
+                return FastJSONResponse(content={"status": "Unsupported currency"}, status_code=HTTPStatus.UNPROCESSABLE_ENTITY)
+            # all amounts in integer minor units of their currency
+            amount_in_payment_currency = cross_rates.convert(request_amount, request_currency, data.payment_currency)
+            payed_amount = to_minor(data.payed_amount, data.payment_currency)
+
+        if payed_amount != amount_in_payment_currency:
+            return FastJSONResponse(content={"status": "Incorrect payed amount"}, status_code=HTTPStatus.BAD_REQUEST)
+        else:
+            with metrics.stage("payment_attempts", "write"):
+                if not tx.claim_request(data.payment_request_id, 'executed'):
+                    # the request stopped being pending between our read and the conditional update
+                    return settlement_conflict(tx.fetch_request(data.payment_request_id).status)
+                tx.upsert_person(data.name, data.payer_account_number)
+                payment_id = tx.insert_payment(payed_amount, payment_time, data.payment_request_id, data.payer_account_number, data.payment_currency)
+            received = {"payment_id": payment_id, "payer_name": data.name, "payed_amount": to_major(payed_amount, data.payment_currency), "payer_account_number": data.payer_account_number, "payment_currency": data.payment_currency, "payment_time": payment_time, "payment_request_id": data.payment_request_id, "requester_name": requester_name, "requester_account_number": requester_account_number, "request_amount": to_major(request_amount, request_currency), "request_currency": request_currency, "request_time": request_time, "status": "executed"}
+            return FastJSONResponse(content={"status": "Payment attempt succeeded", "received": received}, status_code=HTTPStatus.OK)
+
+def settle_payment_attempt(tx, data, cross_rates, idempotency_key=None, request_fingerprint=None):
+    response = store_payment_attempt(tx, data, cross_rates)
+    if idempotency_key is not None:
+        idempotency.save(tx, idempotency_key, StoredResponse(request_fingerprint, response.status_code, response.body))
+    return response
+
+def replay_response(stored, request_fingerprint):
+    if stored.fingerprint != request_fingerprint:
+        return FastJSONResponse(content={"status": "Idempotency key reused with a different request"}, status_code=HTTPStatus.UNPROCESSABLE_ENTITY)
+    response = Response(content=stored.body, status_code=stored.status_code, media_type="application/json", headers={"Idempotent-Replayed": "true"})
+    response.outcome = "Idempotent replay"
+    return response
+
 @app.post("/payment_requests")
+@metrics.instrument("payment_requests")
+@limited
 async def payment_request(data: Request): # PaymentForm 
     try:
-        if data.headers.get("content-type") == "application/x-www-form-urlencoded": # support voor form data en json
-            form_data = await data.form()
-        elif data.headers.get("content-type") == "application/json":
-            form_data = await data.json()
-        else:
-            return JSONResponse(content={"status": "Unsupported Media Type"}, status_code=HTTPStatus.UNSUPPORTED_MEDIA_TYPE)
-            
-        data = PaymentForm(**form_data)
-        if not re.match(iban_regex, data.account_number):
-            return JSONResponse(content={"status": "Invalid IBAN format"}, status_code=HTTPStatus.UNPROCESSABLE_ENTITY)
+        with metrics.stage("payment_requests", "parse"):
+            data = await parse_body(data, PaymentForm) # support voor form data en json
+        with metrics.stage("payment_requests", "iban"):
+            account_number = normalize_iban(data.account_number)
+        if account_number is None:
+            return FastJSONResponse(content={"status": "Invalid IBAN format"}, status_code=HTTPStatus.UNPROCESSABLE_ENTITY)
+        data.account_number = account_number
+        to_minor(data.amount, data.currency) # raises ValueError when the amount cannot be stored
+        if not account_limiter.allow(account_number):
+            return too_many_requests(account_limiter, account_number)
+    except UnsupportedMediaType:
+        return FastJSONResponse(content={"status": "Unsupported Media Type"}, status_code=HTTPStatus.UNSUPPORTED_MEDIA_TYPE)
     except Exception as e:
-        return JSONResponse(content={"status": "Invalid input", "error": str(e)}, status_code=HTTPStatus.BAD_REQUEST)
-    try:
-        conn = sqlite3.connect('payments.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT currency_name FROM currency WHERE currency_name = ? ', (data.currency,)) 
-        if cursor.fetchone() is None:
-            return JSONResponse(content={"status": "Unsupported currency"}, status_code=HTTPStatus.UNPROCESSABLE_ENTITY)
-        request_time = datetime.now(timezone.utc).timestamp()
-        cursor.execute('''
-        INSERT INTO payment_requests (requester_account_number, request_amount, currency, request_time, status)
-        VALUES (?, ?, ?, ?, ?)
-        ''', (data.account_number, float(data.amount), data.currency, request_time, 'pending'))
-        try:
-            cursor.execute('INSERT INTO persons (name, account_number) VALUES (?, ?)', (data.name, data.account_number))
-        except: 
-            cursor.execute('UPDATE persons SET name = ? WHERE account_number = ?', (data.name, data.account_number))
-            
-        cursor.execute('SELECT request_id FROM payment_requests WHERE requester_account_number = ? AND request_time = ?', (data.account_number, request_time))
-        request_id = cursor.fetchone()[0]
-        conn.commit()
-        received = {"request_id": request_id, "name": data.name, "account_number": data.account_number , "amount": float(data.amount), "currency": data.currency,  "request_time" : request_time, "status": "pending"}
-        return JSONResponse(content={"status": "Payment request received", "received": received
-        }, status_code=HTTPStatus.OK)
-    except sqlite3.Error as e:
-        return JSONResponse(content={"status": "Error", "error": str(e)}, status_code=HTTPStatus.INTERNAL_SERVER_ERROR)    
-    finally: 
-        conn.close()
+        return FastJSONResponse(content={"status": "Invalid input", "error": str(e)}, status_code=HTTPStatus.BAD_REQUEST)
+    try:
+        with metrics.stage("payment_requests", "currency"):
+            if data.currency not in await load_currencies():
+                return FastJSONResponse(content={"status": "Unsupported currency"}, status_code=HTTPStatus.UNPROCESSABLE_ENTITY)
+        with metrics.stage("payment_requests", "db"):
+            return await write(store_payment_request, data)
+    except StorageError as e:
+        return FastJSONResponse(content={"status": "Error", "error": str(e)}, status_code=HTTPStatus.INTERNAL_SERVER_ERROR)    
+
+
+@app.post("/payment_requests/batch")
+@metrics.instrument("payment_requests_batch")
+@limited
+async def payment_request_batch(request: Request): # JSON array of PaymentForm or NDJSON
+    content_type = media_type(request)
+    if content_type not in ("application/json", "application/x-ndjson", "application/jsonl"):
+        return FastJSONResponse(content={"status": "Unsupported Media Type"}, status_code=HTTPStatus.UNSUPPORTED_MEDIA_TYPE)
+    try:
+        body = await read_body(request, MAX_BATCH_BYTES)
+    except BodyTooLarge:
+        return FastJSONResponse(content={"status": "Batch too large", "max_batch_bytes": MAX_BATCH_BYTES}, status_code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+    try:
+        if content_type == "application/json":
+            items = loads(body)
+            if not isinstance(items, list):
+                raise ValueError("expected a JSON array of payment requests")
+            parse = PaymentForm.model_validate
+        else:
+            items = [line for line in body.splitlines() if line.strip()]
+            parse = PaymentForm.model_validate_json
+    except ValueError as e:
+        return FastJSONResponse(content={"status": "Invalid input", "error": str(e)}, status_code=HTTPStatus.BAD_REQUEST)
+    if len(items) > MAX_BATCH_SIZE:
+        return FastJSONResponse(content={"status": "Batch too large", "max_batch_size": MAX_BATCH_SIZE}, status_code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+    try:
+        client = request.client.host if request.client else ""
+        forms, results = validate_payment_forms(items, parse, (await load_currencies()).cross_rates, client)
+        if forms:
+            request_ids, request_time = await storage.run(store_payment_requests, [form for _, form in forms])
+            events.notify()
+            for (index, form), request_id in zip(forms, request_ids):
+                received = {"request_id": request_id, "name": form.name, "account_number": form.account_number, "amount": to_major(to_minor(form.amount, form.currency), form.currency), "currency": form.currency, "request_time": request_time, "status": "pending"}
+                results[index] = {"index": index, "status": "Payment request received", "received": received}
+    except StorageError as e:
+        return FastJSONResponse(content={"status": "Error", "error": str(e)}, status_code=HTTPStatus.INTERNAL_SERVER_ERROR)
+    return FastJSONResponse(content={"status": "Payment requests processed", "accepted": len(forms), "rejected": len(results) - len(forms), "results": results}, status_code=HTTPStatus.OK)
 
 
 @app.post("/payment_attempts")
+@metrics.instrument("payment_attempts")
+@limited
 async def payment_attempts(data: Request):
+    idempotency_key = data.headers.get("idempotency-key")
     try:
-        if data.headers.get("content-type") == "application/x-www-form-urlencoded":
-            form_data = await data.form()
-        elif data.headers.get("content-type") == "application/json":
-            form_data = await data.json()
-        else:
-            return JSONResponse(content={"status": "Unsupported Media Type"}, status_code=HTTPStatus.UNSUPPORTED_MEDIA_TYPE)
-        data = PaymentAttemptForm(**form_data)
-        if not re.match(iban_regex, data.payer_account_number):
-            return JSONResponse(content={"status": "Invalid IBAN format"}, status_code=HTTPStatus.UNPROCESSABLE_ENTITY)
+        with metrics.stage("payment_attempts", "parse"):
+            data = await parse_body(data, PaymentAttemptForm)
+        with metrics.stage("payment_attempts", "iban"):
+            payer_account_number = normalize_iban(data.payer_account_number)
+        if payer_account_number is None:
+            return FastJSONResponse(content={"status": "Invalid IBAN format"}, status_code=HTTPStatus.UNPROCESSABLE_ENTITY)
+        data.payer_account_number = payer_account_number
+        to_minor(data.payed_amount, data.payment_currency) # raises ValueError when the amount cannot be stored
+        if not account_limiter.allow(payer_account_number):
+            return too_many_requests(account_limiter, payer_account_number)
+    except UnsupportedMediaType:
+        return FastJSONResponse(content={"status": "Unsupported Media Type"}, status_code=HTTPStatus.UNSUPPORTED_MEDIA_TYPE)
     except Exception as e:
-        return JSONResponse(content={"status": "Invalid input", "error": str(e)}, status_code=HTTPStatus.BAD_REQUEST)
+        return FastJSONResponse(content={"status": "Invalid input", "error": str(e)}, status_code=HTTPStatus.BAD_REQUEST)
+    request_fingerprint = fingerprint(data) if idempotency_key else None
     try:
-        conn = sqlite3.connect('payments.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT currency_name FROM currency WHERE currency_name = ? ', (data.payment_currency,)) 
-        if not cursor.fetchone():
-            return JSONResponse(content={"status": "Unsupported currency"}, status_code=HTTPStatus.UNPROCESSABLE_ENTITY)
-        try:
-                cursor.execute('INSERT INTO persons (name, account_number) VALUES (?, ?)', (data.name, data.payer_account_number))
-        except: 
-                cursor.execute('UPDATE persons SET name = ? WHERE account_number = ?', (data.name, data.payer_account_number))
-        try: 
-            cursor.execute('SELECT requester_account_number, request_amount,currency, request_time, status FROM payment_requests WHERE request_id = ?', (data.payment_request_id,))
-            requester_account_number, request_amount, request_currency, request_time, status = cursor.fetchall()[0]
-            expiry_time = datetime.fromtimestamp(request_time, timezone.utc) + timedelta(minutes=EXPIRY_TIME_MINUTES)
-
-        except:
-            return JSONResponse(content={"status": "Payment request not found"}, status_code=HTTPStatus.BAD_REQUEST)
-        if status != 'pending':
-            return JSONResponse(content={"status": "Payment request expired"}, status_code=HTTPStatus.BAD_REQUEST)
-        
-        elif (datetime.now(timezone.utc) > expiry_time): 
-            cursor.execute('UPDATE payment_requests SET status = ? WHERE request_id = ?', ('expired', data.payment_request_id))
-            conn.commit()
-            return JSONResponse(content={"status": "Payment request expired"}, status_code=HTTPStatus.BAD_REQUEST)
-        else:
-            payment_time = datetime.now(timezone.utc).timestamp()
-            request_amount = Decimal(request_amount)
-            cursor.execute('SELECT conversion_rate FROM currency WHERE currency_name = ? ', (request_currency,)) 
-            conversion_rate_request = Decimal(cursor.fetchone()[0]) # conversion rate = 1 USD in request_currency
-            amount_in_usd = request_amount / conversion_rate_request
-
-            cursor.execute('SELECT conversion_rate FROM currency WHERE currency_name = ? ', (data.payment_currency,)) 
-            conversion_rate_payment = Decimal(cursor.fetchone()[0]) 
-            amount_in_payment_currency = amount_in_usd * conversion_rate_payment
-            payed_amount = Decimal(data.payed_amount)
-            payed_amount = payed_amount.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-            amount_in_payment_currency = amount_in_payment_currency.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-
-            if payed_amount != amount_in_payment_currency:
-                return JSONResponse(content={"status": "Incorrect payed amount"}, status_code=HTTPStatus.BAD_REQUEST)
-            else:
-                cursor.execute('UPDATE payment_requests SET status = ? WHERE request_id = ?', ('executed', data.payment_request_id))
-                cursor.execute('''
-                INSERT INTO payments (payment_amount, payment_time, payment_request_id, payer_account_number, currency)
-                VALUES (?, ?, ?, ?, ?)
-                ''', (float(payed_amount), payment_time, data.payment_request_id, data.payer_account_number, data.payment_currency))
-                cursor.execute('SELECT name FROM persons WHERE account_number = ?', (data.payer_account_number,))
-                requester_name = cursor.fetchone()[0]
-                cursor.execute('SELECT payment_id FROM payments WHERE payment_request_id = ? AND payment_time = ?', (data.payment_request_id, payment_time))
-                payment_id = cursor.fetchone()[0]
-                received = {"payment_id": payment_id, "payer_name": data.name, "payed_amount": float(payed_amount), "payer_account_number": data.payer_account_number, "payment_currency": data.payment_currency, "payment_time": payment_time, "payment_request_id": data.payment_request_id, "requester_name": requester_name, "requester_account_number": requester_account_number, "request_amount": float(request_amount), "request_currency": request_currency, "request_time": request_time, "status": "executed"}
-                conn.commit()
-                return JSONResponse(content={"status": "Payment attempt succeeded", "received": received}, status_code=HTTPStatus.OK)
-                
-    except sqlite3.Error as e:
-        return JSONResponse(content={"status": "Error", "error": str(e)}, status_code=HTTPStatus.INTERNAL_SERVER_ERROR)
-    finally: 
-        conn.close()
-
-setup_database()
\ No newline at end of file
+        if idempotency_key:
+            with metrics.stage("payment_attempts", "idempotency"):
+                stored = await idempotency.lookup(storage.route(data.payment_request_id), idempotency_key)
+            if stored is not None:
+                return replay_response(stored, request_fingerprint)
+        with metrics.stage("payment_attempts", "currency"):
+            cross_rates = (await load_currencies()).cross_rates
+        if data.payment_currency not in cross_rates:
+            return FastJSONResponse(content={"status": "Unsupported currency"}, status_code=HTTPStatus.UNPROCESSABLE_ENTITY)
+        with metrics.stage("payment_attempts", "db"):
+            response = await write(settle_payment_attempt, data, cross_rates, idempotency_key, request_fingerprint, request_id=data.payment_request_id)
+        if idempotency_key:
+            idempotency.remember(idempotency_key, StoredResponse(request_fingerprint, response.status_code, response.body))
+        return response
+    except IntegrityError as e:
+        # a concurrent retry with the same key may have committed first
+        stored = await idempotency.lookup(storage.route(data.payment_request_id), idempotency_key) if idempotency_key else None
+        if stored is not None:
+            return replay_response(stored, request_fingerprint)
+        return FastJSONResponse(content={"status": "Error", "error": str(e)}, status_code=HTTPStatus.INTERNAL_SERVER_ERROR)
+    except StorageError as e:
+        return FastJSONResponse(content={"status": "Error", "error": str(e)}, status_code=HTTPStatus.INTERNAL_SERVER_ERROR)
+
+def parse_query(request, model):
+    query = model.model_validate(dict(request.query_params))
+    if query.account_number is not None:
+        query.account_number = normalize_iban(query.account_number)
+        if query.account_number is None:
+            raise ValueError("Invalid IBAN format")
+    return query
+
+async def list_rows(request, model, method, columns):
+    try:
+        query = parse_query(request, model)
+    except ValueError as e:
+        return FastJSONResponse(content={"status": "Invalid input", "error": str(e)}, status_code=HTTPStatus.BAD_REQUEST)
+    try:
+        rows = await fetch_page(storage, method, query.after, query.limit, query.filters())
+    except StorageError as e:
+        return FastJSONResponse(content={"status": "Error", "error": str(e)}, status_code=HTTPStatus.INTERNAL_SERVER_ERROR)
+    next_cursor = rows[-1][0] if len(rows) == query.limit else None
+    return FastJSONResponse(content={"status": "OK", "items": [row_to_dict(columns, row) for row in rows], "next_cursor": next_cursor}, status_code=HTTPStatus.OK)
+
+def export_rows(request, model, method, columns):
+    try:
+        query = parse_query(request, model)
+    except ValueError as e:
+        return FastJSONResponse(content={"status": "Invalid input", "error": str(e)}, status_code=HTTPStatus.BAD_REQUEST)
+    # `limit` caps an export only when it is given; by default every row after `after` is streamed
+    limit = query.limit if "limit" in query.model_fields_set else None
+    pages = iter_pages(storage, method, query.filters(), after=query.after, limit=limit)
+    if query.format == "csv":
+        return StreamingResponse(csv_stream(pages, columns), media_type="text/csv")
+    return StreamingResponse(ndjson_stream(pages, columns), media_type="application/x-ndjson")
+
+@app.get("/payment_requests")
+async def list_payment_requests(request: Request):
+    return await list_rows(request, PaymentRequestQuery, "list_requests", REQUEST_COLUMNS)
+
+@app.get("/payment_requests/export")
+async def export_payment_requests(request: Request):
+    return export_rows(request, PaymentRequestQuery, "list_requests", REQUEST_COLUMNS)
+
+@app.get("/payments")
+async def list_payments(request: Request):
+    return await list_rows(request, PaymentQuery, "list_payments", PAYMENT_COLUMNS)
+
+@app.get("/payments/export")
+async def export_payments(request: Request):
+    return export_rows(request, PaymentQuery, "list_payments", PAYMENT_COLUMNS)
+
+@app.get("/events")
+async def list_events(request: Request):
+    try:
+        query = EventQuery.model_validate(dict(request.query_params))
+        events.partition(query.partition)
+    except ValueError as e:
+        return FastJSONResponse(content={"status": "Invalid input", "error": str(e)}, status_code=HTTPStatus.BAD_REQUEST)
+    try:
+        rows = await events.wait(query.partition, query.after, query.limit, query.wait)
+    except StorageError as e:
+        return FastJSONResponse(content={"status": "Error", "error": str(e)}, status_code=HTTPStatus.INTERNAL_SERVER_ERROR)
+    next_cursor = rows[-1][0] if rows else query.after
+    return FastJSONResponse(content={"status": "OK", "events": [event_to_dict(row) for row in rows], "next_cursor": next_cursor, "partition": query.partition}, status_code=HTTPStatus.OK)
+
+@app.get("/events/stream")
+async def stream_events(request: Request):
+    try:
+        params = dict(request.query_params)
+        # a reconnecting EventSource resumes after the last event it received
+        if "last-event-id" in request.headers:
+            params["after"] = request.headers["last-event-id"]
+        query = EventQuery.model_validate(params)
+        events.partition(query.partition)
+    except ValueError as e:
+        return FastJSONResponse(content={"status": "Invalid input", "error": str(e)}, status_code=HTTPStatus.BAD_REQUEST)
+    return StreamingResponse(events.stream(query.partition, query.after), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.post("/admin/events/compact")
+async def compact_events():
+    try:
+        compacted = await events.compact()
+    except StorageError as e:
+        return FastJSONResponse(content={"status": "Error", "error": str(e)}, status_code=HTTPStatus.INTERNAL_SERVER_ERROR)
+    return FastJSONResponse(content={"status": "Events compacted", "compacted": compacted, "events": events.stats()}, status_code=HTTPStatus.OK)
+
+@app.post("/admin/currencies/reload")
+async def reload_currencies():
+    try:
+        await storage.run(currencies.load)
+    except StorageError as e:
+        return FastJSONResponse(content={"status": "Error", "error": str(e)}, status_code=HTTPStatus.INTERNAL_SERVER_ERROR)
+    rates = {name: str(rate) for name, rate in currencies.rates.items()}
+    return FastJSONResponse(content={"status": "Currency rates reloaded", "version": currencies.version, "rates": rates}, status_code=HTTPStatus.OK)
+
+@app.get("/admin/expiry")
+async def expiry_stats():
+    return FastJSONResponse(content={"status": "OK", "expiry": sweeper.stats()}, status_code=HTTPStatus.OK)
+
+@app.get("/admin/group_commit")
+async def group_commit_stats():
+    if group_commit is None:
+        return FastJSONResponse(content={"status": "Group commit disabled"}, status_code=HTTPStatus.NOT_FOUND)
+    return FastJSONResponse(content={"status": "OK", "group_commit": group_commit.stats()}, status_code=HTTPStatus.OK)
+
+@app.get("/admin/limits")
+async def limits_stats():
+    stats = dict(backpressure.stats(), clients=len(client_limiter), accounts=len(account_limiter))
+    return FastJSONResponse(content={"status": "OK", "limits": stats}, status_code=HTTPStatus.OK)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    if not metrics.ENABLED:
+        return FastJSONResponse(content={"status": "Metrics disabled"}, status_code=HTTPStatus.NOT_FOUND)
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
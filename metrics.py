@@ -0,0 +1,182 @@
+import contextvars
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+
+ENABLED = os.environ.get("PAYMENTS_METRICS", "1") != "0"
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+QUERY_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram:
+    """Fixed-bucket histogram; `observe` is a bisect plus three additions under a lock."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *labels):
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = bound if bound == "+Inf" else repr(float(bound))
+                yield f"{self.name}_bucket{_labels(self.labelnames + ('le',), labels + (le,))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        return "\n".join(line for metric in self.metrics for line in metric.collect()) + "\n"
+
+
+REGISTRY = Registry()
+REQUEST_SECONDS = REGISTRY.histogram("payment_request_seconds", "Handler latency per endpoint.", ("endpoint",))
+STAGE_SECONDS = REGISTRY.histogram("payment_stage_seconds", "Latency per processing stage.", ("endpoint", "stage"))
+OUTCOMES = REGISTRY.counter("payment_outcomes_total", "Responses per endpoint and status.", ("endpoint", "status"))
+DB_QUERIES = REGISTRY.histogram("payment_db_queries", "SQL statements executed per request.", ("endpoint",), QUERY_BUCKETS)
+EXPIRY_SWEEP_SECONDS = REGISTRY.histogram("payment_expiry_sweep_seconds", "Duration of an expiry sweep.")
+EXPIRED_REQUESTS = REGISTRY.counter("payment_requests_expired_total", "Payment requests expired by the sweeper.")
+EVENTS_COMPACTED = REGISTRY.counter("payment_events_compacted_total", "Outbox events deleted by compaction.")
+GROUP_COMMIT_SIZE = REGISTRY.histogram("payment_group_commit_size", "Writes committed per group commit.", (), (1, 2, 4, 8, 16, 32, 64, 128, 256))
+
+_current_queries = contextvars.ContextVar("current_queries", default=None)
+
+
+class _Stage:
+    __slots__ = ("labels", "start")
+
+    def __init__(self, labels):
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        STAGE_SECONDS.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class _NoStage:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(endpoint, name):
+    """Context manager that records the duration of one processing stage."""
+    if not ENABLED:
+        return _NO_STAGE
+    return _Stage((endpoint, name))
+
+
+def count_query(statement):
+    counter = _current_queries.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def track_queries(conn):
+    """Connection hook: count every statement run on `conn` against the current request."""
+    if ENABLED:
+        conn.set_trace_callback(count_query)
+
+
+def instrument(endpoint):
+    """Decorator for an async endpoint: latency, outcome and query count per request.
+
+    The outcome label is the response's "status" text when it has one (see
+    FastJSONResponse.outcome) and the HTTP status code otherwise.
+    """
+    def decorator(func):
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            queries = [0]
+            token = _current_queries.set(queries)
+            start = time.perf_counter()
+            try:
+                response = await func(*args, **kwargs)
+            finally:
+                _current_queries.reset(token)
+                REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint)
+                DB_QUERIES.observe(queries[0], endpoint)
+            OUTCOMES.inc(endpoint, getattr(response, "outcome", None) or str(response.status_code))
+            return response
+        return wrapper
+    return decorator
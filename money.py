@@ -0,0 +1,91 @@
+from decimal import ROUND_HALF_UP
+from fractions import Fraction
+
+DEFAULT_EXPONENT = 2
+MAX_MINOR_UNITS = 2**63 - 1  # both backends store amounts as signed 64-bit integers
+
+# Minor unit exponent per ISO 4217 code where it is not 2, e.g. 1 JPY has no cents.
+CURRENCY_EXPONENTS = {
+    "BIF": 0, "CLP": 0, "DJF": 0, "GNF": 0, "ISK": 0, "JPY": 0, "KMF": 0, "KRW": 0, "PYG": 0,
+    "RWF": 0, "UGX": 0, "UYI": 0, "VND": 0, "VUV": 0, "XAF": 0, "XOF": 0, "XPF": 0,
+    "BHD": 3, "IQD": 3, "JOD": 3, "KWD": 3, "LYD": 3, "OMR": 3, "TND": 3,
+}
+
+
+def exponent(currency):
+    return CURRENCY_EXPONENTS.get(currency, DEFAULT_EXPONENT)
+
+
+def to_minor(amount, currency):
+    """Decimal amount -> integer minor units, rounded half up, e.g. (Decimal('12.345'), 'EUR') -> 1235.
+
+    Raises ValueError for amounts that are not finite or do not fit in MAX_MINOR_UNITS.
+    """
+    if not amount.is_finite() or amount.adjusted() + exponent(currency) > 19:
+        raise ValueError(f"amount {amount} {currency} is out of range")
+    units = int(amount.scaleb(exponent(currency)).to_integral_value(ROUND_HALF_UP))
+    if abs(units) > MAX_MINOR_UNITS:
+        raise ValueError(f"amount {amount} {currency} is out of range")
+    return units
+
+
+def to_major(units, currency):
+    """Integer minor units -> amount as a float for JSON responses, e.g. (1235, 'EUR') -> 12.35."""
+    return units / 10 ** exponent(currency)
+
+
+def _divide_half_up(numerator, denominator):
+    # floor((n + d/2) / d) in integers, mirrored for negative amounts
+    if numerator >= 0:
+        return (2 * numerator + denominator) // (2 * denominator)
+    return -((denominator - 2 * numerator) // (2 * denominator))
+
+
+class CrossRates:
+    """N×N table of exact conversion factors between all loaded currencies.
+
+    `rates` maps a currency to the Decimal value of 1 USD in that currency.
+    Each cell is a (numerator, denominator) integer pair that turns minor units
+    of the source currency into minor units of the target currency, so a
+    conversion is one multiplication and one integer division with half-up
+    rounding: no floats and no Decimal arithmetic per payment. Rates must be
+    positive. Build a new table when the rates change.
+    """
+
+    def __init__(self, rates):
+        self.currencies = tuple(sorted(rates))
+        values = {currency: Fraction(rate) for currency, rate in rates.items()}
+        self.table = {}
+        for source in self.currencies:
+            for target in self.currencies:
+                factor = values[target] * 10 ** exponent(target) / (values[source] * 10 ** exponent(source))
+                self.table[source, target] = (factor.numerator, factor.denominator)
+
+    def __contains__(self, currency):
+        return currency in self.currencies
+
+    def __len__(self):
+        return len(self.currencies)
+
+    def convert(self, units, source, target):
+        numerator, denominator = self.table[source, target]
+        return _divide_half_up(units * numerator, denominator)
+
+    def convert_batch(self, rows):
+        """Convert (units, source, target) rows, e.g. for reconciliation; returns the amounts in order.
+
+        Same result as calling `convert` per row, with the rounding inlined in
+        one loop instead of a function call per row.
+        """
+        table = self.table
+        results = []
+        append = results.append
+        for units, source, target in rows:
+            numerator, denominator = table[source, target]
+            if units >= 0:
+                append((2 * units * numerator + denominator) // (2 * denominator))
+            else:
+                append(_divide_half_up(units * numerator, denominator))
+        return results
+
+EMPTY = CrossRates({})
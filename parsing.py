@@ -0,0 +1,84 @@
+import json
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the standard library
+    orjson = None
+
+FORM_MEDIA_TYPES = ("application/x-www-form-urlencoded", "multipart/form-data")
+
+
+class UnsupportedMediaType(Exception):
+    pass
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+def media_type(request):
+    """Content type without parameters, e.g. 'application/json; charset=utf-8' -> 'application/json'."""
+    return request.headers.get("content-type", "").split(";", 1)[0].strip().lower()
+
+
+async def read_body(request, limit):
+    """The request body, read chunk by chunk; raises BodyTooLarge once it exceeds `limit` bytes.
+
+    A Content-Length over the limit is refused before anything is read.
+    """
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > limit:
+        raise BodyTooLarge()
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            raise BodyTooLarge()
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def loads(body):
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def dumps(content):
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, separators=(",", ":")).encode()
+
+
+async def parse_body(request, model):
+    """Validate a JSON or form encoded request body into `model`.
+
+    JSON bodies are handed to pydantic as raw bytes, which skips building an
+    intermediate dict. Raises UnsupportedMediaType for any other content type
+    and pydantic's ValidationError for invalid input.
+    """
+    content_type = media_type(request)
+    if content_type == "application/json":
+        return model.model_validate_json(await request.body())
+    if content_type in FORM_MEDIA_TYPES:
+        return model.model_validate(dict(await request.form()))
+    raise UnsupportedMediaType(content_type)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when it is installed.
+
+    Keeps the "status" text of the body as `outcome`, for the outcome counters
+    in metrics.py.
+    """
+
+    def __init__(self, content, *args, **kwargs):
+        self.outcome = content.get("status") if isinstance(content, dict) else None
+        super().__init__(content, *args, **kwargs)
+
+    def render(self, content):
+        if orjson is not None:
+            return orjson.dumps(content)
+        return super().render(content)
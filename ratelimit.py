@@ -0,0 +1,108 @@
+import os
+import time
+from array import array
+from collections import OrderedDict
+
+CLIENT_RATE = float(os.environ.get("PAYMENTS_CLIENT_RATE", "0"))  # requests/s per client address, 0 = off
+CLIENT_BURST = float(os.environ.get("PAYMENTS_CLIENT_BURST", "100"))
+ACCOUNT_RATE = float(os.environ.get("PAYMENTS_ACCOUNT_RATE", "0"))  # requests/s per IBAN, 0 = off
+ACCOUNT_BURST = float(os.environ.get("PAYMENTS_ACCOUNT_BURST", "20"))
+RATE_LIMIT_KEYS = int(os.environ.get("PAYMENTS_RATE_LIMIT_KEYS", "65536"))
+MAX_IN_FLIGHT = int(os.environ.get("PAYMENTS_MAX_IN_FLIGHT", "1024"))
+MAX_QUEUE_DEPTH = int(os.environ.get("PAYMENTS_MAX_QUEUE_DEPTH", "1024"))
+
+
+class TokenBucketLimiter:
+    """Token buckets for up to `max_keys` keys in two preallocated float arrays.
+
+    Every key gets `burst` tokens that refill at `rate` per second; a request
+    costs one token. `slots` maps a key to its index in the arrays and is kept
+    in least-recently-used order, so when all slots are taken the key that has
+    been idle longest is evicted. An evicted key simply starts again with a full
+    bucket. A rate of 0 disables the limiter. Not thread-safe: call it from the
+    event loop only.
+    """
+
+    def __init__(self, rate, burst, max_keys=RATE_LIMIT_KEYS, clock=time.monotonic):
+        if max_keys < 1:
+            raise ValueError("max_keys must be at least 1")
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.clock = clock
+        self.tokens = array("d", bytes(8 * max_keys))
+        self.updated = array("d", bytes(8 * max_keys))
+        self.slots = OrderedDict()
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def __len__(self):
+        return len(self.slots)
+
+    def _slot(self, key, now):
+        slot = self.slots.get(key)
+        if slot is not None:
+            self.slots.move_to_end(key)
+            return slot
+        if len(self.slots) < self.max_keys:
+            slot = len(self.slots)
+        else:
+            _, slot = self.slots.popitem(last=False)
+        self.slots[key] = slot
+        self.tokens[slot] = self.burst
+        self.updated[slot] = now
+        return slot
+
+    def retry_after(self, key):
+        """Seconds until `key` has a token again; 0 when it has one now."""
+        slot = self.slots.get(key)
+        if slot is None or not self.enabled:
+            return 0.0
+        tokens = min(self.burst, self.tokens[slot] + (self.clock() - self.updated[slot]) * self.rate)
+        return max(0.0, (1 - tokens) / self.rate)
+
+    def allow(self, key):
+        """Take a token for `key`; False when its bucket is empty."""
+        if not self.enabled:
+            return True
+        now = self.clock()
+        slot = self._slot(key, now)
+        tokens = min(self.burst, self.tokens[slot] + (now - self.updated[slot]) * self.rate)
+        self.updated[slot] = now
+        if tokens < 1:
+            self.tokens[slot] = tokens
+            return False
+        self.tokens[slot] = tokens - 1
+        return True
+
+
+class Backpressure:
+    """Global load check: too many requests in flight, or a write queue that is too deep.
+
+    `queue_depth` is a callable returning the current depth of the write queue
+    (e.g. the group-commit writer's); without one only in-flight requests count.
+    """
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, max_queue_depth=MAX_QUEUE_DEPTH, queue_depth=None):
+        self.max_in_flight = max_in_flight
+        self.max_queue_depth = max_queue_depth
+        self.queue_depth = queue_depth
+        self.in_flight = 0
+        self.rejected = 0
+
+    def overloaded(self):
+        if self.in_flight >= self.max_in_flight:
+            return True
+        return self.queue_depth is not None and self.queue_depth() >= self.max_queue_depth
+
+    def __enter__(self):
+        self.in_flight += 1
+
+    def __exit__(self, *exc_info):
+        self.in_flight -= 1
+
+    def stats(self):
+        depth = self.queue_depth() if self.queue_depth is not None else 0
+        return {"in_flight": self.in_flight, "queue_depth": depth, "rejected": self.rejected}
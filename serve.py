@@ -0,0 +1,64 @@
+"""Run the server as N shared-nothing worker processes over N SQLite shards.
+
+Every worker gets its own home shard (PAYMENTS_SHARD_INDEX) and all workers
+accept connections on one listening socket, so new payment requests from
+different workers never wait on each other's write lock. A request_id says
+which shard holds it (see storage/sharded.py).
+
+    python serve.py --workers 4 --port 8000
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+
+import uvicorn
+
+
+def bind(host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(index, count, sock):
+    # set before main is imported: create_storage reads them at import time
+    os.environ["PAYMENTS_SHARDS"] = str(count)
+    os.environ["PAYMENTS_SHARD_INDEX"] = str(index)
+    config = uvicorn.Config("main:app", log_level="warning")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def serve(workers, host, port):
+    sock = bind(host, port)
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=run_worker, args=(index, workers, sock)) for index in range(workers)]
+    for process in processes:
+        process.start()
+
+    def stop(*_):
+        for process in processes:
+            process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for process in processes:
+        process.join()
+    sock.close()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    serve(args.workers, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,27 @@
+import os
+
+from database import DATABASE_PATH, POOL_SIZE
+from storage.base import (
+    EVENT_COLUMNS, PAYMENT_COLUMNS, REQUEST_COLUMNS, IntegrityError, PaymentRequestRow, Storage, StorageError, Transaction,
+)
+from storage.sqlite import SQLiteStorage
+
+DATABASE_URL = os.environ.get("PAYMENTS_DATABASE_URL")
+SHARDS = int(os.environ.get("PAYMENTS_SHARDS", "1"))
+SHARD_INDEX = int(os.environ.get("PAYMENTS_SHARD_INDEX", "0"))
+
+
+def create_storage(url=DATABASE_URL, on_connect=None, shards=SHARDS, shard_index=SHARD_INDEX):
+    """PostgreSQL when `url` is a postgresql:// URL, otherwise SQLite at PAYMENTS_DB_PATH.
+
+    With `shards` > 1 SQLite is split over that many files next to
+    PAYMENTS_DB_PATH and this process writes new requests to `shard_index`
+    (see serve.py). `on_connect` is called with every new SQLite connection.
+    """
+    if url and url.startswith(("postgresql://", "postgres://")):
+        from storage.postgres import PostgresStorage
+        return PostgresStorage(url)
+    if shards > 1:
+        from storage.sharded import ShardedStorage, shard_path
+        return ShardedStorage([shard_path(DATABASE_PATH, index) for index in range(shards)], shard_index, POOL_SIZE, on_connect)
+    return SQLiteStorage(DATABASE_PATH, on_connect=on_connect)
@@ -0,0 +1,215 @@
+import os
+import re
+from abc import ABC, abstractmethod
+from collections import namedtuple
+
+from starlette.concurrency import run_in_threadpool
+
+PaymentRequestRow = namedtuple("PaymentRequestRow", [
+    "request_id", "requester_account_number", "request_amount", "currency", "request_time", "status", "requester_name",
+])
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_FILE = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+Migration = namedtuple("Migration", ["version", "name", "script"])
+
+REQUEST_COLUMNS = ("request_id", "account_number", "amount", "currency", "request_time", "status")
+PAYMENT_COLUMNS = ("payment_id", "payment_request_id", "payer_account_number", "amount", "currency", "payment_time")
+EVENT_COLUMNS = ("event_id", "event_type", "request_id", "payment_id", "account_number", "amount", "currency", "created_at")
+
+
+def keyset_query(select, id_column, time_column, after, limit, filters, since, until, placeholder):
+    """Build a keyset-paginated SELECT: `id_column > after` plus optional equality and time filters."""
+    conditions = [f"{id_column} > {placeholder}"]
+    params = [after]
+    for column, value in filters:
+        if value is not None:
+            conditions.append(f"{column} = {placeholder}")
+            params.append(value)
+    if since is not None:
+        conditions.append(f"{time_column} >= {placeholder}")
+        params.append(since)
+    if until is not None:
+        conditions.append(f"{time_column} < {placeholder}")
+        params.append(until)
+    params.append(limit)
+    return f"{select} WHERE {' AND '.join(conditions)} ORDER BY {id_column} LIMIT {placeholder}", params
+
+
+def load_migrations(backend):
+    """The migrations in migrations/<backend>/, as Migrations sorted by version.
+
+    Files are named <version>_<name>.sql, e.g. 0001_initial.sql; versions only
+    ever get added, never edited once released.
+    """
+    directory = os.path.join(MIGRATIONS_DIR, backend)
+    migrations = []
+    for filename in os.listdir(directory):
+        match = MIGRATION_FILE.match(filename)
+        if match:
+            with open(os.path.join(directory, filename)) as file:
+                migrations.append(Migration(int(match.group(1)), match.group(2), file.read()))
+    return sorted(migrations)
+
+
+class StorageError(Exception):
+    """Any failure of the storage backend."""
+
+
+class IntegrityError(StorageError):
+    """A constraint (unique key, foreign key, ...) was violated."""
+
+
+class Transaction(ABC):
+    """The operations the handlers need, all run inside one database transaction.
+
+    Amounts are integer minor units of their currency (cents, or whole yen for
+    JPY; see money.py), both going in and coming out. Every backend implements
+    all of these methods; a backend that misses one cannot be instantiated.
+    """
+
+    @abstractmethod
+    def savepoint(self):
+        """Context manager for a savepoint: when the block raises, only its own changes are rolled back.
+
+        Backend errors raised inside the block surface as StorageError or IntegrityError.
+        """
+
+    @abstractmethod
+    def get_rates(self):
+        """Return {currency_name: conversion_rate} with the rate of 1 USD as Decimal."""
+
+    @abstractmethod
+    def upsert_person(self, name, account_number):
+        ...
+
+    @abstractmethod
+    def upsert_persons(self, rows):
+        """Bulk variant of `upsert_person`; `rows` are (name, account_number) pairs."""
+
+    @abstractmethod
+    def create_request(self, account_number, amount, currency, request_time):
+        """Insert a pending payment request and return its request_id."""
+
+    @abstractmethod
+    def create_requests(self, rows, request_time):
+        """Insert pending requests for (account_number, amount, currency) rows, return their ids in order."""
+
+    @abstractmethod
+    def fetch_request(self, request_id):
+        """Return a PaymentRequestRow or None. A plain read: state changes go through claim_request."""
+
+    @abstractmethod
+    def claim_request(self, request_id, status):
+        """Move a pending request to `status` in one conditional UPDATE.
+
+        Returns False when the request was no longer pending, e.g. because a
+        concurrent attempt settled it first. Never read-then-write.
+        """
+
+    @abstractmethod
+    def insert_payment(self, amount, payment_time, request_id, payer_account_number, currency):
+        """Insert a payment and return its payment_id."""
+
+    @abstractmethod
+    def expire_pending(self, cutoff, limit):
+        """Mark at most `limit` pending requests older than `cutoff` as expired, return the count."""
+
+    @abstractmethod
+    def list_requests(self, after, limit, status=None, account_number=None, since=None, until=None):
+        """Up to `limit` requests with request_id > `after`, in id order, as tuples of REQUEST_COLUMNS."""
+
+    @abstractmethod
+    def list_payments(self, after, limit, account_number=None, since=None, until=None):
+        """Up to `limit` payments with payment_id > `after`, in id order, as tuples of PAYMENT_COLUMNS."""
+
+    @abstractmethod
+    def list_events(self, after, limit):
+        """Up to `limit` payment_events with event_id > `after`, in id order, as tuples of EVENT_COLUMNS.
+
+        The events are appended by triggers in the transaction of the change
+        itself (migration 0002); a committed event never appears below an id
+        a reader has already seen. On PostgreSQL the event_id of the feed is
+        the position readers hand out in commit-safe order (migration 0004).
+        """
+
+    @abstractmethod
+    def compact_events(self, created_before, limit):
+        """Delete at most `limit` of the oldest events written before `created_before`, return the count."""
+
+    @abstractmethod
+    def load_idempotent_response(self, key, created_after):
+        """Return (fingerprint, status_code, body) or None."""
+
+    @abstractmethod
+    def save_idempotent_response(self, key, fingerprint, status_code, body, created_at, expired_before):
+        """Store the response for `key`; an existing row is only replaced when created before `expired_before`.
+
+        Raises IntegrityError when a live response for `key` exists, so a
+        concurrent attempt with the same key rolls back instead of overwriting
+        the response that was committed first.
+        """
+
+    @abstractmethod
+    def purge_idempotent_responses(self, created_before):
+        ...
+
+
+class Storage(ABC):
+    """A storage backend: runs a function against a Transaction in the threadpool.
+
+    `run_sync(func, *args)` calls `func(transaction, *args)`, commits when it
+    returns and rolls back when it raises. Backend errors surface as
+    StorageError or IntegrityError.
+    """
+
+    @abstractmethod
+    def setup(self):
+        """Apply the pending schema migrations and return their versions.
+
+        The applied versions are recorded in the schema_migrations table; once
+        the schema is up to date this is a single read. Safe to call from
+        several workers at once: one of them migrates, the others wait and
+        find nothing left to do.
+        """
+
+    @abstractmethod
+    def run_sync(self, func, *args):
+        ...
+
+    def route(self, request_id):
+        """The storage that holds `request_id`; only sharded storage returns anything but itself."""
+        return self
+
+    def partitions(self):
+        """Storages that together hold all rows, for listings that have to visit every one."""
+        return [self]
+
+    async def run(self, func, *args):
+        return await run_in_threadpool(self.run_sync, func, *args)
+
+    def run_group_sync(self, calls):
+        """Run several (func, args) calls in one transaction with a single commit.
+
+        Every call gets its own savepoint, so a call that raises does not undo
+        the others. Returns a (result, exception) pair per call; a failing
+        commit raises for the whole group.
+        """
+        def run_calls(tx):
+            outcomes = []
+            for func, args in calls:
+                try:
+                    with tx.savepoint():
+                        outcomes.append((func(tx, *args), None))
+                except Exception as e:
+                    outcomes.append((None, e))
+            return outcomes
+        return self.run_sync(run_calls)
+
+    async def run_group(self, calls):
+        return await run_in_threadpool(self.run_group_sync, calls)
+
+    @abstractmethod
+    def close(self):
+        ...
@@ -0,0 +1,46 @@
+-- Baseline: the schema storage/postgres.sql used to create.
+CREATE TABLE IF NOT EXISTS currency (
+	conversion_rate	NUMERIC NOT NULL,
+	currency_name	TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS payment_requests (
+	request_id	BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+	requester_account_number	TEXT NOT NULL,
+	request_amount	BIGINT NOT NULL,
+	currency	TEXT NOT NULL REFERENCES currency (currency_name),
+	request_time	DOUBLE PRECISION NOT NULL,
+	status	TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS payments (
+	payment_id	BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+	payment_amount	BIGINT NOT NULL,
+	payment_time	DOUBLE PRECISION NOT NULL,
+	payment_request_id	BIGINT UNIQUE REFERENCES payment_requests (request_id),
+	payer_account_number	TEXT NOT NULL,
+	currency	TEXT NOT NULL REFERENCES currency (currency_name)
+);
+CREATE TABLE IF NOT EXISTS persons (
+	account_number	TEXT PRIMARY KEY,
+	name	TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_payment_requests_status_time ON payment_requests (status, request_time);
+CREATE INDEX IF NOT EXISTS idx_payment_requests_account ON payment_requests (requester_account_number, request_id);
+CREATE INDEX IF NOT EXISTS idx_payments_account ON payments (payer_account_number, payment_id);
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+	idempotency_key	TEXT PRIMARY KEY,
+	fingerprint	TEXT NOT NULL,
+	status_code	INTEGER NOT NULL,
+	response	BYTEA NOT NULL,
+	created_at	DOUBLE PRECISION NOT NULL
+);
+
+-- Seed data
+INSERT INTO currency (conversion_rate, currency_name) VALUES (1.0, 'USD'), (0.85, 'EUR'), (110.0, 'JPY')
+	ON CONFLICT DO NOTHING;
+
+INSERT INTO persons (account_number, name) VALUES ('BE84 1234 5678 9012', 'Thorsten') ON CONFLICT DO NOTHING;
+
+INSERT INTO payment_requests (request_id, requester_account_number, request_amount, currency, request_time, status)
+	VALUES (1, 'BE84 3410 1235 5486', 10000, 'USD', 1756456400, 'pending') ON CONFLICT DO NOTHING;
+-- the explicit id above bypasses the identity sequence, move it past the existing rows
+SELECT setval(pg_get_serial_sequence('payment_requests', 'request_id'), (SELECT MAX(request_id) FROM payment_requests));
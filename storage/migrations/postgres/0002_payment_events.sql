@@ -0,0 +1,45 @@
+-- Outbox of state transitions, appended by triggers in the transaction that
+-- makes the change: created (new request), expired (request), executed (payment).
+-- Consumers tail it by event_id (see events.py) instead of polling the payment tables.
+CREATE TABLE IF NOT EXISTS payment_events (
+	event_id	BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+	event_type	TEXT NOT NULL,
+	request_id	BIGINT,
+	payment_id	BIGINT,
+	account_number	TEXT NOT NULL,
+	amount	BIGINT NOT NULL,
+	currency	TEXT NOT NULL,
+	created_at	DOUBLE PRECISION NOT NULL DEFAULT extract(epoch FROM clock_timestamp())
+);
+CREATE INDEX IF NOT EXISTS idx_payment_events_created ON payment_events (created_at);
+
+-- Identity values are handed out at insert, not at commit: without the lock a
+-- transaction could commit event 5 while event 4 is still uncommitted, and a
+-- consumer that read up to 5 would never see 4. The transaction-level
+-- advisory lock is held until commit, so event ids become visible in order.
+-- The event is the last write of every transaction that appends one, which
+-- keeps the time the lock is held down to the commit itself.
+CREATE OR REPLACE FUNCTION record_payment_event() RETURNS trigger AS $$
+BEGIN
+	PERFORM pg_advisory_xact_lock(7201502);
+	IF TG_TABLE_NAME = 'payments' THEN
+		INSERT INTO payment_events (event_type, request_id, payment_id, account_number, amount, currency)
+		VALUES ('executed', NEW.payment_request_id, NEW.payment_id, NEW.payer_account_number, NEW.payment_amount, NEW.currency);
+	ELSE
+		INSERT INTO payment_events (event_type, request_id, account_number, amount, currency)
+		VALUES (CASE WHEN TG_OP = 'INSERT' THEN 'created' ELSE 'expired' END,
+			NEW.request_id, NEW.requester_account_number, NEW.request_amount, NEW.currency);
+	END IF;
+	RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS payment_request_created ON payment_requests;
+CREATE TRIGGER payment_request_created AFTER INSERT ON payment_requests
+	FOR EACH ROW EXECUTE FUNCTION record_payment_event();
+DROP TRIGGER IF EXISTS payment_request_expired ON payment_requests;
+CREATE TRIGGER payment_request_expired AFTER UPDATE OF status ON payment_requests
+	FOR EACH ROW WHEN (NEW.status = 'expired' AND OLD.status <> 'expired') EXECUTE FUNCTION record_payment_event();
+DROP TRIGGER IF EXISTS payment_executed ON payments;
+CREATE TRIGGER payment_executed AFTER INSERT ON payments
+	FOR EACH ROW EXECUTE FUNCTION record_payment_event();
@@ -0,0 +1,23 @@
+-- Amounts used to be stored in whole units of their currency (NUMERIC); since
+-- the move to integer minor units (money.py) they are cents, whole yen, ...
+-- in BIGINT columns. Columns that are still NUMERIC hold whole units: convert
+-- them, multiplying by 10**exponent of the currency. The CASE mirrors
+-- money.CURRENCY_EXPONENTS.
+DO $$
+BEGIN
+	IF (SELECT data_type FROM information_schema.columns
+		WHERE table_schema = current_schema() AND table_name = 'payment_requests' AND column_name = 'request_amount') = 'numeric' THEN
+		ALTER TABLE payment_requests ALTER COLUMN request_amount TYPE BIGINT USING round(request_amount * CASE
+			WHEN currency IN ('BIF', 'CLP', 'DJF', 'GNF', 'ISK', 'JPY', 'KMF', 'KRW', 'PYG', 'RWF', 'UGX', 'UYI', 'VND', 'VUV', 'XAF', 'XOF', 'XPF') THEN 1
+			WHEN currency IN ('BHD', 'IQD', 'JOD', 'KWD', 'LYD', 'OMR', 'TND') THEN 1000
+			ELSE 100 END);
+	END IF;
+	IF (SELECT data_type FROM information_schema.columns
+		WHERE table_schema = current_schema() AND table_name = 'payments' AND column_name = 'payment_amount') = 'numeric' THEN
+		ALTER TABLE payments ALTER COLUMN payment_amount TYPE BIGINT USING round(payment_amount * CASE
+			WHEN currency IN ('BIF', 'CLP', 'DJF', 'GNF', 'ISK', 'JPY', 'KMF', 'KRW', 'PYG', 'RWF', 'UGX', 'UYI', 'VND', 'VUV', 'XAF', 'XOF', 'XPF') THEN 1
+			WHEN currency IN ('BHD', 'IQD', 'JOD', 'KWD', 'LYD', 'OMR', 'TND') THEN 1000
+			ELSE 100 END);
+	END IF;
+END
+$$;
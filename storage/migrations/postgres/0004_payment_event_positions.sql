@@ -0,0 +1,31 @@
+-- 0002 made event ids visible in order by serializing every transaction that
+-- appends an event on one advisory lock, so concurrent writers queued behind
+-- each other's commit. Instead every event now records the transaction that
+-- wrote it, and the feed is ordered by feed_position, handed out by readers
+-- (PostgresTransaction.list_events) only to events of transactions older than
+-- the xmin of the reader's snapshot. Those transactions have all finished, and
+-- every transaction still in flight or yet to start has a larger id, so the
+-- set of positioned events only ever grows at the end: a consumer never
+-- passes a position that a later commit fills in. Existing events keep their
+-- event_id as position.
+ALTER TABLE payment_events ADD COLUMN IF NOT EXISTS tx xid8 NOT NULL DEFAULT pg_current_xact_id();
+ALTER TABLE payment_events ADD COLUMN IF NOT EXISTS feed_position BIGINT;
+UPDATE payment_events SET feed_position = event_id WHERE feed_position IS NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_payment_events_position ON payment_events (feed_position);
+CREATE INDEX IF NOT EXISTS idx_payment_events_unpositioned ON payment_events (tx, event_id) WHERE feed_position IS NULL;
+CREATE SEQUENCE IF NOT EXISTS payment_event_positions;
+SELECT setval('payment_event_positions', GREATEST((SELECT MAX(event_id) FROM payment_events), 1));
+
+CREATE OR REPLACE FUNCTION record_payment_event() RETURNS trigger AS $$
+BEGIN
+	IF TG_TABLE_NAME = 'payments' THEN
+		INSERT INTO payment_events (event_type, request_id, payment_id, account_number, amount, currency)
+		VALUES ('executed', NEW.payment_request_id, NEW.payment_id, NEW.payer_account_number, NEW.payment_amount, NEW.currency);
+	ELSE
+		INSERT INTO payment_events (event_type, request_id, account_number, amount, currency)
+		VALUES (CASE WHEN TG_OP = 'INSERT' THEN 'created' ELSE 'expired' END,
+			NEW.request_id, NEW.requester_account_number, NEW.request_amount, NEW.currency);
+	END IF;
+	RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
@@ -1,4 +1,5 @@
-BEGIN TRANSACTION;
+-- Baseline: the schema payments.sql used to create. Safe on databases that
+-- already have it (IF NOT EXISTS / OR IGNORE).
 CREATE TABLE IF NOT EXISTS "currency" (
 	"conversion_rate"	REAL NOT NULL,
 	"currency_name"	TEXT NOT NULL,
@@ -17,7 +18,7 @@ CREATE TABLE IF NOT EXISTS "payment_requests" (
 );
 CREATE TABLE IF NOT EXISTS "payments" (
 	"payment_id"	INTEGER,
-	"payment_amount"	REAL NOT NULL,
+	"payment_amount"	INTEGER NOT NULL,
 	"payment_time"	REAL NOT NULL,
 	"payment_request_id"	INTEGER UNIQUE,
 	"payer_account_number"	TEXT NOT NULL,
@@ -32,6 +33,17 @@ CREATE TABLE IF NOT EXISTS "persons" (
 	"name"	TEXT ,
 	PRIMARY KEY("account_number")
 );
+CREATE INDEX IF NOT EXISTS "idx_payment_requests_status_time" ON "payment_requests" ("status", "request_time");
+CREATE INDEX IF NOT EXISTS "idx_payment_requests_account" ON "payment_requests" ("requester_account_number", "request_id");
+CREATE INDEX IF NOT EXISTS "idx_payments_account" ON "payments" ("payer_account_number", "payment_id");
+CREATE TABLE IF NOT EXISTS "idempotency_keys" (
+	"idempotency_key"	TEXT NOT NULL,
+	"fingerprint"	TEXT NOT NULL,
+	"status_code"	INTEGER NOT NULL,
+	"response"	BLOB NOT NULL,
+	"created_at"	REAL NOT NULL,
+	PRIMARY KEY("idempotency_key")
+);
 
 -- Seed data
 INSERT OR IGNORE INTO "currency" (conversion_rate, currency_name) VALUES (1.0, 'USD');
@@ -40,6 +52,4 @@ INSERT OR IGNORE INTO "currency" (conversion_rate, currency_name) VALUES (110.0,
 
 INSERT OR IGNORE INTO "persons" (account_number, name) VALUES ('BE84 1234 5678 9012', 'Thorsten');
 
-INSERT OR IGNORE INTO "payment_requests" (request_id, requester_account_number, request_amount, currency, request_time, status) VALUES (1, 'BE84 3410 1235 5486', 100, 'USD', 1756456400, 'pending');
-
-COMMIT;
+INSERT OR IGNORE INTO "payment_requests" (request_id, requester_account_number, request_amount, currency, request_time, status) VALUES (1, 'BE84 3410 1235 5486', 10000, 'USD', 1756456400, 'pending');
@@ -0,0 +1,35 @@
+-- Outbox of state transitions, appended by triggers in the transaction that
+-- makes the change: created (new request), expired (request), executed (payment).
+-- Consumers tail it by event_id (see events.py) instead of polling the payment tables.
+CREATE TABLE IF NOT EXISTS "payment_events" (
+	"event_id"	INTEGER,
+	"event_type"	TEXT NOT NULL,
+	"request_id"	INTEGER,
+	"payment_id"	INTEGER,
+	"account_number"	TEXT NOT NULL,
+	"amount"	INTEGER NOT NULL,
+	"currency"	TEXT NOT NULL,
+	"created_at"	REAL NOT NULL,
+	PRIMARY KEY("event_id" AUTOINCREMENT)
+);
+CREATE INDEX IF NOT EXISTS "idx_payment_events_created" ON "payment_events" ("created_at");
+
+-- created_at is the unix time of the write, like time.time()
+CREATE TRIGGER IF NOT EXISTS "payment_request_created" AFTER INSERT ON "payment_requests"
+BEGIN
+	INSERT INTO "payment_events" (event_type, request_id, account_number, amount, currency, created_at)
+	VALUES ('created', new.request_id, new.requester_account_number, new.request_amount, new.currency, (julianday('now') - 2440587.5) * 86400.0);
+END;
+
+CREATE TRIGGER IF NOT EXISTS "payment_request_expired" AFTER UPDATE OF status ON "payment_requests"
+WHEN new.status = 'expired' AND old.status <> 'expired'
+BEGIN
+	INSERT INTO "payment_events" (event_type, request_id, account_number, amount, currency, created_at)
+	VALUES ('expired', new.request_id, new.requester_account_number, new.request_amount, new.currency, (julianday('now') - 2440587.5) * 86400.0);
+END;
+
+CREATE TRIGGER IF NOT EXISTS "payment_executed" AFTER INSERT ON "payments"
+BEGIN
+	INSERT INTO "payment_events" (event_type, request_id, payment_id, account_number, amount, currency, created_at)
+	VALUES ('executed', new.payment_request_id, new.payment_id, new.payer_account_number, new.payment_amount, new.currency, (julianday('now') - 2440587.5) * 86400.0);
+END;
@@ -0,0 +1,46 @@
+-- Amounts used to be stored in whole units of their currency; since the move
+-- to integer minor units (money.py) they are cents, whole yen, ... A database
+-- created before that still has payments.payment_amount declared REAL, and
+-- only there are the existing amounts multiplied by 10**exponent of their
+-- currency. The CASE mirrors money.CURRENCY_EXPONENTS.
+UPDATE "payment_requests"
+SET request_amount = CAST(round(request_amount * CASE
+	WHEN currency IN ('BIF', 'CLP', 'DJF', 'GNF', 'ISK', 'JPY', 'KMF', 'KRW', 'PYG', 'RWF', 'UGX', 'UYI', 'VND', 'VUV', 'XAF', 'XOF', 'XPF') THEN 1
+	WHEN currency IN ('BHD', 'IQD', 'JOD', 'KWD', 'LYD', 'OMR', 'TND') THEN 1000
+	ELSE 100 END) AS INTEGER)
+WHERE (SELECT type FROM pragma_table_info('payments') WHERE name = 'payment_amount') = 'REAL';
+
+-- SQLite cannot change a column type: rebuild payments so payment_amount gets
+-- INTEGER affinity, converting on the way. On newer databases this is a copy.
+CREATE TABLE "payments_minor_units" (
+	"payment_id"	INTEGER,
+	"payment_amount"	INTEGER NOT NULL,
+	"payment_time"	REAL NOT NULL,
+	"payment_request_id"	INTEGER UNIQUE,
+	"payer_account_number"	TEXT NOT NULL,
+	"currency"	TEXT NOT NULL,
+	PRIMARY KEY("payment_id" AUTOINCREMENT),
+	FOREIGN KEY("currency") REFERENCES "currency"("currency_name"),
+	FOREIGN KEY("payer_account_number") REFERENCES "persons"("account_number"),
+	FOREIGN KEY("payment_request_id") REFERENCES "payment_requests"("request_id")
+);
+INSERT INTO "payments_minor_units" (payment_id, payment_amount, payment_time, payment_request_id, payer_account_number, currency)
+SELECT payment_id,
+	CASE WHEN (SELECT type FROM pragma_table_info('payments') WHERE name = 'payment_amount') = 'REAL'
+	THEN CAST(round(payment_amount * CASE
+		WHEN currency IN ('BIF', 'CLP', 'DJF', 'GNF', 'ISK', 'JPY', 'KMF', 'KRW', 'PYG', 'RWF', 'UGX', 'UYI', 'VND', 'VUV', 'XAF', 'XOF', 'XPF') THEN 1
+		WHEN currency IN ('BHD', 'IQD', 'JOD', 'KWD', 'LYD', 'OMR', 'TND') THEN 1000
+		ELSE 100 END) AS INTEGER)
+	ELSE payment_amount END,
+	payment_time, payment_request_id, payer_account_number, currency
+FROM "payments";
+DROP TABLE "payments";
+ALTER TABLE "payments_minor_units" RENAME TO "payments";
+CREATE INDEX IF NOT EXISTS "idx_payments_account" ON "payments" ("payer_account_number", "payment_id");
+
+-- dropped together with the old table, as in 0002
+CREATE TRIGGER IF NOT EXISTS "payment_executed" AFTER INSERT ON "payments"
+BEGIN
+	INSERT INTO "payment_events" (event_type, request_id, payment_id, account_number, amount, currency, created_at)
+	VALUES ('executed', new.payment_request_id, new.payment_id, new.payer_account_number, new.payment_amount, new.currency, (julianday('now') - 2440587.5) * 86400.0);
+END;
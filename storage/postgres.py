@@ -0,0 +1,249 @@
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+try:
+    import psycopg
+    from psycopg_pool import ConnectionPool
+except ImportError:  # psycopg is only needed when PAYMENTS_DATABASE_URL points at PostgreSQL
+    psycopg = None
+
+import metrics
+from database import POOL_SIZE
+from storage.base import (
+    IntegrityError, PaymentRequestRow, Storage, StorageError, Transaction, keyset_query, load_migrations,
+)
+
+MIGRATIONS = load_migrations("postgres")
+MIGRATION_LOCK_ID = 7_201_501  # pg_advisory_xact_lock key that serializes migrating workers
+EVENT_POSITION_LOCK_ID = 7_201_502  # pg_try_advisory_xact_lock key of the reader handing out feed positions
+
+CREATE_SCHEMA_TABLE = '''
+CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at DOUBLE PRECISION NOT NULL)
+'''
+POOL_TIMEOUT_SECONDS = 10.0
+
+UPSERT_PERSON = '''
+INSERT INTO persons (name, account_number) VALUES (%s, %s)
+ON CONFLICT (account_number) DO UPDATE SET name = excluded.name
+'''
+
+# events of transactions below a snapshot's xmin are final (migration 0004): the
+# first position of the block reserved for them plus their rank in (tx, event_id)
+POSITION_EVENTS = '''
+UPDATE payment_events SET feed_position = %s + final.rank
+FROM (
+    SELECT event_id, row_number() OVER (ORDER BY tx, event_id) - 1 AS rank
+    FROM payment_events WHERE feed_position IS NULL AND tx < %s::xid8
+) final
+WHERE payment_events.event_id = final.event_id
+'''
+
+INSERT_REQUEST = '''
+INSERT INTO payment_requests (requester_account_number, request_amount, currency, request_time, status)
+VALUES (%s, %s, %s, %s, 'pending') RETURNING request_id
+'''
+
+
+def schema_version(conn):
+    if conn.execute("SELECT to_regclass('schema_migrations')").fetchone()[0] is None:
+        return 0
+    return conn.execute('SELECT MAX(version) FROM schema_migrations').fetchone()[0] or 0
+
+
+def migrate(tx, migrations=MIGRATIONS):
+    """Apply pending migrations in the current transaction, return the applied versions."""
+    conn = tx.conn
+    if schema_version(conn) >= migrations[-1].version:
+        return []
+    # held until commit; a worker that waited here re-reads the version below
+    conn.execute('SELECT pg_advisory_xact_lock(%s)', (MIGRATION_LOCK_ID,))
+    conn.execute(CREATE_SCHEMA_TABLE)
+    current = schema_version(conn)
+    applied = []
+    for migration in migrations:
+        if migration.version <= current:
+            continue
+        conn.execute(migration.script)
+        conn.execute('INSERT INTO schema_migrations (version, name, applied_at) VALUES (%s, %s, %s)',
+                     (migration.version, migration.name, time.time()))
+        applied.append(migration.version)
+    return applied
+
+
+class PostgresTransaction(Transaction):
+    def __init__(self, conn):
+        self.conn = conn
+
+    @contextmanager
+    def savepoint(self):
+        # psycopg opens the transaction on the first statement, so this never commits on its own
+        self.conn.execute('SAVEPOINT item')
+        try:
+            yield
+        except BaseException as e:
+            self.conn.execute('ROLLBACK TO SAVEPOINT item')
+            self.conn.execute('RELEASE SAVEPOINT item')
+            if isinstance(e, psycopg.IntegrityError):
+                raise IntegrityError(str(e)) from e
+            if isinstance(e, psycopg.Error):
+                raise StorageError(str(e)) from e
+            raise
+        self.conn.execute('RELEASE SAVEPOINT item')
+
+    def get_rates(self):
+        rows = self.conn.execute('SELECT currency_name, conversion_rate FROM currency').fetchall()
+        return {name: Decimal(rate) for name, rate in rows}
+
+    def upsert_person(self, name, account_number):
+        self.conn.execute(UPSERT_PERSON, (name, account_number))
+
+    def upsert_persons(self, rows):
+        with self.conn.cursor() as cursor:
+            cursor.executemany(UPSERT_PERSON, rows)
+
+    def create_request(self, account_number, amount, currency, request_time):
+        return self.conn.execute(INSERT_REQUEST, (account_number, amount, currency, request_time)).fetchone()[0]
+
+    def create_requests(self, rows, request_time):
+        with self.conn.cursor() as cursor:
+            cursor.executemany(INSERT_REQUEST, [
+                (account_number, amount, currency, request_time) for account_number, amount, currency in rows
+            ], returning=True)
+            request_ids = []
+            while True:
+                request_ids.append(cursor.fetchone()[0])
+                if not cursor.nextset():
+                    return request_ids
+
+    def fetch_request(self, request_id):
+        row = self.conn.execute('''
+        SELECT r.request_id, r.requester_account_number, r.request_amount, r.currency, r.request_time, r.status, p.name
+        FROM payment_requests r LEFT JOIN persons p ON p.account_number = r.requester_account_number
+        WHERE r.request_id = %s
+        ''', (request_id,)).fetchone()
+        return PaymentRequestRow(*row) if row else None
+
+    def claim_request(self, request_id, status):
+        # a concurrent UPDATE of the same row blocks here and then re-checks the WHERE clause
+        return self.conn.execute(
+            "UPDATE payment_requests SET status = %s WHERE request_id = %s AND status = 'pending'",
+            (status, request_id)).rowcount == 1
+
+    def insert_payment(self, amount, payment_time, request_id, payer_account_number, currency):
+        return self.conn.execute('''
+        INSERT INTO payments (payment_amount, payment_time, payment_request_id, payer_account_number, currency)
+        VALUES (%s, %s, %s, %s, %s) RETURNING payment_id
+        ''', (amount, payment_time, request_id, payer_account_number, currency)).fetchone()[0]
+
+    def expire_pending(self, cutoff, limit):
+        # SKIP LOCKED: rows an attempt is settling right now are left for the next sweep
+        return self.conn.execute('''
+        UPDATE payment_requests SET status = 'expired'
+        WHERE request_id IN (
+            SELECT request_id FROM payment_requests
+            WHERE status = 'pending' AND request_time < %s
+            ORDER BY request_time LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        ''', (cutoff, limit)).rowcount
+
+    def list_requests(self, after, limit, status=None, account_number=None, since=None, until=None):
+        query, params = keyset_query(
+            'SELECT request_id, requester_account_number, request_amount, currency, request_time, status FROM payment_requests',
+            'request_id', 'request_time', after, limit,
+            (('status', status), ('requester_account_number', account_number)), since, until, '%s')
+        return self.conn.execute(query, params).fetchall()
+
+    def list_payments(self, after, limit, account_number=None, since=None, until=None):
+        query, params = keyset_query(
+            'SELECT payment_id, payment_request_id, payer_account_number, payment_amount, currency, payment_time FROM payments',
+            'payment_id', 'payment_time', after, limit,
+            (('payer_account_number', account_number),), since, until, '%s')
+        return self.conn.execute(query, params).fetchall()
+
+    def list_events(self, after, limit):
+        # the position is the event's sequence number in the feed; while one reader hands
+        # out positions (held until its commit) the others read the ones already given out
+        unpositioned = self.conn.execute('SELECT EXISTS (SELECT 1 FROM payment_events WHERE feed_position IS NULL)').fetchone()[0]
+        if unpositioned and self.conn.execute('SELECT pg_try_advisory_xact_lock(%s)', (EVENT_POSITION_LOCK_ID,)).fetchone()[0]:
+            self._position_events()
+        return self.conn.execute(
+            'SELECT feed_position, event_type, request_id, payment_id, account_number, amount, currency, created_at '
+            'FROM payment_events WHERE feed_position > %s ORDER BY feed_position LIMIT %s', (after, limit)).fetchall()
+
+    def _position_events(self):
+        # one xmin for both statements, so the block reserved matches the rows it is used for
+        xmin = self.conn.execute('SELECT pg_snapshot_xmin(pg_current_snapshot())::text').fetchone()[0]
+        count = self.conn.execute(
+            'SELECT COUNT(*) FROM payment_events WHERE feed_position IS NULL AND tx < %s::xid8', (xmin,)).fetchone()[0]
+        if count:
+            last = self.conn.execute(
+                "SELECT setval('payment_event_positions', nextval('payment_event_positions') + %s - 1)", (count,)).fetchone()[0]
+            self.conn.execute(POSITION_EVENTS, (last - count + 1, xmin))
+
+    def compact_events(self, created_before, limit):
+        return self.conn.execute('''
+        DELETE FROM payment_events
+        WHERE event_id IN (
+            SELECT event_id FROM payment_events
+            WHERE created_at < %s AND feed_position IS NOT NULL
+            ORDER BY feed_position LIMIT %s
+        )
+        ''', (created_before, limit)).rowcount
+
+    def load_idempotent_response(self, key, created_after):
+        row = self.conn.execute(
+            'SELECT fingerprint, status_code, response FROM idempotency_keys WHERE idempotency_key = %s AND created_at >= %s',
+            (key, created_after)).fetchone()
+        return (row[0], row[1], bytes(row[2])) if row else None
+
+    def save_idempotent_response(self, key, fingerprint, status_code, body, created_at, expired_before):
+        # only a row past its TTL may be replaced; a live one means another attempt with this key got there first
+        saved = self.conn.execute('''
+        INSERT INTO idempotency_keys (idempotency_key, fingerprint, status_code, response, created_at)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (idempotency_key) DO UPDATE SET
+            fingerprint = excluded.fingerprint, status_code = excluded.status_code,
+            response = excluded.response, created_at = excluded.created_at
+        WHERE idempotency_keys.created_at < %s
+        ''', (key, fingerprint, status_code, body, created_at, expired_before)).rowcount
+        if saved != 1:
+            raise IntegrityError(f"idempotency key {key!r} is already in use")
+
+    def purge_idempotent_responses(self, created_before):
+        return self.conn.execute('DELETE FROM idempotency_keys WHERE created_at < %s', (created_before,)).rowcount
+
+
+class PostgresStorage(Storage):
+    """PostgreSQL behind a psycopg connection pool, for running several workers or hosts.
+
+    Payment attempts settle a request with one conditional UPDATE (see
+    claim_request): a concurrent attempt on the same row waits for it and
+    then finds the request no longer pending.
+    """
+
+    def __init__(self, url, pool_size=POOL_SIZE):
+        if psycopg is None:
+            raise StorageError("PostgreSQL storage needs the psycopg and psycopg_pool packages")
+        self.url = url
+        self.pool = ConnectionPool(url, min_size=1, max_size=pool_size, timeout=POOL_TIMEOUT_SECONDS, open=True)
+
+    def setup(self):
+        return self.run_sync(migrate)
+
+    def run_sync(self, func, *args):
+        try:
+            # leaving the block with an exception makes the pool roll back
+            with self.pool.connection() as conn:
+                result = func(PostgresTransaction(conn), *args)
+                with metrics.stage("storage", "commit"):
+                    conn.commit()
+                return result
+        except psycopg.IntegrityError as e:
+            raise IntegrityError(str(e)) from e
+        except psycopg.Error as e:  # includes psycopg_pool.PoolTimeout
+            raise StorageError(str(e)) from e
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,164 @@
+import os
+
+from database import POOL_SIZE
+from storage.base import Storage, Transaction
+from storage.sqlite import SQLiteStorage
+
+
+def shard_path(path, index):
+    """File of shard `index` next to `path`, e.g. ('payments.db', 2) -> 'payments-2.db'."""
+    root, ext = os.path.splitext(path)
+    return f"{root}-{index}{ext}"
+
+
+class ShardTransaction(Transaction):
+    """A shard's SQLiteTransaction that speaks global ids.
+
+    Shard `index` of `count` stores local AUTOINCREMENT ids; the rest of the
+    app sees `local * count + index`, so every request_id and payment_id
+    names its shard (`id % count`). Methods without ids are passed through;
+    backend attributes such as `conn` are reached through `__getattr__`.
+    """
+
+    def __init__(self, tx, index, count):
+        self.tx = tx
+        self.index = index
+        self.count = count
+
+    def __getattr__(self, name):
+        return getattr(self.tx, name)
+
+    def to_global(self, local_id):
+        return local_id * self.count + self.index
+
+    def to_local(self, global_id):
+        # an id of another shard never matches a row here instead of matching the wrong one
+        return global_id // self.count if global_id % self.count == self.index else 0
+
+    def savepoint(self):
+        return self.tx.savepoint()
+
+    def get_rates(self):
+        return self.tx.get_rates()
+
+    def upsert_person(self, name, account_number):
+        self.tx.upsert_person(name, account_number)
+
+    def upsert_persons(self, rows):
+        self.tx.upsert_persons(rows)
+
+    def expire_pending(self, cutoff, limit):
+        return self.tx.expire_pending(cutoff, limit)
+
+    def compact_events(self, created_before, limit):
+        return self.tx.compact_events(created_before, limit)
+
+    def load_idempotent_response(self, key, created_after):
+        return self.tx.load_idempotent_response(key, created_after)
+
+    def save_idempotent_response(self, key, fingerprint, status_code, body, created_at, expired_before):
+        self.tx.save_idempotent_response(key, fingerprint, status_code, body, created_at, expired_before)
+
+    def purge_idempotent_responses(self, created_before):
+        return self.tx.purge_idempotent_responses(created_before)
+
+    def create_request(self, account_number, amount, currency, request_time):
+        return self.to_global(self.tx.create_request(account_number, amount, currency, request_time))
+
+    def create_requests(self, rows, request_time):
+        return [self.to_global(request_id) for request_id in self.tx.create_requests(rows, request_time)]
+
+    def fetch_request(self, request_id):
+        row = self.tx.fetch_request(self.to_local(request_id))
+        return row._replace(request_id=request_id) if row else None
+
+    def claim_request(self, request_id, status):
+        return self.tx.claim_request(self.to_local(request_id), status)
+
+    def insert_payment(self, amount, payment_time, request_id, payer_account_number, currency):
+        if request_id % self.count != self.index:
+            raise ValueError(f"request {request_id} does not live on shard {self.index}")
+        return self.to_global(self.tx.insert_payment(amount, payment_time, self.to_local(request_id), payer_account_number, currency))
+
+    def _local_after(self, after):
+        # global id > after  <=>  local id > (after - index) / count
+        return (after - self.index) // self.count
+
+    def list_requests(self, after, limit, **filters):
+        rows = self.tx.list_requests(self._local_after(after), limit, **filters)
+        return [(self.to_global(row[0]),) + tuple(row[1:]) for row in rows]
+
+    def list_payments(self, after, limit, **filters):
+        rows = self.tx.list_payments(self._local_after(after), limit, **filters)
+        return [(self.to_global(row[0]), self.to_global(row[1])) + tuple(row[2:]) for row in rows]
+
+    def list_events(self, after, limit):
+        # event ids stay per shard (a feed is read per partition), the ids they mention are global
+        rows = self.tx.list_events(after, limit)
+        return [row[:2] + tuple(None if value is None else self.to_global(value) for value in row[2:4]) + tuple(row[4:]) for row in rows]
+
+
+class Shard(Storage):
+    """One shard of a ShardedStorage, handing out ShardTransactions."""
+
+    def __init__(self, storage, index, count):
+        self.storage = storage
+        self.index = index
+        self.count = count
+
+    def setup(self):
+        return self.storage.setup()
+
+    def run_sync(self, func, *args):
+        return self.storage.run_sync(lambda tx: func(ShardTransaction(tx, self.index, self.count), *args))
+
+    def close(self):
+        self.storage.close()
+
+
+class ShardedStorage(Storage):
+    """payment_requests and payments spread over `len(paths)` SQLite files, one per worker.
+
+    Every worker has a home shard: new requests and the currency cache use
+    it, so workers never contend for a write lock on them. The expiry sweep,
+    idempotency purges and event compaction visit every shard through
+    `partitions`, so a shard whose worker is not running (a plain
+    `uvicorn main:app` with PAYMENTS_SHARDS set, or a worker that died) still
+    gets its requests expired and its keys purged. A request_id routes to the shard that holds it (see
+    ShardTransaction); `route` returns that shard, or this storage itself for
+    the home shard.
+
+    persons is not replicated: every shard only knows the people of its own
+    requests and payments, with the name they last gave on that shard, which
+    is all the joins there need. currency is a full copy on every shard and
+    read-only for the app: its rates come from the migrations, which run on
+    every shard, so a rate change is a new migration.
+    """
+
+    def __init__(self, paths, home, pool_size=POOL_SIZE, on_connect=None):
+        if not 0 <= home < len(paths):
+            raise ValueError(f"home shard {home} out of range for {len(paths)} shards")
+        self.paths = paths
+        self.home = home
+        self.shards = [Shard(SQLiteStorage(path, pool_size, on_connect), index, len(paths)) for index, path in enumerate(paths)]
+
+    def shard_of(self, request_id):
+        return request_id % len(self.shards)
+
+    def route(self, request_id):
+        index = self.shard_of(request_id)
+        return self if index == self.home else self.shards[index]
+
+    def partitions(self):
+        return self.shards
+
+    def setup(self):
+        return sorted({version for shard in self.shards for version in shard.setup()})
+
+    def run_sync(self, func, *args):
+        return self.shards[self.home].run_sync(func, *args)
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
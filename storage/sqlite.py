@@ -0,0 +1,227 @@
+import sqlite3
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+import metrics
+from database import DATABASE_PATH, POOL_SIZE, Database
+from storage.base import (
+    IntegrityError, PaymentRequestRow, Storage, StorageError, Transaction, keyset_query, load_migrations,
+)
+
+MIGRATIONS = load_migrations("sqlite")
+
+CREATE_SCHEMA_TABLE = '''
+CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at REAL NOT NULL)
+'''
+
+UPSERT_PERSON = '''
+INSERT INTO persons (name, account_number) VALUES (?, ?)
+ON CONFLICT(account_number) DO UPDATE SET name = excluded.name
+'''
+
+INSERT_REQUEST = '''
+INSERT INTO payment_requests (requester_account_number, request_amount, currency, request_time, status)
+VALUES (?, ?, ?, ?, 'pending')
+'''
+
+
+def split_statements(script):
+    """Split an SQL script into complete statements, using SQLite's own parser to find the ends."""
+    statements, buffer = [], ""
+    for line in script.splitlines(keepends=True):
+        buffer += line
+        if sqlite3.complete_statement(buffer):
+            statements.append(buffer.strip())
+            buffer = ""
+    rest = "\n".join(line for line in buffer.splitlines() if not line.strip().startswith("--")).strip()
+    if rest:
+        raise ValueError(f"incomplete SQL statement: {rest[:80]}")
+    return statements
+
+
+def schema_version(conn):
+    try:
+        return conn.execute('SELECT MAX(version) FROM schema_migrations').fetchone()[0] or 0
+    except sqlite3.OperationalError:  # no such table: nothing applied yet
+        return 0
+
+
+def migrate(conn, migrations=MIGRATIONS):
+    """Apply pending migrations to `conn` in one IMMEDIATE transaction, return the applied versions.
+
+    Checks the version without taking a lock first, so an up-to-date database
+    costs one SELECT. The write lock is only taken when there is work, and the
+    version is read again under it in case another worker migrated meanwhile.
+    """
+    if schema_version(conn) >= migrations[-1].version:
+        return []
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute(CREATE_SCHEMA_TABLE)
+        current = schema_version(conn)
+        applied = []
+        for migration in migrations:
+            if migration.version <= current:
+                continue
+            for statement in split_statements(migration.script):
+                conn.execute(statement)
+            conn.execute('INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)',
+                         (migration.version, migration.name, time.time()))
+            applied.append(migration.version)
+        conn.commit()
+        return applied
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+class SQLiteTransaction(Transaction):
+    def __init__(self, conn):
+        self.conn = conn
+
+    @contextmanager
+    def savepoint(self):
+        if not self.conn.in_transaction:
+            # an outermost SAVEPOINT would commit on RELEASE, keep it inside the transaction
+            self.conn.execute('BEGIN IMMEDIATE')
+        self.conn.execute('SAVEPOINT item')
+        try:
+            yield
+        except BaseException as e:
+            self.conn.execute('ROLLBACK TO item')
+            self.conn.execute('RELEASE item')
+            if isinstance(e, sqlite3.IntegrityError):
+                raise IntegrityError(str(e)) from e
+            if isinstance(e, sqlite3.Error):
+                raise StorageError(str(e)) from e
+            raise
+        self.conn.execute('RELEASE item')
+
+    def get_rates(self):
+        rows = self.conn.execute('SELECT currency_name, conversion_rate FROM currency').fetchall()
+        return {name: Decimal(str(rate)) for name, rate in rows}
+
+    def upsert_person(self, name, account_number):
+        self.conn.execute(UPSERT_PERSON, (name, account_number))
+
+    def upsert_persons(self, rows):
+        self.conn.executemany(UPSERT_PERSON, rows)
+
+    def create_request(self, account_number, amount, currency, request_time):
+        return self.conn.execute(INSERT_REQUEST, (account_number, amount, currency, request_time)).lastrowid
+
+    def create_requests(self, rows, request_time):
+        self.conn.executemany(INSERT_REQUEST, [
+            (account_number, amount, currency, request_time) for account_number, amount, currency in rows])
+        # the transaction holds the write lock, so the AUTOINCREMENT ids of this batch are consecutive
+        last_id = self.conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+        return range(last_id - len(rows) + 1, last_id + 1)
+
+    def fetch_request(self, request_id):
+        row = self.conn.execute('''
+        SELECT request_id, requester_account_number, request_amount, currency, request_time, status, persons.name
+        FROM payment_requests LEFT JOIN persons ON persons.account_number = requester_account_number
+        WHERE request_id = ?
+        ''', (request_id,)).fetchone()
+        return PaymentRequestRow(*row) if row else None
+
+    def claim_request(self, request_id, status):
+        return self.conn.execute(
+            "UPDATE payment_requests SET status = ? WHERE request_id = ? AND status = 'pending'",
+            (status, request_id)).rowcount == 1
+
+    def insert_payment(self, amount, payment_time, request_id, payer_account_number, currency):
+        return self.conn.execute('''
+        INSERT INTO payments (payment_amount, payment_time, payment_request_id, payer_account_number, currency)
+        VALUES (?, ?, ?, ?, ?)
+        ''', (amount, payment_time, request_id, payer_account_number, currency)).lastrowid
+
+    def expire_pending(self, cutoff, limit):
+        return self.conn.execute('''
+        UPDATE payment_requests SET status = 'expired'
+        WHERE request_id IN (
+            SELECT request_id FROM payment_requests
+            WHERE status = 'pending' AND request_time < ?
+            ORDER BY request_time LIMIT ?
+        )
+        ''', (cutoff, limit)).rowcount
+
+    def list_requests(self, after, limit, status=None, account_number=None, since=None, until=None):
+        query, params = keyset_query(
+            'SELECT request_id, requester_account_number, request_amount, currency, request_time, status FROM payment_requests',
+            'request_id', 'request_time', after, limit,
+            (('status', status), ('requester_account_number', account_number)), since, until, '?')
+        return self.conn.execute(query, params).fetchall()
+
+    def list_payments(self, after, limit, account_number=None, since=None, until=None):
+        query, params = keyset_query(
+            'SELECT payment_id, payment_request_id, payer_account_number, payment_amount, currency, payment_time FROM payments',
+            'payment_id', 'payment_time', after, limit,
+            (('payer_account_number', account_number),), since, until, '?')
+        return self.conn.execute(query, params).fetchall()
+
+    def list_events(self, after, limit):
+        return self.conn.execute(
+            'SELECT event_id, event_type, request_id, payment_id, account_number, amount, currency, created_at '
+            'FROM payment_events WHERE event_id > ? ORDER BY event_id LIMIT ?', (after, limit)).fetchall()
+
+    def compact_events(self, created_before, limit):
+        return self.conn.execute('''
+        DELETE FROM payment_events
+        WHERE event_id IN (
+            SELECT event_id FROM payment_events
+            WHERE created_at < ?
+            ORDER BY event_id LIMIT ?
+        )
+        ''', (created_before, limit)).rowcount
+
+    def load_idempotent_response(self, key, created_after):
+        return self.conn.execute(
+            'SELECT fingerprint, status_code, response FROM idempotency_keys WHERE idempotency_key = ? AND created_at >= ?',
+            (key, created_after)).fetchone()
+
+    def save_idempotent_response(self, key, fingerprint, status_code, body, created_at, expired_before):
+        # only a row past its TTL may be replaced; a live one means another attempt with this key got there first
+        saved = self.conn.execute('''
+        INSERT INTO idempotency_keys (idempotency_key, fingerprint, status_code, response, created_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(idempotency_key) DO UPDATE SET
+            fingerprint = excluded.fingerprint, status_code = excluded.status_code,
+            response = excluded.response, created_at = excluded.created_at
+        WHERE idempotency_keys.created_at < ?
+        ''', (key, fingerprint, status_code, body, created_at, expired_before)).rowcount
+        if saved != 1:
+            raise IntegrityError(f"idempotency key {key!r} is already in use")
+
+    def purge_idempotent_responses(self, created_before):
+        return self.conn.execute('DELETE FROM idempotency_keys WHERE created_at < ?', (created_before,)).rowcount
+
+
+class SQLiteStorage(Storage):
+    """Local SQLite file behind the pooled connections of database.py."""
+
+    def __init__(self, path=DATABASE_PATH, pool_size=POOL_SIZE, on_connect=None):
+        self.path = path
+        self.db = Database(path, pool_size, on_connect=on_connect)
+
+    def setup(self):
+        try:
+            return self.db.run_sync(migrate)
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+
+    def run_sync(self, func, *args):
+        try:
+            with self.db.pool.acquire() as conn:
+                result = func(SQLiteTransaction(conn), *args)
+                with metrics.stage("storage", "commit"):
+                    conn.commit()
+                return result
+        except sqlite3.IntegrityError as e:
+            raise IntegrityError(str(e)) from e
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,39 @@
+import sys, os
+import tempfile
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+# test_main werkt op een eigen database, niet op de payments.db naast de code;
+# database.py leest dit bij het importeren, dus vóór de imports hieronder
+os.environ.setdefault("PAYMENTS_DB_PATH", os.path.join(tempfile.mkdtemp(), "payments.db"))
+from storage.sharded import ShardedStorage, shard_path
+from storage.sqlite import SQLiteStorage
+
+
+def create(tx, amount):
+    # schrijffunctie voor storage.run: één openstaand verzoek van `amount` minor units
+    return tx.create_request("BE71 0961 2345 6769", amount, "USD", 1000.0)
+
+
+@pytest.fixture
+def storage(tmp_path):
+    # een lege SQLite-database met alle migraties; test_storage.py overschrijft dit voor beide backends
+    storage = SQLiteStorage(str(tmp_path / "payments.db"), pool_size=2)
+    storage.setup()
+    yield storage
+    storage.close()
+
+
+@pytest.fixture
+def make_sharded_storage(tmp_path):
+    # maakt gesharde storages in tmp_path; ze worden na de test allemaal gesloten
+    storages = []
+
+    def make(home=0, count=3):
+        storage = ShardedStorage([shard_path(str(tmp_path / "shard.db"), index) for index in range(count)], home, pool_size=2)
+        storages.append(storage)
+        storage.setup()
+        return storage
+
+    yield make
+    for storage in storages:
+        storage.close()
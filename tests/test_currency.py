@@ -0,0 +1,39 @@
+import sys, os
+import sqlite3
+from decimal import Decimal
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from currency import CurrencyCache
+from storage.sqlite import SQLiteTransaction
+
+
+def make_conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute('CREATE TABLE currency (conversion_rate REAL NOT NULL, currency_name TEXT PRIMARY KEY)')
+    conn.executemany('INSERT INTO currency VALUES (?, ?)', [(1.0, 'USD'), (0.85, 'EUR')])
+    return SQLiteTransaction(conn)
+
+
+def test_rates_are_decimal():
+    cache = CurrencyCache()
+    conn = make_conn()
+    cache.load(conn)
+    assert cache.rates['EUR'] == Decimal('0.85')
+    assert 'USD' in cache
+    assert 'JPY' not in cache
+
+
+def test_version_only_changes_when_rates_change():
+    cache = CurrencyCache()
+    conn = make_conn()
+    cache.load(conn)
+    assert cache.version == 1
+    cross_rates = cache.cross_rates
+    cache.load(conn)
+    assert cache.version == 1
+    # de kruiskoersen worden enkel herberekend als de koersen wijzigen
+    assert cache.cross_rates is cross_rates
+    conn.conn.execute("UPDATE currency SET conversion_rate = 0.9 WHERE currency_name = 'EUR'")
+    cache.load(conn)
+    assert cache.version == 2
+    assert cache.rates['EUR'] == Decimal('0.9')
+    assert cache.cross_rates.convert(10000, 'USD', 'EUR') == 9000
@@ -0,0 +1,57 @@
+import sys, os
+import threading
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from database import ConnectionPool, Database, PoolTimeout
+
+
+def test_pool_reuses_connections(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), size=2)
+    with pool.acquire() as first:
+        pass
+    with pool.acquire() as second:
+        pass
+    assert first is second
+    pool.close()
+
+
+def test_pool_uses_wal(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), size=1)
+    with pool.acquire() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    pool.close()
+
+
+def test_pool_is_bounded(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), size=1, timeout=0.05)
+    with pool.acquire():
+        # de enige connectie is in gebruik, een tweede aanvraag moet falen
+        with pytest.raises(PoolTimeout):
+            with pool.acquire():
+                pass
+    pool.close()
+
+
+def test_pool_rolls_back_open_transaction(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), size=1)
+    with pool.acquire() as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.commit()
+        conn.execute("INSERT INTO t VALUES (1)")
+    with pool.acquire() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+    pool.close()
+
+
+def test_database_run_uses_threadpool(tmp_path):
+    import anyio
+    db = Database(str(tmp_path / "pool.db"), pool_size=2)
+    main_thread = threading.get_ident()
+
+    def work(conn):
+        return threading.get_ident(), conn.execute("SELECT 1").fetchone()[0]
+
+    thread_id, value = anyio.run(db.run, work)
+    assert value == 1
+    assert thread_id != main_thread
+    db.close()
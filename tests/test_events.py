@@ -0,0 +1,69 @@
+import sys, os
+import asyncio
+import time
+import anyio
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from conftest import create
+from events import EventFeed
+
+
+def test_wait_returns_batch_or_nothing_after_timeout(storage):
+    feed = EventFeed(storage, poll_interval=0.05)
+    storage.run_sync(lambda tx: tx.create_requests([("BE71 0961 2345 6769", 100, "JPY")] * 3, 1000.0))
+
+    async def scenario():
+        first = await feed.wait(0, 0, 2, timeout=1)
+        rest = await feed.wait(0, first[-1][0], 2, timeout=1)
+        start = time.perf_counter()
+        empty = await feed.wait(0, rest[-1][0], 2, timeout=0.1)
+        return first, rest, empty, time.perf_counter() - start
+
+    first, rest, empty, waited = anyio.run(scenario)
+    assert [len(first), len(rest), len(empty)] == [2, 1, 0]
+    assert waited >= 0.1
+    with pytest.raises(ValueError):
+        feed.partition(1)
+
+
+def test_notify_wakes_a_long_poll(storage):
+    # zonder notify zou de long poll pas na 10 seconden opnieuw kijken
+    feed = EventFeed(storage, poll_interval=10)
+
+    async def scenario():
+        waiter = asyncio.create_task(feed.wait(0, 0, 10, timeout=20))
+        await asyncio.sleep(0.05)
+        await storage.run(create, 5)
+        feed.notify()
+        return await asyncio.wait_for(waiter, 2)
+
+    rows = anyio.run(scenario)
+    assert [row[1] for row in rows] == ["created"]
+
+
+def test_stream_sends_server_sent_events(storage):
+    feed = EventFeed(storage, batch_size=2, poll_interval=0.05)
+    for amount in (1, 2, 3, 4):
+        storage.run_sync(create, amount)
+
+    async def scenario():
+        stream = feed.stream(0, 1)
+        chunks = [await stream.__anext__(), await stream.__anext__()]
+        await stream.aclose()
+        return chunks
+
+    chunks = anyio.run(scenario)
+    # een batch van twee events, daarna de rest
+    assert chunks[0].count(b"\n\n") == 2
+    assert chunks[0].startswith(b"id: 2\nevent: created\ndata: {")
+    assert b'"amount":0.02,"currency":"USD"' in chunks[0] # in de eenheid van de munt, niet in cent
+    assert chunks[1].startswith(b"id: 4\n")
+
+
+def test_compact_trims_old_events_in_batches(storage):
+    feed = EventFeed(storage, batch_size=2, retention=3600)
+    storage.run_sync(lambda tx: tx.create_requests([("BE71 0961 2345 6769", 100, "JPY")] * 5, 1000.0))
+    storage.run_sync(lambda tx: tx.conn.execute("UPDATE payment_events SET created_at = created_at - 7200 WHERE event_id <= 4"))
+    assert anyio.run(feed.compact) == 4
+    assert [row[0] for row in storage.run_sync(lambda tx: tx.list_events(0, 10))] == [5]
+    assert feed.stats()["events_compacted"] == 4
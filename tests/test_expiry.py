@@ -0,0 +1,33 @@
+import sys, os
+import anyio
+from datetime import datetime, timezone
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from expiry import ExpirySweeper
+
+
+def add_requests(storage):
+    now = datetime.now(timezone.utc).timestamp()
+    storage.run_sync(lambda tx: tx.create_requests([('BE19 2543 7531 1863', 50, 'USD')] * 7, now - 3600))
+    storage.run_sync(lambda tx: tx.create_requests([('BE19 2543 7531 1863', 50, 'USD')] * 2, now))
+
+
+def count(conn, status):
+    return conn.execute('SELECT COUNT(*) FROM payment_requests WHERE status = ?', (status,)).fetchone()[0]
+
+
+def test_sweep_expires_overdue_requests_in_batches(storage):
+    add_requests(storage)
+    sweeper = ExpirySweeper(storage, expiry_minutes=1, batch_size=3)
+    expired = anyio.run(sweeper.sweep)
+    # 7 nieuwe + het oude verzoek uit de seed data
+    assert expired == 8
+    assert storage.db.run_sync(count, 'pending') == 2
+    assert sweeper.stats()["rows_expired"] == 8
+    assert sweeper.stats()["sweeps"] == 1
+    assert anyio.run(sweeper.sweep) == 0
+
+
+def test_sweep_uses_status_index(storage):
+    plan = storage.db.run_sync(lambda conn: conn.execute(
+        "EXPLAIN QUERY PLAN SELECT request_id FROM payment_requests WHERE status = 'pending' AND request_time < 0").fetchall())
+    assert any("idx_payment_requests_status_time" in row[-1] for row in plan)
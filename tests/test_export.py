@@ -0,0 +1,49 @@
+import sys, os
+import anyio
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from export import csv_stream, iter_pages, ndjson_stream
+from storage.sqlite import SQLiteStorage
+
+
+def make_storage(tmp_path, count):
+    storage = SQLiteStorage(str(tmp_path / "export.db"), pool_size=1)
+    storage.setup()
+    storage.run_sync(lambda tx: tx.create_requests([("BE71 0961 2345 6769", i, "USD") for i in range(count)], 1000.0))
+    return storage
+
+
+async def collect(stream):
+    return [chunk async for chunk in stream]
+
+
+def test_iter_pages_walks_all_rows_one_page_at_a_time(tmp_path):
+    storage = make_storage(tmp_path, 25)
+    pages = anyio.run(collect, iter_pages(storage, "list_requests", {"account_number": "BE71 0961 2345 6769"}, page_size=10))
+    assert [len(page) for page in pages] == [10, 10, 5]
+    ids = [row[0] for page in pages for row in page]
+    assert ids == sorted(ids)
+    storage.close()
+
+
+def test_iter_pages_starts_after_a_cursor_and_stops_at_the_limit(tmp_path):
+    storage = make_storage(tmp_path, 25)
+    filters = {"account_number": "BE71 0961 2345 6769"}
+    ids = [row[0] for page in anyio.run(collect, iter_pages(storage, "list_requests", filters, page_size=10)) for row in page]
+    pages = anyio.run(collect, iter_pages(storage, "list_requests", filters, page_size=10, after=ids[2], limit=12))
+    # 10 + 2 rijen: de laatste pagina vraagt er enkel nog 2 op
+    assert [len(page) for page in pages] == [10, 2]
+    assert [row[0] for page in pages for row in page] == ids[3:15]
+    assert anyio.run(collect, iter_pages(storage, "list_requests", filters, after=ids[-1])) == []
+    storage.close()
+
+
+def test_streams_encode_rows(tmp_path):
+    storage = make_storage(tmp_path, 3)
+    filters = {"account_number": "BE71 0961 2345 6769"}
+    columns = ("request_id", "account_number", "amount", "currency", "request_time", "status")
+    chunks = anyio.run(collect, ndjson_stream(iter_pages(storage, "list_requests", filters, page_size=2), columns))
+    assert b"".join(chunks).count(b"\n") == 3
+    chunks = anyio.run(collect, csv_stream(iter_pages(storage, "list_requests", filters, page_size=2), columns))
+    assert "".join(chunks).splitlines()[0] == ",".join(columns)
+    assert len("".join(chunks).splitlines()) == 4
+    storage.close()
@@ -0,0 +1,116 @@
+import sys, os
+import asyncio
+import time
+import anyio
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import metrics
+from conftest import create
+from group_commit import GroupCommitWriter
+from storage import StorageError
+from storage.sqlite import SQLiteStorage
+
+
+def test_concurrent_writes_share_commits(storage):
+    writer = GroupCommitWriter(storage, window=0.05, max_items=8)
+
+    async def scenario():
+        request_ids = await asyncio.gather(*(writer.submit(create, amount) for amount in range(20)))
+        await writer.stop()
+        return request_ids
+
+    request_ids = anyio.run(scenario)
+    assert len(set(request_ids)) == 20
+    # 20 schrijfacties in groepen van maximaal 8
+    assert writer.stats()["writes"] == 20
+    assert writer.stats()["groups"] == 3
+    amounts = [storage.run_sync(lambda tx: tx.fetch_request(request_id)).request_amount for request_id in request_ids]
+    assert amounts == list(range(20))
+
+
+def test_failing_write_only_fails_its_own_caller(storage):
+    writer = GroupCommitWriter(storage, window=0.05)
+    created = []
+
+    def fail(tx):
+        created.append(create(tx, 99))
+        raise ValueError("boom")
+
+    def broken(tx):
+        tx.conn.execute("INSERT INTO no_such_table VALUES (1)")
+
+    async def scenario():
+        results = await asyncio.gather(writer.submit(create, 1), writer.submit(fail), writer.submit(broken), writer.submit(create, 2), return_exceptions=True)
+        await writer.stop()
+        return results
+
+    first, failed, error, second = anyio.run(scenario)
+    assert isinstance(failed, ValueError)
+    assert isinstance(error, StorageError)
+    assert writer.stats()["groups"] == 1
+    # het teruggedraaide id wordt hergebruikt door de volgende schrijfactie
+    assert second == created[0]
+    assert storage.run_sync(lambda tx: tx.fetch_request(second)).request_amount == 2
+    assert storage.run_sync(lambda tx: tx.fetch_request(first)) is not None
+
+
+def test_stop_writes_queued_items(storage):
+    writer = GroupCommitWriter(storage, window=10)
+
+    async def scenario():
+        pending = [asyncio.ensure_future(writer.submit(create, amount)) for amount in (1, 2)]
+        await asyncio.sleep(0.01)
+        await writer.stop()
+        return await asyncio.gather(*pending)
+
+    request_ids = anyio.run(scenario)
+    assert all(storage.run_sync(lambda tx: tx.fetch_request(request_id)) for request_id in request_ids)
+
+
+def test_stop_waits_for_the_group_being_committed(storage):
+    writer = GroupCommitWriter(storage, window=0)
+    committed = []
+
+    def slow(tx):
+        time.sleep(0.2)
+        committed.append(create(tx, 1))
+
+    async def scenario():
+        pending = asyncio.ensure_future(writer.submit(slow))
+        await asyncio.sleep(0.05)  # de schrijftaak zit midden in de commit van de groep
+        await writer.stop()
+        written_before_stop_returned = list(committed)
+        await pending
+        return written_before_stop_returned
+
+    # anders sloot de lifespan de storage terwijl deze groep nog committe
+    assert len(anyio.run(scenario)) == 1
+
+
+def test_max_items_must_be_positive(storage):
+    with pytest.raises(ValueError):
+        GroupCommitWriter(storage, max_items=0)
+
+
+def test_queries_are_counted_for_the_caller_of_each_write(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "group.db"), pool_size=2, on_connect=metrics.track_queries)
+    storage.setup()
+    writer = GroupCommitWriter(storage, window=0.001)
+
+    async def request(amount):
+        counter = [0]
+        metrics._current_queries.set(counter)
+        await writer.submit(create, amount)
+        return counter[0]
+
+    async def scenario():
+        # elk verzoek in een eigen taak, zoals de handlers; het eerste start de schrijftaak
+        counts = [await asyncio.create_task(request(amount)) for amount in range(5)]
+        await writer.stop()
+        return counts
+
+    counts = anyio.run(scenario)
+    # anders telden alle schrijfacties bij de teller van het eerste verzoek
+    assert all(count >= 1 for count in counts)
+    assert len(set(counts)) == 1
+    storage.close()
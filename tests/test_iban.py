@@ -0,0 +1,32 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from iban import build_iban, checksum_valid, compact, normalize_iban
+
+
+def test_normalizes_to_print_format():
+    assert normalize_iban("BE71096123456769") == "BE71 0961 2345 6769"
+    assert normalize_iban("be71-0961-2345-6769") == "BE71 0961 2345 6769"
+    assert normalize_iban("GB82 WEST 1234 5698 7654 32") == "GB82 WEST 1234 5698 7654 32"
+    assert normalize_iban("NL91ABNA0417164300") == "NL91 ABNA 0417 1643 00"
+
+
+def test_rejects_wrong_checksum():
+    assert normalize_iban("BE72 0961 2345 6769") is None
+    assert not checksum_valid(compact("GB82 WEST 1234 5698 7654 33"))
+
+
+def test_rejects_wrong_length_or_country():
+    assert normalize_iban("BE71 0961 2345 676") is None
+    assert normalize_iban("XX71 0961 2345 6769") is None
+    assert normalize_iban("") is None
+    assert normalize_iban("vdiydytk575") is None
+
+
+def test_rejects_non_ascii_characters():
+    assert normalize_iban("BE7١ 0961 2345 6769") is None
+
+
+def test_build_iban_computes_check_digits():
+    assert build_iban("BE", "096123456769") == "BE71096123456769"
+    assert build_iban("GB", "WEST12345698765432") == "GB82WEST12345698765432"
+    assert normalize_iban(build_iban("NL", "ABNA0417164300")) == "NL91 ABNA 0417 1643 00"
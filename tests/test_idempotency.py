@@ -0,0 +1,35 @@
+import sys, os
+import sqlite3
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from idempotency import IdempotencyStore, LRUCache, StoredResponse
+from storage.sqlite import SQLiteTransaction, migrate
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_size=2, ttl=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert len(cache) == 2
+
+
+def test_lru_expires_entries():
+    cache = LRUCache(max_size=2, ttl=-1)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+
+
+def test_store_roundtrip_and_purge():
+    conn = sqlite3.connect(":memory:")
+    migrate(conn)
+    tx = SQLiteTransaction(conn)
+    store = IdempotencyStore(ttl=60)
+    store.save(tx, "key", StoredResponse("abc", 200, b'{"status": "ok"}'))
+    assert store.load(tx, "key") == StoredResponse("abc", 200, b'{"status": "ok"}')
+    assert store.load(tx, "other") is None
+    assert store.purge(tx) == 0
+    store.ttl = -1
+    assert store.purge(tx) == 1
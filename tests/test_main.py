@@ -1,15 +1,23 @@
 from fastapi.testclient import TestClient
 import sys, os
-from time import sleep
+import pytest
+from concurrent.futures import ThreadPoolExecutor
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from main import app
+from parsing import loads
 
 client = TestClient(app)
 
+@pytest.fixture(scope="module", autouse=True)
+def running_app():
+    # de lifespan voert de migraties uit en laadt de wisselkoersen
+    with client:
+        yield
+
 def test_payment_request():
     json={
         "name": "Thorsten",
-        "account_number": "BE84 2543 7531 1863",
+        "account_number": "BE19 2543 7531 1863",
         "amount": 50,
         "currency": "USD"
         }
@@ -27,7 +35,7 @@ def test_payment_request():
 def test_type_checking_payment_request():
     json={
         "name": "Thorsten",
-        "account_number": "BE84 2543 7531 1863",
+        "account_number": "BE19 2543 7531 1863",
         "amount": "vijftig", # foutief, moet float zijn
         "currency": "USD"
         }
@@ -35,7 +43,7 @@ def test_type_checking_payment_request():
     assert response.status_code == 400
     response = client.post("/payment_requests", json={
         "name": 15, # foutief, moet string zijn
-        "account_number": "BE84 2543 7531 1863",
+        "account_number": "BE19 2543 7531 1863",
         "amount": 50,
         "currency": "USD"
         } )
@@ -49,7 +57,7 @@ def test_type_checking_payment_request():
     assert response.status_code == 400
     response = client.post("/payment_requests", json={
         "name": "Thorsten",
-        "account_number": "BE84 2543 7531 1863",
+        "account_number": "BE19 2543 7531 1863",
         "amount": 50,
         "currency": 123
         } )
@@ -66,7 +74,7 @@ def test_payment_attempts():
     # Eerst een betalingsverzoek maken om aan een geldige request_id te komen
     json={
         "name": "Thorsten",
-        "account_number": "BE84 2543 7531 8634",
+        "account_number": "BE47 2543 7531 8634",
         "amount": 50,
         "currency": "USD"
         }
@@ -75,12 +83,11 @@ def test_payment_attempts():
     request_id = response.json()["received"]["request_id"]
 
     # Betaling uitvoeren
-    sleep(0.1)
     response = client.post("/payment_attempts", json={
         "payment_request_id": request_id,
         "name": "Marcel",
         "payed_amount": 50,
-        "payer_account_number": "BE81 2345 6789 0011",
+        "payer_account_number": "BE69 2345 6789 0011",
         "payment_currency": "USD"
     })
     assert response.status_code == 200
@@ -88,26 +95,25 @@ def test_payment_attempts():
     assert data["status"] == "Payment attempt succeeded"
     assert data["received"]["payment_request_id"] == request_id
     assert data["received"]["payed_amount"] == 50
-    assert data["received"]["payer_account_number"] == "BE81 2345 6789 0011"
+    assert data["received"]["payer_account_number"] == "BE69 2345 6789 0011"
     assert data["received"]["payment_currency"] == "USD"
 
     # Proberen om nog een keer te betalen op hetzelfde verzoek
-    sleep(1)
     response = client.post("/payment_attempts", json={
         "payment_request_id": request_id,
         "name": "Mattias",
         "payed_amount": 50,
-        "payer_account_number": "BE84 1234 56789 9876",
+        "payer_account_number": "BE05 1234 5678 9876",
         "payment_currency": "USD"
     })
-    assert response.status_code == 400
+    assert response.status_code == 409
     data = response.json()
-    assert data["status"] == "Payment request expired"
+    assert data["status"] == "Payment request already settled"
 
 def test_unsupported_currency_payment_attempt():
     json={
         "name": "Thorsten",
-        "account_number": "BE84 2543 7531 4567",
+        "account_number": "BE52 2543 7531 4567",
         "amount": 50,
         "currency": "EUR" 
         }
@@ -116,12 +122,11 @@ def test_unsupported_currency_payment_attempt():
     request_id = response.json()["received"]["request_id"]
 
     # Betaling uitvoeren
-    sleep(0.1)
     response = client.post("/payment_attempts", json={
         "payment_request_id": request_id,
         "name": "Marcel",
         "payed_amount": 50,
-        "payer_account_number": "BE81 2345 6789 0011",
+        "payer_account_number": "BE69 2345 6789 0011",
         "payment_currency": "HHR"
     })
     assert response.status_code == 422
@@ -132,7 +137,7 @@ def test_type_checking_payment_attempt():
     # Eerst een betalingsverzoek maken om aan een geldige request_id te komen
     json={
         "name": "Thorsten",
-        "account_number": "BE84 2543 7531 1863",
+        "account_number": "BE19 2543 7531 1863",
         "amount": 50,
         "currency": "USD"
         }
@@ -144,7 +149,7 @@ def test_type_checking_payment_attempt():
         "payment_request_id": request_id,
         "name": "Marcel",
         "payed_amount": "vijftig", # string in plaats van float
-        "payer_account_number": "BE81 2345 6789 0011",
+        "payer_account_number": "BE69 2345 6789 0011",
         "payment_currency": "USD"
     })
     assert response.status_code == 400
@@ -154,7 +159,7 @@ def test_type_checking_payment_attempt():
         "payment_request_id": "een", # string in plaats van int
         "name": "Marcel",
         "payed_amount": 50,
-        "payer_account_number": "BE81 2345 6789 0011",
+        "payer_account_number": "BE69 2345 6789 0011",
         "payment_currency": "USD"
     })
     assert response.status_code == 400
@@ -164,7 +169,7 @@ def test_type_checking_payment_attempt():
         "payment_request_id": request_id,
         "name": 15, # int in plaats van string
         "payed_amount": 50,
-        "payer_account_number": "BE81 2345 6789 0011",
+        "payer_account_number": "BE69 2345 6789 0011",
         "payment_currency": "USD"
     })
     assert response.status_code == 400
@@ -184,7 +189,7 @@ def test_type_checking_payment_attempt():
         "payment_request_id": request_id,
         "name": "Marcel",
         "payed_amount": 50,
-        "payer_account_number": "BE81 2345 6789 0011",
+        "payer_account_number": "BE69 2345 6789 0011",
         "payment_currency": 123 # int in plaats van string
     })
     assert response.status_code == 400
@@ -195,7 +200,7 @@ def test_type_checking_payment_attempt():
         # payment_request_id ontbreekt, is verplicht
         "name": "Marcel",
         "payed_amount": 50,
-        "payer_account_number": "BE81 2345 6789 0011",
+        "payer_account_number": "BE69 2345 6789 0011",
         "payment_currency": "USD"
     })
     assert response.status_code == 400
@@ -206,7 +211,7 @@ def test_expired_payment_request():
     # Maak een betalingsverzoek
     json={
         "name": "Thorsten",
-        "account_number": "BE84 2543 7531 4567",
+        "account_number": "BE52 2543 7531 4567",
         "amount": 50,
         "currency": "USD"
         }
@@ -218,7 +223,7 @@ def test_expired_payment_request():
     response = client.post("/payment_attempts", json={
         "payment_request_id": 1,
         "payed_amount": 50,
-        "payer_account_number": "BE12 3456 7890 1234",
+        "payer_account_number": "BE07 3456 7890 1234",
         "payment_currency": "USD"
     })
     assert response.status_code == 400
@@ -229,7 +234,7 @@ def test_different_currency_payment():
     # Maak een betalingsverzoek in USD
     json={
         "name": "Maarten",
-        "account_number": "BE99 8877 6655 4433",
+        "account_number": "BE49 8877 6655 4433",
         "amount": 100,
         "currency": "USD"   
         }
@@ -240,7 +245,7 @@ def test_different_currency_payment():
     response = client.post("/payment_attempts", json={
         "payment_request_id": request_id,
         "payed_amount": 85,  # 1 USD = 0.85 EUR
-        "payer_account_number": "BE55 4433 2211 0011",
+        "payer_account_number": "BE43 4433 2211 0011",
         "payment_currency": "EUR"
     })
     assert response.status_code == 200
@@ -248,14 +253,28 @@ def test_different_currency_payment():
     assert data["status"] == "Payment attempt succeeded"
     assert data["received"]["payment_request_id"] == request_id
     assert data["received"]["payed_amount"] == 85
-    assert data["received"]["payer_account_number"] == "BE55 4433 2211 0011"
+    assert data["received"]["payer_account_number"] == "BE43 4433 2211 0011"
     assert data["received"]["payment_currency"] == "EUR"
 
+def test_yen_payment_has_no_cents():
+    response = client.post("/payment_requests", json={"account_number": "BE49 8877 6655 4433", "amount": "10.01", "currency": "EUR"})
+    request_id = response.json()["received"]["request_id"]
+    attempt = {
+        "payment_request_id": request_id,
+        "payed_amount": 1295.4,  # 10.01 EUR = 1295.41 JPY, afgerond op hele yen
+        "payer_account_number": "BE43 4433 2211 0011",
+        "payment_currency": "JPY"
+    }
+    response = client.post("/payment_attempts", json=attempt)
+    assert response.status_code == 200
+    assert response.json()["received"]["payed_amount"] == 1295
+    assert response.json()["received"]["request_amount"] == 10.01
+
 def test_incorrect_amount_payment():
     # maak een betalingsverzoek
     json={
         "name": "Jan",
-        "account_number": "BE11 2233 4455 6677",
+        "account_number": "BE44 2233 4455 6677",
         "amount": 200,
         "currency": "USD"   
         }
@@ -266,7 +285,7 @@ def test_incorrect_amount_payment():
     response = client.post("/payment_attempts", json={
         "payment_request_id": request_id,
         "payed_amount": 190,  # Incorrect
-        "payer_account_number": "BE66 7788 9900 1122",
+        "payer_account_number": "BE89 7788 9900 1122",
         "payment_currency": "USD"
     })
     assert response.status_code == 400
@@ -277,13 +296,42 @@ def test_payment_request_not_found():
     response = client.post("/payment_attempts", json={
         "payment_request_id": 9999,  # onbekend ID
         "payed_amount": 50,
-        "payer_account_number": "BE12 3456 7890 1234",
+        "payer_account_number": "BE07 3456 7890 1234",
         "payment_currency": "USD"
     })
     assert response.status_code == 400
     data = response.json()
     assert data["status"] == "Payment request not found"
 
+def test_ids_outside_64_bit_are_invalid_input():
+    response = client.post("/payment_attempts", json={
+        "payment_request_id": 2**70,
+        "payed_amount": 50,
+        "payer_account_number": "BE07 3456 7890 1234",
+        "payment_currency": "USD"
+    })
+    assert response.status_code == 400
+    assert response.json()["status"] == "Invalid input"
+    # ook als cursor van een listing of de wijzigingsfeed
+    assert client.get("/payment_requests", params={"after": 2**70}).status_code == 400
+    assert client.get("/payments", params={"after": -1}).status_code == 400
+    assert client.get("/events", params={"after": 2**63}).status_code == 400
+    assert client.get("/events/stream", headers={"Last-Event-ID": str(2**70)}).status_code == 400
+
+def test_amounts_too_large_to_store_are_invalid_input():
+    response = client.post("/payment_requests", json={"account_number": "BE19 2543 7531 1863", "amount": "1e20", "currency": "EUR"})
+    assert response.status_code == 400
+    assert response.json()["status"] == "Invalid input"
+    response = client.post("/payment_attempts", json={"payment_request_id": 1, "payed_amount": "1e20", "payer_account_number": "BE07 3456 7890 1234", "payment_currency": "EUR"})
+    assert response.status_code == 400
+    assert response.json()["status"] == "Invalid input"
+    # in een batch krijgt enkel dat item een fout
+    items = [{"account_number": "BE19 2543 7531 1863", "amount": amount, "currency": "EUR"} for amount in ("1e20", "10")]
+    response = client.post("/payment_requests/batch", json=items)
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == ["Invalid input", "Payment request received"]
+
 def test_invalid_iban_format():
     json={
         "name": "Dirk",
@@ -299,7 +347,7 @@ def test_invalid_iban_format():
     # Eerst een geldig betalingsverzoek aanmaken
     json={
         "name": "Thorsten",
-        "account_number": "BE84 2543 7531 8634",
+        "account_number": "BE47 2543 7531 8634",
         "amount": 50,
         "currency": "USD"
         }
@@ -308,7 +356,6 @@ def test_invalid_iban_format():
     request_id = response.json()["received"]["request_id"]
 
     # Betaling uitvoeren met ongeldig IBAN
-    sleep(0.1)
     response = client.post("/payment_attempts", json={
         "payment_request_id": request_id,
         "name": "Marcel",
@@ -318,4 +365,313 @@ def test_invalid_iban_format():
     })
     assert response.status_code == 422
     data = response.json()
-    assert data["status"] == "Invalid IBAN format"    
\ No newline at end of file
+    assert data["status"] == "Invalid IBAN format"    
+
+def test_reload_currencies():
+    response = client.post("/admin/currencies/reload")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "Currency rates reloaded"
+    assert data["rates"]["EUR"] == "0.85"
+
+def test_payment_request_batch():
+    items = [
+        {"name": "Thorsten", "account_number": "BE19 2543 7531 1863", "amount": 50, "currency": "USD"},
+        {"name": "Dirk", "account_number": "vdiydytk575", "amount": 50, "currency": "USD"}, # ongeldig IBAN
+        {"name": "Jan", "account_number": "BE44 2233 4455 6677", "amount": 20, "currency": "HHR"}, # onbekende munt
+        {"name": "Jan", "account_number": "BE44 2233 4455 6677", "amount": "vijftig", "currency": "EUR"},
+        {"name": "Maarten", "account_number": "BE49 8877 6655 4433", "amount": 75, "currency": "EUR"},
+    ]
+    response = client.post("/payment_requests/batch", json=items)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["accepted"] == 2
+    assert data["rejected"] == 3
+    results = data["results"]
+    assert [result["status"] for result in results] == [
+        "Payment request received", "Invalid IBAN format", "Unsupported currency", "Invalid input", "Payment request received"]
+    assert results[4]["received"]["request_id"] == results[0]["received"]["request_id"] + 1
+    assert results[4]["received"]["currency"] == "EUR"
+
+    # het aangemaakte verzoek moet betaalbaar zijn
+    response = client.post("/payment_attempts", json={
+        "payment_request_id": results[0]["received"]["request_id"],
+        "payed_amount": 50,
+        "payer_account_number": "BE69 2345 6789 0011",
+        "payment_currency": "USD"
+    })
+    assert response.status_code == 200
+
+def test_payment_request_batch_ndjson():
+    body = '{"account_number": "BE19 2543 7531 1863", "amount": 10, "currency": "USD"}\n{niet json}\n'
+    response = client.post("/payment_requests/batch", content=body, headers={"content-type": "application/x-ndjson"})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert results[0]["status"] == "Payment request received"
+    assert results[1]["status"] == "Invalid input"
+
+def test_payment_request_batch_not_a_list():
+    response = client.post("/payment_requests/batch", json={"account_number": "BE19 2543 7531 1863"})
+    assert response.status_code == 400
+
+def test_payment_request_batch_too_many_bytes(monkeypatch):
+    import main
+    monkeypatch.setattr(main, "MAX_BATCH_BYTES", 200)
+    line = b'{"account_number": "BE19 2543 7531 1863", "amount": 10, "currency": "USD"}\n'
+    response = client.post("/payment_requests/batch", content=line * 10, headers={"content-type": "application/x-ndjson"})
+    assert response.status_code == 413
+    assert response.json() == {"status": "Batch too large", "max_batch_bytes": 200}
+    # zonder Content-Length (chunked) stopt het lezen zodra de limiet overschreden is
+    response = client.post("/payment_requests/batch", content=(line for _ in range(10)), headers={"content-type": "application/x-ndjson"})
+    assert response.status_code == 413
+    assert client.post("/payment_requests/batch", content=line * 2, headers={"content-type": "application/x-ndjson"}).status_code == 200
+
+def test_payment_attempt_returns_ids():
+    response = client.post("/payment_requests", json={
+        "name": "Lotte",
+        "account_number": "BE71 0961 2345 6769",
+        "amount": 30,
+        "currency": "USD"
+        })
+    request_id = response.json()["received"]["request_id"]
+    response = client.post("/payment_attempts", json={
+        "payment_request_id": request_id,
+        "name": "Marcel",
+        "payed_amount": 30,
+        "payer_account_number": "BE69 2345 6789 0011",
+        "payment_currency": "USD"
+    })
+    assert response.status_code == 200
+    received = response.json()["received"]
+    assert isinstance(received["payment_id"], int)
+    assert received["payer_name"] == "Marcel"
+    assert received["requester_name"] == "Lotte"
+
+def test_idempotent_payment_attempt():
+    response = client.post("/payment_requests", json={
+        "name": "Thorsten",
+        "account_number": "BE47 2543 7531 8634",
+        "amount": 40,
+        "currency": "USD"
+        })
+    request_id = response.json()["received"]["request_id"]
+    attempt = {
+        "payment_request_id": request_id,
+        "name": "Marcel",
+        "payed_amount": 40,
+        "payer_account_number": "BE69 2345 6789 0011",
+        "payment_currency": "USD"
+    }
+    key = f"test-{request_id}"
+    first = client.post("/payment_attempts", json=attempt, headers={"Idempotency-Key": key})
+    assert first.status_code == 200
+    # een retry krijgt hetzelfde antwoord terug in plaats van "Payment request already settled"
+    retry = client.post("/payment_attempts", json=attempt, headers={"Idempotency-Key": key})
+    assert retry.status_code == 200
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json() == first.json()
+    # dezelfde sleutel met een ander verzoek wordt geweigerd
+    response = client.post("/payment_attempts", json=dict(attempt, payed_amount=41), headers={"Idempotency-Key": key})
+    assert response.status_code == 422
+
+def test_iban_is_stored_in_canonical_form():
+    response = client.post("/payment_requests", json={
+        "name": "Lotte",
+        "account_number": "be71-0961-2345-6769",
+        "amount": 30,
+        "currency": "USD"
+        })
+    assert response.status_code == 200
+    assert response.json()["received"]["account_number"] == "BE71 0961 2345 6769"
+    # juiste vorm, maar foutief controlegetal
+    response = client.post("/payment_requests", json={
+        "name": "Lotte",
+        "account_number": "BE72 0961 2345 6769",
+        "amount": 30,
+        "currency": "USD"
+        })
+    assert response.status_code == 422
+    assert response.json()["status"] == "Invalid IBAN format"
+
+def test_content_type_parameters_and_form_data():
+    body = '{"name": "Thorsten", "account_number": "BE19 2543 7531 1863", "amount": 50, "currency": "USD"}'
+    response = client.post("/payment_requests", content=body, headers={"content-type": "application/json; charset=utf-8"})
+    assert response.status_code == 200
+    response = client.post("/payment_requests", data={"name": "Thorsten", "account_number": "BE19 2543 7531 1863", "amount": "12.50", "currency": "EUR"})
+    assert response.status_code == 200
+    assert response.json()["received"]["amount"] == 12.5
+    response = client.post("/payment_requests", content="account_number=x", headers={"content-type": "text/plain"})
+    assert response.status_code == 415
+    response = client.post("/payment_requests", content="{niet json", headers={"content-type": "application/json"})
+    assert response.status_code == 400
+
+def test_metrics_endpoint():
+    response = client.post("/payment_requests", json={
+        "name": "Jan",
+        "account_number": "BE44 2233 4455 6677",
+        "amount": 200,
+        "currency": "USD"
+        })
+    request_id = response.json()["received"]["request_id"]
+    client.post("/payment_attempts", json={
+        "payment_request_id": request_id,
+        "payed_amount": 190,
+        "payer_account_number": "BE89 7788 9900 1122",
+        "payment_currency": "USD"
+    })
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    body = response.text
+    assert 'payment_outcomes_total{endpoint="payment_attempts",status="Incorrect payed amount"}' in body
+    assert 'payment_stage_seconds_count{endpoint="payment_attempts",stage="conversion"}' in body
+    assert 'payment_db_queries_count{endpoint="payment_requests"}' in body
+
+def test_list_payment_requests_with_cursor():
+    account = "NL91 ABNA 0417 1643 00"
+    created = []
+    for amount in (1, 2, 3):
+        response = client.post("/payment_requests", json={"account_number": account, "amount": amount, "currency": "EUR"})
+        created.append(response.json()["received"]["request_id"])
+    after = created[0] - 1
+    response = client.get("/payment_requests", params={"account_number": "NL91ABNA0417164300", "after": after, "limit": 2})
+    assert response.status_code == 200
+    data = response.json()
+    assert [item["request_id"] for item in data["items"]] == created[:2]
+    assert data["items"][0]["amount"] == 1
+    # volgende pagina via de cursor
+    response = client.get("/payment_requests", params={"account_number": account, "after": data["next_cursor"], "limit": 2})
+    data = response.json()
+    assert [item["request_id"] for item in data["items"]] == created[2:]
+    assert data["next_cursor"] is None
+
+    response = client.get("/payment_requests", params={"status": "betaald"})
+    assert response.status_code == 400
+    response = client.get("/payment_requests", params={"limit": 0})
+    assert response.status_code == 400
+
+def test_export_payment_requests_and_payments():
+    account = "GB82 WEST 1234 5698 7654 32"
+    response = client.post("/payment_requests", json={"account_number": account, "amount": 7, "currency": "USD"})
+    request_id = response.json()["received"]["request_id"]
+    response = client.post("/payment_attempts", json={
+        "payment_request_id": request_id,
+        "payed_amount": 7,
+        "payer_account_number": account,
+        "payment_currency": "USD"
+    })
+    assert response.status_code == 200
+
+    response = client.get("/payment_requests/export", params={"account_number": account, "status": "executed"})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [loads(line) for line in response.text.splitlines()]
+    assert request_id in [line["request_id"] for line in lines]
+    assert all(line["status"] == "executed" for line in lines)
+
+    response = client.get("/payments/export", params={"account_number": account, "format": "csv"})
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = response.text.splitlines()
+    assert rows[0] == "payment_id,payment_request_id,payer_account_number,amount,currency,payment_time"
+    assert any(row.split(",")[1] == str(request_id) for row in rows[1:])
+
+    response = client.get("/payments", params={"account_number": account})
+    assert request_id in [item["payment_request_id"] for item in response.json()["items"]]
+
+def test_export_honours_after_and_limit():
+    account = "NL91 ABNA 0417 1643 00"
+    ids = [client.post("/payment_requests", json={"account_number": account, "amount": amount, "currency": "USD"}).json()["received"]["request_id"] for amount in (1, 2, 3)]
+    response = client.get("/payment_requests/export", params={"account_number": account, "after": ids[0], "limit": 1})
+    assert [loads(line)["request_id"] for line in response.text.splitlines()] == [ids[1]]
+    # zonder limit komen alle rijen na `after` mee
+    response = client.get("/payment_requests/export", params={"account_number": account, "after": ids[0]})
+    assert [loads(line)["request_id"] for line in response.text.splitlines()] == ids[1:]
+
+def test_concurrent_attempts_settle_once():
+    response = client.post("/payment_requests", json={"account_number": "BE19 2543 7531 1863", "amount": 20, "currency": "USD"})
+    request_id = response.json()["received"]["request_id"]
+    attempt = {"payment_request_id": request_id, "payed_amount": 20, "payer_account_number": "BE69 2345 6789 0011", "payment_currency": "USD"}
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        responses = list(pool.map(lambda _: client.post("/payment_attempts", json=attempt), range(16)))
+    statuses = sorted(response.status_code for response in responses)
+    # precies één betaling slaagt, de rest krijgt een conflict
+    assert statuses.count(200) == 1
+    assert set(statuses) == {200, 409}
+    export = client.get("/payments/export", params={"account_number": "BE69 2345 6789 0011"})
+    assert [loads(line)["payment_request_id"] for line in export.text.splitlines()].count(request_id) == 1
+
+def test_concurrent_retries_with_same_key_replay_the_payment():
+    import main
+    response = client.post("/payment_requests", json={"account_number": "BE19 2543 7531 1863", "amount": 21, "currency": "USD"})
+    request_id = response.json()["received"]["request_id"]
+    attempt = {"payment_request_id": request_id, "payed_amount": 21, "payer_account_number": "BE69 2345 6789 0011", "payment_currency": "USD"}
+    key = f"concurrent-{request_id}"
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        responses = list(pool.map(lambda _: client.post("/payment_attempts", json=attempt, headers={"Idempotency-Key": key}), range(4)))
+    # elke retry krijgt het antwoord van de betaling die doorging
+    assert [response.status_code for response in responses] == [200] * 4
+    assert len({response.json()["received"]["payment_id"] for response in responses}) == 1
+    # ook zonder de cache blijft de eerste opgeslagen respons staan
+    main.idempotency.cache = type(main.idempotency.cache)()
+    retry = client.post("/payment_attempts", json=attempt, headers={"Idempotency-Key": key})
+    assert retry.status_code == 200
+    assert retry.headers["Idempotent-Replayed"] == "true"
+
+def test_rate_limited_before_any_db_work(monkeypatch):
+    import main
+    from ratelimit import Backpressure, TokenBucketLimiter
+    # één betaling per IBAN, daarna enkel nog na 1000 seconden
+    monkeypatch.setattr(main, "account_limiter", TokenBucketLimiter(rate=0.001, burst=1))
+    json = {"account_number": "BE71 0961 2345 6769", "amount": 5, "currency": "EUR"}
+    assert client.post("/payment_requests", json=json).status_code == 200
+    before = client.get("/payment_requests", params={"account_number": "BE71 0961 2345 6769"}).json()["items"]
+    response = client.post("/payment_requests", json=json)
+    assert response.status_code == 429
+    assert response.json()["status"] == "Too many requests"
+    assert int(response.headers["retry-after"]) >= 999
+    after = client.get("/payment_requests", params={"account_number": "BE71 0961 2345 6769"}).json()["items"]
+    assert after == before
+    # een ander IBAN heeft een eigen emmer
+    json["account_number"] = "BE44 2233 4455 6677"
+    assert client.post("/payment_requests", json=json).status_code == 200
+
+    monkeypatch.setattr(main, "backpressure", Backpressure(max_in_flight=0))
+    response = client.post("/payment_attempts", json={"payment_request_id": 1, "payed_amount": 1, "payer_account_number": "BE89 7788 9900 1122", "payment_currency": "USD"})
+    assert response.status_code == 503
+    assert response.json()["status"] == "Server busy"
+    assert client.get("/admin/limits").json()["limits"]["rejected"] == 1
+
+def test_batch_items_are_rate_limited_one_by_one(monkeypatch):
+    import main
+    from ratelimit import TokenBucketLimiter
+    # drie tokens per client, twee per IBAN, zonder bijvullen van betekenis
+    monkeypatch.setattr(main, "client_limiter", TokenBucketLimiter(rate=0.001, burst=3))
+    monkeypatch.setattr(main, "account_limiter", TokenBucketLimiter(rate=0.001, burst=2))
+    item = {"account_number": "BE71 0961 2345 6769", "amount": 5, "currency": "EUR"}
+    other = {"account_number": "BE44 2233 4455 6677", "amount": 5, "currency": "EUR"}
+    response = client.post("/payment_requests/batch", json=[item, item, item, other])
+    assert response.status_code == 200
+    data = response.json()
+    # het derde verzoek voor hetzelfde IBAN en het vierde van de client gaan niet door
+    assert [result["status"] for result in data["results"]] == [
+        "Payment request received", "Payment request received", "Too many requests", "Too many requests"]
+    assert data["accepted"] == 2
+    assert data["results"][3]["retry_after"] >= 999
+    # de emmer van de client is leeg: ook een nieuwe batch wordt geweigerd
+    assert client.post("/payment_requests/batch", json=[other]).status_code == 429
+
+def test_event_feed_reports_state_transitions():
+    after = client.get("/events", params={"after": 0, "limit": 1000}).json()
+    while len(after["events"]) == 1000:
+        after = client.get("/events", params={"after": after["next_cursor"], "limit": 1000}).json()
+    cursor = after["next_cursor"]
+    response = client.post("/payment_requests", json={"account_number": "BE71 0961 2345 6769", "amount": 30, "currency": "EUR"})
+    request_id = response.json()["received"]["request_id"]
+    client.post("/payment_attempts", json={"payment_request_id": request_id, "payed_amount": 30, "payer_account_number": "BE89 7788 9900 1122", "payment_currency": "EUR"})
+    response = client.get("/events", params={"after": cursor, "wait": 1})
+    assert response.status_code == 200
+    data = response.json()
+    assert [(event["event_type"], event["request_id"], event["amount"]) for event in data["events"]] == [("created", request_id, 30), ("executed", request_id, 30)]
+    assert data["next_cursor"] == data["events"][-1]["event_id"]
+    assert client.get("/events", params={"after": data["next_cursor"]}).json()["events"] == []
+    assert client.get("/events", params={"partition": 5}).status_code == 400
+    response = client.post("/admin/events/compact")
+    assert response.status_code == 200
@@ -0,0 +1,24 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from metrics import Counter, Histogram
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("latency_seconds", "Latency.", ("stage",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, "parse")
+    histogram.observe(0.5, "parse")
+    histogram.observe(5, "parse")
+    lines = list(histogram.collect())
+    assert 'latency_seconds_bucket{stage="parse",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{stage="parse",le="1.0"} 2' in lines
+    assert 'latency_seconds_bucket{stage="parse",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{stage="parse"} 3' in lines
+    assert histogram.count("parse") == 3
+
+
+def test_counter_escapes_label_values():
+    counter = Counter("outcomes_total", "Outcomes.", ("status",))
+    counter.inc('say "hi"')
+    counter.inc('say "hi"', amount=2)
+    assert counter.value('say "hi"') == 3
+    assert 'outcomes_total{status="say \\"hi\\""} 3' in list(counter.collect())
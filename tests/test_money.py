@@ -0,0 +1,60 @@
+import sys, os
+from decimal import Decimal
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from money import CrossRates, to_major, to_minor
+
+RATES = {"USD": Decimal("1"), "EUR": Decimal("0.85"), "JPY": Decimal("110"), "KWD": Decimal("0.307")}
+
+
+def test_minor_units_per_currency():
+    assert to_minor(Decimal("12.345"), "EUR") == 1235
+    assert to_minor(Decimal("12.344"), "EUR") == 1234
+    assert to_minor(Decimal("5500.5"), "JPY") == 5501
+    assert to_minor(Decimal("1.2345"), "KWD") == 1235
+    assert to_major(1235, "EUR") == 12.35
+    assert to_major(5501, "JPY") == 5501
+
+
+def test_amounts_outside_64_bit_are_rejected():
+    assert to_minor(Decimal("92233720368547758.07"), "EUR") == 2**63 - 1
+    assert to_minor(Decimal("-92233720368547758.07"), "EUR") == -(2**63 - 1)
+    for amount in ("92233720368547758.08", "1e20", "1e999999", "Infinity", "NaN"):
+        with pytest.raises(ValueError):
+            to_minor(Decimal(amount), "EUR")
+    # zonder centen past er 100 keer meer in
+    assert to_minor(Decimal("1e18"), "JPY") == 10**18
+
+
+def test_cross_rates_are_exact():
+    rates = CrossRates(RATES)
+    assert len(rates) == 4
+    # 100 USD = 85 EUR = 11000 JPY
+    assert rates.convert(10000, "USD", "EUR") == 8500
+    assert rates.convert(10000, "USD", "JPY") == 11000
+    assert rates.convert(8500, "EUR", "JPY") == 11000
+    # 1 EUR = 1/0.85 USD = 1.17647... -> 118 cent
+    assert rates.convert(100, "EUR", "USD") == 118
+    assert rates.convert(-100, "EUR", "USD") == -118
+    assert rates.convert(12345, "EUR", "EUR") == 12345
+    assert rates.table["USD", "JPY"] == (11, 10)
+
+
+def test_half_up_rounding():
+    rates = CrossRates({"USD": Decimal("1"), "XXX": Decimal("0.5")})
+    # 1 cent USD = 0.5 cent XXX -> 1 cent
+    assert rates.convert(1, "USD", "XXX") == 1
+    assert rates.convert(3, "USD", "XXX") == 2
+
+
+def test_batch_matches_single_conversions():
+    rates = CrossRates(RATES)
+    rows = [(amount, source, target) for amount in (1, 99, 12345, 10 ** 12, -1, -12345) for source in RATES for target in RATES]
+    assert rates.convert_batch(rows) == [rates.convert(*row) for row in rows]
+
+
+def test_unknown_currency():
+    rates = CrossRates(RATES)
+    assert "GBP" not in rates
+    with pytest.raises(KeyError):
+        rates.convert(100, "USD", "GBP")
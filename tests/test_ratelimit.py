@@ -0,0 +1,67 @@
+import sys, os
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from ratelimit import Backpressure, TokenBucketLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_allows_burst_then_refills():
+    clock = FakeClock()
+    limiter = TokenBucketLimiter(rate=2, burst=3, max_keys=4, clock=clock)
+    assert [limiter.allow("a") for _ in range(4)] == [True, True, True, False]
+    # een halve seconde aan 2/s geeft één nieuw token
+    assert limiter.retry_after("a") == pytest.approx(0.5)
+    clock.now += 0.5
+    assert limiter.retry_after("a") == 0
+    assert limiter.allow("a")
+    assert not limiter.allow("a")
+    # andere sleutels hebben hun eigen emmer
+    assert limiter.allow("b")
+
+
+def test_bucket_never_exceeds_burst():
+    clock = FakeClock()
+    limiter = TokenBucketLimiter(rate=10, burst=2, max_keys=4, clock=clock)
+    limiter.allow("a")
+    clock.now += 3600
+    assert [limiter.allow("a") for _ in range(3)] == [True, True, False]
+
+
+def test_idle_keys_are_evicted():
+    clock = FakeClock()
+    limiter = TokenBucketLimiter(rate=1, burst=1, max_keys=2, clock=clock)
+    assert limiter.allow("a")
+    assert limiter.allow("b")
+    assert not limiter.allow("a")  # "a" is nu het recentst gebruikt
+    assert limiter.allow("c")  # verdringt "b", de langst ongebruikte
+    assert len(limiter) == 2
+    assert set(limiter.slots) == {"a", "c"}
+    assert len(limiter.tokens) == 2
+    # een verdrongen sleutel begint opnieuw met een volle emmer
+    assert limiter.allow("b")
+
+
+def test_rate_zero_disables_limiter():
+    limiter = TokenBucketLimiter(rate=0, burst=1, max_keys=1)
+    assert all(limiter.allow("a") for _ in range(10))
+    assert len(limiter) == 0
+
+
+def test_backpressure_on_in_flight_and_queue_depth():
+    depth = [0]
+    backpressure = Backpressure(max_in_flight=2, max_queue_depth=5, queue_depth=lambda: depth[0])
+    with backpressure:
+        assert not backpressure.overloaded()
+        with backpressure:
+            assert backpressure.overloaded()
+    assert backpressure.in_flight == 0
+    depth[0] = 5
+    assert backpressure.overloaded()
+    assert backpressure.stats()["queue_depth"] == 5
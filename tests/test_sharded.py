@@ -0,0 +1,98 @@
+import sys, os
+import asyncio
+import time
+import anyio
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from conftest import create
+from expiry import ExpirySweeper
+from export import fetch_page, iter_pages
+from idempotency import IdempotencyStore
+from storage.sharded import shard_path
+
+
+def test_shard_path():
+    assert shard_path("/data/payments.db", 2) == "/data/payments-2.db"
+
+
+def test_request_ids_route_to_their_shard(make_sharded_storage):
+    storage = make_sharded_storage(home=1)
+    home_id = storage.run_sync(create, 100)
+    other_ids = [shard.run_sync(create, 200 + shard.index) for shard in storage.shards]
+    assert storage.shard_of(home_id) == 1
+    assert [storage.shard_of(request_id) for request_id in other_ids] == [0, 1, 2]
+    assert storage.route(home_id) is storage
+    for request_id in [home_id] + other_ids:
+        row = storage.route(request_id).run_sync(lambda tx: tx.fetch_request(request_id))
+        assert row.request_id == request_id
+    # een id van een andere shard vindt nooit een verkeerde rij
+    assert storage.run_sync(lambda tx: tx.fetch_request(other_ids[0])) is None
+    assert storage.run_sync(lambda tx: tx.claim_request(other_ids[2], "executed")) is False
+
+
+def test_payment_ids_are_global(make_sharded_storage):
+    storage = make_sharded_storage()
+    request_id = storage.shards[2].run_sync(create, 500)
+
+    def pay(tx):
+        assert tx.claim_request(request_id, "executed")
+        return tx.insert_payment(500, 1001.0, request_id, "BE69 2345 6789 0011", "USD")
+
+    payment_id = storage.route(request_id).run_sync(pay)
+    assert payment_id % 3 == 2
+    rows = anyio.run(fetch_page, storage, "list_payments", 0, 10, {})
+    assert [(row[0], row[1]) for row in rows] == [(payment_id, request_id)]
+    with pytest.raises(ValueError):
+        storage.run_sync(lambda tx: tx.insert_payment(500, 1001.0, request_id, "BE69 2345 6789 0011", "USD"))
+
+
+def test_events_mention_global_ids(make_sharded_storage):
+    storage = make_sharded_storage()
+    request_id = storage.shards[1].run_sync(create, 500)
+    payment_id = storage.route(request_id).run_sync(lambda tx: tx.insert_payment(500, 1001.0, request_id, "BE69 2345 6789 0011", "USD"))
+    rows = storage.shards[1].run_sync(lambda tx: tx.list_events(0, 10))
+    assert [(row[1], row[2], row[3]) for row in rows] == [("created", request_id, None), ("executed", request_id, payment_id)]
+    # de event_ids zelf tellen per shard
+    assert [row[0] for row in rows] == [1, 2]
+    assert storage.shards[0].run_sync(lambda tx: tx.list_events(0, 10)) == []
+
+
+def test_listing_merges_shards_in_id_order(make_sharded_storage):
+    storage = make_sharded_storage()
+    for shard in storage.shards:
+        shard.run_sync(lambda tx: tx.create_requests([("BE71 0961 2345 6769", 100, "USD")] * (4 + shard.index), 1000.0))
+
+    async def collect():
+        return [row[0] for page in [rows async for rows in iter_pages(storage, "list_requests", {"account_number": "BE71 0961 2345 6769"}, page_size=4)] for row in page]
+
+    ids = anyio.run(collect)
+    # 4 + 5 + 6 verzoeken, zonder dubbels en oplopend over de shards heen
+    assert len(ids) == 15
+    assert ids == sorted(set(ids))
+    assert {request_id % 3 for request_id in ids} == {0, 1, 2}
+
+
+def test_background_jobs_visit_every_shard(make_sharded_storage):
+    # alleen de worker van shard 0 draait, de andere shards moeten toch opgeruimd worden
+    storage = make_sharded_storage(home=0)
+    for shard in storage.shards:
+        shard.run_sync(lambda tx: tx.create_requests([("BE71 0961 2345 6769", 100, "USD")] * 2, 1000.0))
+        shard.run_sync(lambda tx: tx.save_idempotent_response(f"key-{shard.index}", "abc", 200, b"{}", 1000.0, 0.0))
+    sweeper = ExpirySweeper(storage, expiry_minutes=1)
+    # 2 verzoeken + het oude verzoek uit de seed data per shard
+    assert anyio.run(sweeper.sweep) == 9
+    assert [shard.run_sync(lambda tx: tx.expire_pending(time.time(), 10)) for shard in storage.shards] == [0, 0, 0]
+
+    async def purge():
+        task = asyncio.create_task(IdempotencyStore(ttl=60).purge_periodically(storage, interval=0))
+        await asyncio.sleep(0.1)
+        task.cancel()
+
+    anyio.run(purge)
+    keys = [shard.run_sync(lambda tx: tx.load_idempotent_response(f"key-{shard.index}", 0.0)) for shard in storage.shards]
+    assert keys == [None, None, None]
+
+
+def test_home_must_be_a_shard(make_sharded_storage):
+    with pytest.raises(ValueError):
+        make_sharded_storage(home=3)
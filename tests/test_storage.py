@@ -0,0 +1,373 @@
+import sys, os
+import re
+import threading
+import time
+from decimal import Decimal
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from money import CURRENCY_EXPONENTS
+from storage import IntegrityError
+from storage.base import Storage, Transaction, load_migrations
+from storage.sharded import ShardTransaction
+from storage.sqlite import SQLiteStorage
+
+POSTGRES_URL = os.environ.get("PAYMENTS_TEST_POSTGRES_URL")
+TABLES = "payments, payment_requests, persons, currency, idempotency_keys, payment_events, schema_migrations"
+
+
+@pytest.fixture(scope="module")
+def postgres_url(tmp_path_factory):
+    # een echte server via PAYMENTS_TEST_POSTGRES_URL, anders een lokale pgserver-instantie
+    if POSTGRES_URL:
+        yield POSTGRES_URL
+        return
+    pytest.importorskip("psycopg")
+    pgserver = pytest.importorskip("pgserver")
+    server = pgserver.get_server(str(tmp_path_factory.mktemp("pgdata")), cleanup_mode="stop")
+    yield server.get_uri()
+    server.cleanup()
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def storage(request, tmp_path):
+    if request.param == "sqlite":
+        backend = SQLiteStorage(str(tmp_path / "storage.db"), pool_size=2)
+    else:
+        from storage.postgres import PostgresStorage
+        backend = PostgresStorage(request.getfixturevalue("postgres_url"), pool_size=2)
+        backend.run_sync(lambda tx: tx.conn.execute(f"DROP TABLE IF EXISTS {TABLES} CASCADE"))
+    backend.setup()
+    yield backend
+    backend.close()
+
+
+def test_backend_missing_a_method_cannot_be_created():
+    class Incomplete(Transaction):
+        def get_rates(self):
+            return {}
+
+    with pytest.raises(TypeError):
+        Incomplete()
+    with pytest.raises(TypeError):
+        type("NoClose", (Storage,), {"setup": lambda self: [], "run_sync": lambda self, func, *args: None})()
+    # de shard-transactie implementeert elke methode zelf
+    ShardTransaction(None, 0, 1)
+
+
+def test_setup_records_version_and_skips_when_up_to_date(storage):
+    # de fixture heeft de migraties al uitgevoerd
+    assert storage.setup() == []
+    versions = storage.run_sync(lambda tx: tx.conn.execute("SELECT version FROM schema_migrations ORDER BY version").fetchall())
+    assert [version for version, in versions] == list(range(1, len(versions) + 1))
+
+
+def test_concurrent_setup_migrates_once(storage):
+    count = storage.run_sync(lambda tx: tx.conn.execute("SELECT COUNT(*) FROM schema_migrations").fetchone()[0])
+    storage.run_sync(lambda tx: tx.conn.execute("DELETE FROM schema_migrations"))
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(storage.setup())) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # de baseline-migratie is veilig op een bestaand schema en loopt maar één keer
+    assert sorted(len(applied) for applied in results) == [0, 0, 0, count]
+    assert storage.setup() == []
+
+
+LEGACY_SCHEMA = {
+    # amounts in whole units, zoals voor de omschakeling naar minor units
+    "sqlite": [
+        "CREATE TABLE payment_requests (request_id INTEGER PRIMARY KEY AUTOINCREMENT, requester_account_number TEXT NOT NULL, request_amount INTEGER NOT NULL, currency TEXT NOT NULL, request_time REAL NOT NULL, status TEXT NOT NULL)",
+        "CREATE TABLE payments (payment_id INTEGER PRIMARY KEY AUTOINCREMENT, payment_amount REAL NOT NULL, payment_time REAL NOT NULL, payment_request_id INTEGER UNIQUE, payer_account_number TEXT NOT NULL, currency TEXT NOT NULL)",
+    ],
+    "postgres": [
+        "CREATE TABLE payment_requests (request_id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY, requester_account_number TEXT NOT NULL, request_amount NUMERIC NOT NULL, currency TEXT NOT NULL, request_time DOUBLE PRECISION NOT NULL, status TEXT NOT NULL)",
+        "CREATE TABLE payments (payment_id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY, payment_amount NUMERIC NOT NULL, payment_time DOUBLE PRECISION NOT NULL, payment_request_id BIGINT UNIQUE, payer_account_number TEXT NOT NULL, currency TEXT NOT NULL)",
+    ],
+}
+
+
+def test_whole_unit_amounts_of_old_databases_are_converted(storage):
+    backend = "sqlite" if isinstance(storage, SQLiteStorage) else "postgres"
+
+    def legacy(tx):
+        for table in TABLES.split(", "):
+            tx.conn.execute(f"DROP TABLE IF EXISTS {table}" + (" CASCADE" if backend == "postgres" else ""))
+        for statement in LEGACY_SCHEMA[backend]:
+            tx.conn.execute(statement)
+        # het seed-verzoek 1 van toen: 100 USD
+        tx.conn.execute("INSERT INTO payment_requests VALUES (1, 'BE84 3410 1235 5486', 100, 'USD', 1756456400, 'pending')")
+        for request_id, amount, currency in ((2, 12.5, "USD"), (3, 1500, "JPY"), (4, 1.234, "KWD")):
+            tx.conn.execute(f"INSERT INTO payment_requests VALUES ({request_id}, 'BE71 0961 2345 6769', {amount}, '{currency}', 1000.0, 'executed')")
+            tx.conn.execute("INSERT INTO payments (payment_amount, payment_time, payment_request_id, payer_account_number, currency) "
+                            f"VALUES ({amount}, 1001.0, {request_id}, 'BE69 2345 6789 0011', '{currency}')")
+
+    storage.run_sync(legacy)
+    assert storage.setup()[0] == 1
+    amounts = [storage.run_sync(lambda tx: tx.fetch_request(request_id)).request_amount for request_id in (1, 2, 3, 4)]
+    assert amounts == [10000, 1250, 1500, 1234]
+    payments = storage.run_sync(lambda tx: tx.list_payments(0, 10))
+    assert [row[3] for row in payments] == [1250, 1500, 1234]
+    assert all(type(row[3]) is int for row in payments)
+
+    # een database die al minor units bewaart, wordt niet nog eens omgerekend
+    storage.run_sync(lambda tx: tx.conn.execute("DELETE FROM schema_migrations"))
+    storage.setup()
+    assert [row[3] for row in storage.run_sync(lambda tx: tx.list_payments(0, 10))] == [1250, 1500, 1234]
+    assert storage.run_sync(lambda tx: tx.fetch_request(2)).request_amount == 1250
+    # de trigger van de wijzigingsfeed bestaat nog na de herbouw van payments
+    storage.run_sync(lambda tx: tx.claim_request(1, "executed"))
+    payment_id = storage.run_sync(lambda tx: tx.insert_payment(10000, 1001.0, 1, "BE69 2345 6789 0011", "USD"))
+    assert storage.run_sync(lambda tx: tx.list_events(0, 10))[-1][1:3] == ("executed", 1)
+    # de id-teller van payments loopt verder na de herbouw
+    assert payment_id == 4
+
+
+def test_conversion_migration_matches_currency_exponents():
+    for backend in ("sqlite", "postgres"):
+        script = [migration.script for migration in load_migrations(backend) if migration.name == "amounts_in_minor_units"][0]
+        lines = [line.strip() for line in script.splitlines() if line.strip().startswith("WHEN currency IN")]
+        assert len(lines) == 4
+        for line in lines:
+            codes = set(re.findall(r"'([A-Z]{3})'", line))
+            digits = {"1": 0, "1000": 3}[line.rsplit("THEN ", 1)[1]]
+            assert codes == {code for code, exponent in CURRENCY_EXPONENTS.items() if exponent == digits}
+
+
+def test_rates(storage):
+    rates = storage.run_sync(lambda tx: tx.get_rates())
+    assert rates["EUR"] == Decimal("0.85")
+    assert rates["USD"] == Decimal("1")
+
+
+def test_create_and_fetch_request(storage):
+    def create(tx):
+        tx.upsert_person("Lotte", "BE71 0961 2345 6769")
+        tx.upsert_person("Lotte V.", "BE71 0961 2345 6769")
+        return tx.create_request("BE71 0961 2345 6769", 1250, "EUR", 1000.5)
+
+    request_id = storage.run_sync(create)
+    row = storage.run_sync(lambda tx: tx.fetch_request(request_id))
+    assert row.request_id == request_id
+    assert row.requester_account_number == "BE71 0961 2345 6769"
+    assert row.request_amount == 1250
+    assert row.status == "pending"
+    assert row.requester_name == "Lotte V."
+    assert storage.run_sync(lambda tx: tx.fetch_request(request_id + 1000)) is None
+
+
+def test_create_requests_returns_ids_in_order(storage):
+    rows = [("BE71 0961 2345 6769", amount, "USD") for amount in (1, 2, 3)]
+    request_ids = list(storage.run_sync(lambda tx: tx.create_requests(rows, 1000.0)))
+    assert len(request_ids) == 3
+    amounts = [storage.run_sync(lambda tx: tx.fetch_request(request_id)).request_amount for request_id in request_ids]
+    assert amounts == [1, 2, 3]
+
+
+def test_payment_is_unique_per_request(storage):
+    request_id = storage.run_sync(lambda tx: tx.create_request("BE71 0961 2345 6769", 5, "USD", 1000.0))
+
+    def pay(tx):
+        tx.claim_request(request_id, "executed")
+        return tx.insert_payment(5, 1001.0, request_id, "BE69 2345 6789 0011", "USD")
+
+    assert storage.run_sync(pay) is not None
+    assert storage.run_sync(lambda tx: tx.fetch_request(request_id)).status == "executed"
+    with pytest.raises(IntegrityError):
+        storage.run_sync(pay)
+
+
+def test_exception_rolls_back(storage):
+    created = []
+
+    def fail(tx):
+        created.append(tx.create_request("BE71 0961 2345 6769", 5, "USD", 1000.0))
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        storage.run_sync(fail)
+    assert storage.run_sync(lambda tx: tx.fetch_request(created[0])) is None
+
+
+def test_run_group_isolates_failing_calls(storage):
+    request_id = storage.run_sync(lambda tx: tx.create_request("BE71 0961 2345 6769", 5, "USD", 1000.0))
+
+    def create(tx, amount):
+        return tx.create_request("BE71 0961 2345 6769", amount, "USD", 1000.0)
+
+    def pay(tx):
+        return tx.insert_payment(5, 1001.0, request_id, "BE69 2345 6789 0011", "USD")
+
+    outcomes = storage.run_group_sync([(create, (1,)), (pay, ()), (pay, ()), (create, (2,))])
+    assert outcomes[1][1] is None
+    # de tweede betaling faalt, de rest van de groep wordt toch gecommit
+    assert isinstance(outcomes[2][1], IntegrityError)
+    for result, error in (outcomes[0], outcomes[3]):
+        assert error is None
+        assert storage.run_sync(lambda tx: tx.fetch_request(result)) is not None
+
+
+def test_claim_request_only_succeeds_once(storage):
+    request_id = storage.run_sync(lambda tx: tx.create_request("BE71 0961 2345 6769", 500, "USD", 1000.0))
+    barrier = threading.Barrier(8)
+    results = []
+
+    def claim(tx):
+        return tx.claim_request(request_id, "executed")
+
+    def attempt():
+        barrier.wait()
+        results.append(storage.run_sync(claim))
+
+    threads = [threading.Thread(target=attempt) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results) == [False] * 7 + [True]
+    assert storage.run_sync(lambda tx: tx.fetch_request(request_id)).status == "executed"
+    assert storage.run_sync(lambda tx: tx.claim_request(request_id, "expired")) is False
+
+
+def test_expire_pending(storage):
+    storage.run_sync(lambda tx: tx.create_requests([("BE71 0961 2345 6769", 5, "USD")] * 3, 10.0))
+    assert storage.run_sync(lambda tx: tx.expire_pending(20.0, 2)) == 2
+    assert storage.run_sync(lambda tx: tx.expire_pending(20.0, 2)) == 1
+    assert storage.run_sync(lambda tx: tx.expire_pending(20.0, 2)) == 0
+
+
+def test_state_transitions_append_events(storage):
+    after = storage.run_sync(lambda tx: tx.conn.execute("SELECT COALESCE(MAX(event_id), 0) FROM payment_events").fetchone()[0])
+    paid, expired = storage.run_sync(lambda tx: tx.create_requests([("BE71 0961 2345 6769", 500, "EUR")] * 2, 10.0))
+
+    def pay(tx):
+        assert tx.claim_request(paid, "executed")
+        return tx.insert_payment(425, 1001.0, paid, "BE69 2345 6789 0011", "USD")
+
+    payment_id = storage.run_sync(pay)
+    assert storage.run_sync(lambda tx: tx.expire_pending(20.0, 10)) == 1
+
+    def fail(tx):
+        tx.create_request("BE71 0961 2345 6769", 5, "USD", 1000.0)
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        storage.run_sync(fail)
+    rows = storage.run_sync(lambda tx: tx.list_events(after, 10))
+    # een teruggedraaide transactie laat geen event achter
+    assert [row[1:7] for row in rows] == [
+        ("created", paid, None, "BE71 0961 2345 6769", 500, "EUR"),
+        ("created", expired, None, "BE71 0961 2345 6769", 500, "EUR"),
+        ("executed", paid, payment_id, "BE69 2345 6789 0011", 425, "USD"),
+        ("expired", expired, None, "BE71 0961 2345 6769", 500, "EUR"),
+    ]
+    assert [row[0] for row in rows] == sorted(row[0] for row in rows)
+    assert abs(rows[0][7] - time.time()) < 60
+    assert storage.run_sync(lambda tx: tx.list_events(rows[1][0], 2)) == rows[2:]
+    assert storage.run_sync(lambda tx: tx.compact_events(time.time() + 60, 3)) == 3
+    assert storage.run_sync(lambda tx: tx.list_events(after, 10)) == rows[3:]
+
+
+def read_events(storage, after):
+    rows = []
+    while True:
+        batch = storage.run_sync(lambda tx: tx.list_events(after, 100))
+        if not batch:
+            return rows
+        rows += batch
+        after = batch[-1][0]
+
+
+def test_writer_does_not_wait_for_an_open_event_transaction(storage):
+    if isinstance(storage, SQLiteStorage):
+        pytest.skip("SQLite heeft maar één schrijver tegelijk")
+    after = max([0] + [row[0] for row in read_events(storage, 0)])
+    started, release = threading.Event(), threading.Event()
+
+    def slow(tx):
+        request_id = tx.create_request("BE71 0961 2345 6769", 1, "USD", 1000.0)
+        started.set()
+        assert release.wait(10)
+        return request_id
+
+    results = []
+    thread = threading.Thread(target=lambda: results.append(storage.run_sync(slow)))
+    thread.start()
+    assert started.wait(10)
+    # de tweede schrijver commit terwijl de eerste nog open staat
+    fast = storage.run_sync(lambda tx: tx.create_request("BE71 0961 2345 6769", 2, "USD", 1000.0))
+    assert not release.is_set()
+    # maar zijn event komt pas in de feed als het oudere event er ook is, nooit erna
+    assert read_events(storage, after) == []
+    release.set()
+    thread.join()
+    assert [row[2] for row in read_events(storage, after)] == [results[0], fast]
+
+
+def test_polling_an_idle_feed_writes_nothing(storage):
+    if isinstance(storage, SQLiteStorage):
+        pytest.skip("alleen PostgreSQL deelt volgnummers uit bij het lezen")
+    storage.run_sync(lambda tx: tx.create_request("BE71 0961 2345 6769", 1, "USD", 1000.0))
+
+    def poll(tx):
+        tx.list_events(0, 1000)
+        locks = tx.conn.execute("SELECT COUNT(*) FROM pg_locks WHERE locktype = 'advisory' AND pid = pg_backend_pid()").fetchone()[0]
+        return locks, tx.conn.execute("SELECT pg_current_xact_id_if_assigned()").fetchone()[0]
+
+    # de eerste poll deelt het nieuwe event een volgnummer uit, daarna is lezen alleen lezen
+    locks, xid = storage.run_sync(poll)
+    assert locks == 1 and xid is not None
+    assert storage.run_sync(poll) == (0, None)
+
+
+def test_events_of_concurrent_writers_are_read_once_in_order(storage):
+    after = max([0] + [row[0] for row in read_events(storage, 0)])
+    writers, per_writer = 8, 25
+    done = threading.Event()
+    seen = []
+
+    def write(writer):
+        for amount in range(per_writer):
+            storage.run_sync(lambda tx: tx.create_request("BE71 0961 2345 6769", writer * 1000 + amount, "USD", 1000.0))
+
+    def tail():
+        cursor = after
+        while True:
+            finished = done.is_set()
+            rows = read_events(storage, cursor)
+            seen.extend(rows)
+            cursor = rows[-1][0] if rows else cursor
+            if finished:
+                return
+            time.sleep(0.001)
+
+    reader = threading.Thread(target=tail)
+    reader.start()
+    threads = [threading.Thread(target=write, args=(writer,)) for writer in range(writers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    reader.join()
+    # een afnemer die meeleest mist niets en ziet niets twee keer
+    assert [row[0] for row in seen] == sorted({row[0] for row in seen})
+    assert sorted(row[5] for row in seen) == sorted(writer * 1000 + amount for writer in range(writers) for amount in range(per_writer))
+    assert writers * per_writer / elapsed > 50  # verzoeken per seconde, ruim onder wat beide backends halen
+
+
+def test_idempotent_responses(storage):
+    storage.run_sync(lambda tx: tx.save_idempotent_response("key", "abc", 200, b'{"a": 1}', 100.0, 40.0))
+    assert storage.run_sync(lambda tx: tx.load_idempotent_response("key", 50.0)) == ("abc", 200, b'{"a": 1}')
+    # een levend antwoord wordt nooit overschreven, een verlopen wel
+    with pytest.raises(IntegrityError):
+        storage.run_sync(lambda tx: tx.save_idempotent_response("key", "abc", 400, b'{"a": 2}', 110.0, 50.0))
+    assert storage.run_sync(lambda tx: tx.load_idempotent_response("key", 50.0)) == ("abc", 200, b'{"a": 1}')
+    storage.run_sync(lambda tx: tx.save_idempotent_response("key", "abc", 201, b'{"a": 3}', 120.0, 110.0))
+    assert storage.run_sync(lambda tx: tx.load_idempotent_response("key", 50.0)) == ("abc", 201, b'{"a": 3}')
+    assert storage.run_sync(lambda tx: tx.load_idempotent_response("key", 150.0)) is None
+    assert storage.run_sync(lambda tx: tx.purge_idempotent_responses(150.0)) == 1
+